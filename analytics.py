@@ -1,10 +1,36 @@
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+from utils import day_start_epoch
 
-def generate_task_counts(tasks_df):
-    """Generate basic task count metrics."""
+def generate_task_counts(tasks_df, counts=None):
+    """Generate basic task count metrics.
+    
+    counts, as returned by database.get_counts(), is used as is instead of
+    counting the rows of tasks_df.
+    """
+    if counts is not None:
+        by_status = counts['by_status']
+        by_priority = counts['by_priority']
+        return {
+            'total': counts['total'],
+            'by_status': {
+                'to_do': by_status.get('To Do', 0),
+                'in_progress': by_status.get('In Progress', 0),
+                'done': by_status.get('Done', 0),
+                'blocked': by_status.get('Blocked', 0)
+            },
+            'by_priority': {
+                'critical': by_priority.get('Critical', 0),
+                'high': by_priority.get('High', 0),
+                'medium': by_priority.get('Medium', 0),
+                'low': by_priority.get('Low', 0)
+            },
+            'overdue': counts['overdue'],
+            'due_soon': counts['due_soon']
+        }
+    
     total_tasks = len(tasks_df)
     to_do_count = len(tasks_df[tasks_df['status'] == 'To Do'])
     in_progress_count = len(tasks_df[tasks_df['status'] == 'In Progress'])
@@ -13,7 +39,11 @@ def generate_task_counts(tasks_df):
     
     # Calculate overdue tasks
     today = date.today()
-    overdue_count = len(tasks_df[pd.to_datetime(tasks_df['due_date']).dt.date < today])
+    if 'due_at' in tasks_df:
+        # due_at is an epoch, so these are plain integer comparisons
+        overdue_count = int((tasks_df['due_at'] < day_start_epoch(today)).sum())
+    else:
+        overdue_count = len(tasks_df[pd.to_datetime(tasks_df['due_date']).dt.date < today])
     
     # Calculate tasks by priority
     critical_count = len(tasks_df[tasks_df['priority'] == 'Critical'])
@@ -22,10 +52,14 @@ def generate_task_counts(tasks_df):
     low_count = len(tasks_df[tasks_df['priority'] == 'Low'])
     
     # Due soon tasks (next 3 days)
-    due_soon = len(tasks_df[
-        (pd.to_datetime(tasks_df['due_date']).dt.date >= today) &
-        (pd.to_datetime(tasks_df['due_date']).dt.date <= today + pd.Timedelta(days=3))
-    ])
+    if 'due_at' in tasks_df:
+        due_soon = int(tasks_df['due_at'].between(day_start_epoch(today),
+                                                  day_start_epoch(today + timedelta(days=4)) - 1).sum())
+    else:
+        due_soon = len(tasks_df[
+            (pd.to_datetime(tasks_df['due_date']).dt.date >= today) &
+            (pd.to_datetime(tasks_df['due_date']).dt.date <= today + pd.Timedelta(days=3))
+        ])
     
     return {
         'total': total_tasks,
@@ -115,14 +149,120 @@ def create_priority_chart(tasks_df):
     
     return fig
 
-def generate_analytics(tasks_df):
+def create_label_chart(label_counts, top_n=10):
+    """Create a bar chart of the most used labels from pre-aggregated counts."""
+    top_labels = label_counts.head(top_n)
+    
+    fig = px.bar(
+        top_labels,
+        x='count',
+        y='label',
+        orientation='h',
+        title="Top Labels"
+    )
+    
+    fig.update_traces(marker_color='#3b82f6')
+    fig.update_layout(
+        height=300,
+        margin=dict(l=0, r=0, t=40, b=0),
+        yaxis=dict(autorange='reversed', title=None),
+        xaxis=dict(title='Tasks')
+    )
+    
+    return fig
+
+def create_cumulative_flow_chart(history_df):
+    """Create a stacked area chart of task counts per status over time from daily snapshots."""
+    # Done at the bottom so finished work accumulates under the open bands
+    status_order = ['Done', 'In Progress', 'Blocked', 'To Do']
+    colors = {
+        'To Do': '#3b82f6',
+        'In Progress': '#f59e0b',
+        'Done': '#10b981',
+        'Blocked': '#ef4444'
+    }
+    
+    fig = px.area(
+        history_df,
+        x='snapshot_date',
+        y='count',
+        color='status',
+        category_orders={'status': status_order},
+        color_discrete_map=colors,
+        title="Cumulative Flow"
+    )
+    
+    fig.update_layout(
+        height=300,
+        margin=dict(l=0, r=0, t=40, b=0),
+        xaxis=dict(title=None),
+        yaxis=dict(title='Tasks'),
+        legend_title_text=None
+    )
+    
+    return fig
+
+def create_burndown_chart(history_df):
+    """Create a line chart of open (not Done) tasks per day against a straight burn to zero."""
+    open_tasks = (history_df[history_df['status'] != 'Done']
+                  .groupby('snapshot_date', as_index=False)['count'].sum())
+    # Every day has a point, even when all its tasks were Done
+    days = pd.DataFrame({'snapshot_date': sorted(history_df['snapshot_date'].unique())})
+    open_tasks = days.merge(open_tasks, on='snapshot_date', how='left').fillna({'count': 0})
+    
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=open_tasks['snapshot_date'],
+        y=open_tasks['count'],
+        mode='lines+markers',
+        name='Open tasks',
+        line=dict(color='#3b82f6')
+    ))
+    
+    if len(open_tasks) > 1:
+        fig.add_trace(go.Scatter(
+            x=[open_tasks['snapshot_date'].iloc[0], open_tasks['snapshot_date'].iloc[-1]],
+            y=[open_tasks['count'].iloc[0], 0],
+            mode='lines',
+            name='Ideal',
+            line=dict(color='#6b7280', dash='dash')
+        ))
+    
+    fig.update_layout(
+        title="Burndown",
+        height=300,
+        margin=dict(l=0, r=0, t=40, b=0),
+        xaxis=dict(title=None),
+        yaxis=dict(title='Open tasks', rangemode='tozero')
+    )
+    
+    return fig
+
+def create_flow_metrics_table(metrics):
+    """Turn get_flow_metrics() output into a table of percentiles in days."""
+    rows = {
+        'Lead time': metrics['lead_time'],
+        'Cycle time': metrics['cycle_time'],
+        'Time blocked': metrics['blocked_time']
+    }
+    table = pd.DataFrame(rows).T
+    table.columns = [f"p{p}" for p in table.columns]
+    return table.round(1)
+
+def generate_analytics(tasks_df, label_counts=None, counts=None):
     """Generate all analytics for the dashboard."""
-    counts = generate_task_counts(tasks_df)
+    counts = generate_task_counts(tasks_df, counts)
     status_chart = create_status_chart(tasks_df)
     priority_chart = create_priority_chart(tasks_df)
     
+    # Label counts come straight from the task_labels index
+    label_chart = None
+    if label_counts is not None and not label_counts.empty:
+        label_chart = create_label_chart(label_counts)
+    
     return {
         'counts': counts,
         'status_chart': status_chart,
-        'priority_chart': priority_chart
+        'priority_chart': priority_chart,
+        'label_chart': label_chart
     } 
\ No newline at end of file
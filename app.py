@@ -8,16 +8,26 @@ import time
 
 # Import modules
 from database import (
-    init_db, add_task, get_tasks, get_subtasks, 
+    init_db, add_task, get_subtasks, 
     update_task, update_task_status, delete_task, 
-    get_cached_tasks
+    get_cached_tasks, TaskFilter, get_label_counts,
+    bulk_update_status, bulk_update_fields, bulk_delete,
+    get_task_tree, get_child_index, get_task_summaries,
+    get_column_page, get_task_counts, COLUMN_PAGE_SIZE,
+    current_report_repository, get_unmigrated_users,
+    get_archived_tasks, search_archive, restore_archived_task
 )
 from utils import (
     get_status_color, get_priority_color,
-    calculate_due_status, get_urgency_class,
+    calculate_due_status, get_urgency_class, day_start_epoch,
     create_calendar_view
 )
-from analytics import generate_analytics
+from analytics import (
+    generate_analytics, create_cumulative_flow_chart, create_burndown_chart, create_flow_metrics_table
+)
+from flow_metrics import refresh_flow_metrics, get_flow_metrics
+from snapshots import refresh_snapshots, get_status_history
+from storage_health import report_storage_health
 from validation import validate_task_input, sanitize_input, validate_labels
 from auth import (
     login_required, logout_user, get_all_users, 
@@ -36,12 +46,9 @@ def perform_action(action_id, action_fn, *args, **kwargs):
         # Mark action as in progress to prevent duplicate execution
         st.session_state.button_actions[action_id] = True
         
-        # Perform the action
+        # Perform the action (the write invalidates this user's cached tasks)
         action_fn(*args, **kwargs)
         
-        # Clear the cache
-        st.cache_data.clear()
-        
         # Refresh the UI
         st.rerun()
 
@@ -58,21 +65,25 @@ def remove_task(task_id):
     # Set a flag to indicate the task list needs refreshing
     st.session_state.task_added = True
 
+def run_bulk_action(action_fn, task_ids, *args, **kwargs):
+    """Apply a bulk operation to the selected tasks and refresh the board."""
+    action_fn(task_ids, *args, **kwargs)
+    
+    # Clear the selection checkboxes
+    for task_id in task_ids:
+        st.session_state.pop(f"bulk_select_{task_id}", None)
+    
+    st.rerun()
+
 # Add this function at the beginning of your app.py file, right after the imports
 def delete_task_with_refresh(task_id):
     """Delete a task and refresh the page."""
     delete_task(task_id)
-    st.cache_data.clear()
     st.rerun()
 
-# Disable caching for task data to ensure we always get fresh data
-@st.cache_data(ttl=1)  # Very short TTL to essentially disable caching
-def get_fresh_tasks():
-    """Get uncached task data to ensure we see the latest updates"""
-    # Force refresh when task_added flag is set
-    if 'task_added' in st.session_state and st.session_state.task_added:
-        st.cache_data.clear()
-    return get_tasks()
+def get_fresh_tasks(filters=None):
+    """Get the user's tasks; the cache is invalidated by every write to their data."""
+    return get_cached_tasks(filters)
 
 # Set page configuration
 st.set_page_config(
@@ -117,16 +128,32 @@ st.markdown(f"<script>{load_js('static/scripts.js')}</script>", unsafe_allow_htm
 # Initialize the database
 init_db()
 
+# With sharding on, users' and shared tasks still in tasks.db would vanish from the boards until migrated
+unmigrated_users = get_unmigrated_users()
+if unmigrated_users:
+    named_users = [username for username in unmigrated_users if username is not None]
+    held = [f"the tasks of {len(named_users)} user(s)"] if named_users else []
+    if None in unmigrated_users:
+        held.append("shared tasks without an owner")
+    st.error(f"Task sharding is on, but tasks.db still holds {' and '.join(held)}. "
+             "Stop the app and run `python sharding.py migrate` with the same TASK_SHARDING setting first "
+             "(add `--shared-owner USER` to hand shared tasks to a user).")
+    st.stop()
+
+# Log the effective storage settings and probe latency once per process
+report_storage_health()
+
+# Keep today's status snapshot current for the trend charts (throttled, non-blocking)
+refresh_snapshots()
+
 # Handle authentication first
 if not login_required():
     st.stop()  # Stop execution if not authenticated
 
 # Check if we just added a task and need to refresh the view
 if 'task_added' in st.session_state and st.session_state.task_added:
-    # Clear the flag
+    # Clear the flag; the write already invalidated this user's cached tasks
     st.session_state.task_added = False
-    # Ensure task data is fresh
-    st.cache_data.clear()
 
 # Main application
 st.markdown(f"""
@@ -218,12 +245,12 @@ with st.sidebar:
                 help="Enter a concise task title"
             )
             
-            # Add parent task selection for subtasks
-            all_tasks = get_fresh_tasks()
-            if not all_tasks.empty:
-                parent_tasks = all_tasks[all_tasks['parent_id'].isna() & (all_tasks['id'] != st.session_state.get('editing_task', -1))][['id', 'title']]
+            # Add parent task selection for subtasks (top-level tasks only)
+            parent_id = None
+            root_tasks = get_task_tree(max_depth=0)
+            if not root_tasks.empty:
+                parent_tasks = root_tasks[root_tasks['id'] != st.session_state.get('editing_task', -1)][['id', 'title']]
                 
-                parent_id = None
                 if len(parent_tasks) > 0:
                     parent_options = ["None"] + parent_tasks['title'].tolist()
                     current_parent = "None"
@@ -274,11 +301,8 @@ with st.sidebar:
             date_col, time_col = st.columns(2)
             with date_col:
                 default_date = None
-                if current_task is not None and current_task['due_date']:
-                    try:
-                        default_date = datetime.strptime(current_task['due_date'], '%Y-%m-%d').date()
-                    except:
-                        default_date = datetime.now().date() + timedelta(days=1)
+                if current_task is not None and pd.notna(current_task.get('due_at')):
+                    default_date = date.fromtimestamp(int(current_task['due_at']))
                 else:
                     default_date = datetime.now().date() + timedelta(days=1)
                 
@@ -289,13 +313,13 @@ with st.sidebar:
                 )
             
             with time_col:
-                default_time = "09:00"
-                if current_task is not None and current_task.get('due_time'):
-                    default_time = current_task['due_time']
+                default_time = datetime.strptime("09:00", '%H:%M').time()
+                if current_task is not None and current_task.get('due_time') and pd.notna(current_task.get('due_at')):
+                    default_time = datetime.fromtimestamp(int(current_task['due_at'])).time()
                 
                 new_due_time = st.time_input(
                     "Due Time", 
-                    value=datetime.strptime(default_time, '%H:%M').time(),
+                    value=default_time,
                     help="Optional time deadline"
                 )
             
@@ -362,9 +386,6 @@ with st.sidebar:
                             )
                             st.success("✅ Task updated successfully!")
                             
-                            # Force a clear refresh of the data
-                            st.cache_data.clear()
-                            
                             # Clear the editing state and rerun the app
                             st.session_state.editing_task = None
                             st.rerun()
@@ -379,10 +400,9 @@ with st.sidebar:
                             new_priority,
                             due_date_str,
                             due_time_str,
-                            new_labels
+                            new_labels,
+                            parent_id=int(parent_id) if parent_id is not None else None
                         )
-                        # Force a clear refresh of the data cache
-                        st.cache_data.clear()
                         # Add a session state flag to indicate a new task was added
                         st.session_state.task_added = True
                         st.success("✅ Task added successfully!")
@@ -471,6 +491,7 @@ if not ('show_profile' in st.session_state and st.session_state.show_profile):
     start_date = date.today()
     end_date = date.today() + timedelta(days=7)
     no_due_date = False
+    filter_labels = []
 
     # Apply quick filters
     if filter_type == "Overdue":
@@ -522,61 +543,28 @@ if not ('show_profile' in st.session_state and st.session_state.show_profile):
                 
                 if start_date > end_date:
                     st.error("Start date must be before end date")
+            
+            label_options = get_label_counts()['label'].tolist()
+            if label_options:
+                filter_labels = st.multiselect("Labels", label_options, default=[])
 
-    # Get all tasks without filters first, to check if there are any
-    all_tasks = get_fresh_tasks()
-    original_task_count = len(all_tasks)
-
-    # Apply search filter separately
-    filtered_tasks_df = get_fresh_tasks().copy()
-    if search_query:
-        search_lower = search_query.lower()
-        filtered_tasks_df = filtered_tasks_df[
-            filtered_tasks_df['title'].str.lower().str.contains(search_lower, na=False) |
-            filtered_tasks_df['description'].str.lower().str.contains(search_lower, na=False) |
-            filtered_tasks_df['labels'].str.lower().str.contains(search_lower, na=False)
-        ]
+    # Load only the matching tasks; search, status, priority and date filters run in SQL
+    valid_date_range = use_date_range and start_date <= end_date
+    task_filter = TaskFilter(
+        search=search_query,
+        statuses=tuple(filter_status),
+        priorities=tuple(filter_priority),
+        due=filter_due,
+        start_date=start_date if valid_date_range else None,
+        end_date=end_date if valid_date_range else None,
+        no_due_date=no_due_date,
+        labels=tuple(filter_labels)
+    )
 
-    # Apply status and priority filters
-    if filter_status:
-        filtered_tasks_df = filtered_tasks_df[filtered_tasks_df['status'].isin(filter_status)]
-    if filter_priority:
-        filtered_tasks_df = filtered_tasks_df[filtered_tasks_df['priority'].isin(filter_priority)]
-
-    # Apply date filters
-    if no_due_date:
-        filtered_tasks_df = filtered_tasks_df[pd.isna(filtered_tasks_df['due_date'])]
-    elif use_date_range and start_date <= end_date:
-        filtered_tasks_df = filtered_tasks_df[
-            (pd.to_datetime(filtered_tasks_df['due_date']).dt.date >= start_date) &
-            (pd.to_datetime(filtered_tasks_df['due_date']).dt.date <= end_date)
-        ]
-    elif filter_due != "All":
-        today = date.today()
-        if filter_due == "Overdue":
-            filtered_tasks_df = filtered_tasks_df[pd.to_datetime(filtered_tasks_df['due_date']).dt.date < today]
-        elif filter_due == "Due Today":
-            filtered_tasks_df = filtered_tasks_df[pd.to_datetime(filtered_tasks_df['due_date']).dt.date == today]
-        elif filter_due == "Due This Week":
-            end_of_week = today + timedelta(days=(6-today.weekday()))
-            filtered_tasks_df = filtered_tasks_df[
-                (pd.to_datetime(filtered_tasks_df['due_date']).dt.date >= today) &
-                (pd.to_datetime(filtered_tasks_df['due_date']).dt.date <= end_of_week)
-            ]
-        elif filter_due == "Due This Month":
-            next_month = today.replace(day=1) + timedelta(days=32)
-            end_of_month = next_month.replace(day=1) - timedelta(days=1)
-            filtered_tasks_df = filtered_tasks_df[
-                (pd.to_datetime(filtered_tasks_df['due_date']).dt.date >= today) &
-                (pd.to_datetime(filtered_tasks_df['due_date']).dt.date <= end_of_month)
-            ]
-
-    # Update tasks_df to use the filtered version
-    tasks_df = filtered_tasks_df
-
-    # Add a compact filter summary and task counts
-    tasks_count = len(tasks_df)
-    overdue_count = len(tasks_df[pd.to_datetime(tasks_df['due_date']).dt.date < date.today()])
+    # Add a compact filter summary and task counts (counted in SQL, no rows loaded)
+    task_counts = get_task_counts(task_filter)
+    tasks_count = task_counts['total']
+    overdue_count = task_counts['overdue']
 
     # Show a compact summary as regular text
     summary_col1, summary_col2 = st.columns([3, 1])
@@ -591,8 +579,62 @@ if not ('show_profile' in st.session_state and st.session_state.show_profile):
     with summary_col2:
         st.caption(f"Total: {tasks_count} • Overdue: {overdue_count}")
 
+    # Archived tasks are only searched when asked for
+    if search_query:
+        with st.expander("Search archived tasks"):
+            archived_matches = search_archive(search_query)
+            if archived_matches.empty:
+                st.caption("No archived tasks match this search.")
+            for _, archived_task in archived_matches.iterrows():
+                archive_col1, archive_col2 = st.columns([5, 1])
+                with archive_col1:
+                    st.markdown(f"**{archived_task['title']}** · {archived_task['status']} · "
+                                f"archived {archived_task['archived_date'][:10]}")
+                with archive_col2:
+                    if st.button("Restore", key=f"restore_{archived_task['id']}"):
+                        restore_archived_task(int(archived_task['id']))
+                        st.rerun()
+
+    # Multi-select mode: tick cards, then move, re-prioritize or delete them in one transaction
+    multi_select = False
+    if view_type == "Kanban":
+        multi_select = st.toggle("Select multiple tasks", key="multi_select_mode")
+    
+    if multi_select:
+        selected_ids = [
+            int(key[len("bulk_select_"):]) for key, value in st.session_state.items()
+            if key.startswith("bulk_select_") and value
+        ]
+        
+        bulk_cols = st.columns([2, 3, 3, 2])
+        with bulk_cols[0]:
+            st.caption(f"{len(selected_ids)} selected")
+        
+        with bulk_cols[1]:
+            bulk_status = st.selectbox("Move to", ["To Do", "In Progress", "Done", "Blocked"], key="bulk_status")
+            if st.button("Move selected", key="bulk_move_btn", use_container_width=True, disabled=not selected_ids):
+                run_bulk_action(bulk_update_status, selected_ids, bulk_status)
+        
+        with bulk_cols[2]:
+            bulk_priority = st.selectbox("Set priority", ["Critical", "High", "Medium", "Low"], key="bulk_priority")
+            if st.button("Update priority", key="bulk_priority_btn", use_container_width=True, disabled=not selected_ids):
+                run_bulk_action(bulk_update_fields, selected_ids, priority=bulk_priority)
+        
+        with bulk_cols[3]:
+            st.markdown("<div style='height: 1.75rem;'></div>", unsafe_allow_html=True)
+            if st.button("🗑️ Delete selected", key="bulk_delete_btn", use_container_width=True, disabled=not selected_ids):
+                run_bulk_action(bulk_delete, selected_ids)
+
     # Make sure the Kanban board is displayed immediately when view_type is Kanban
     if view_type == "Kanban":
+        # Cached parent -> children map; child titles are read per column for expanded cards only
+        child_index = get_child_index()
+        
+        # Each column loads pages of cards on demand; start over when the filters change
+        if st.session_state.get('column_pages_filter') != task_filter:
+            st.session_state.column_pages_filter = task_filter
+            st.session_state.column_pages = {}
+        
         # Create columns for each status - reordered to put Blocked first and Done at the end
         cols = st.columns(4)
         statuses = ["Blocked", "To Do", "In Progress", "Done"]
@@ -604,19 +646,33 @@ if not ('show_profile' in st.session_state and st.session_state.show_profile):
                     f"<div style='background: {get_status_color(status)}; color: white; border-radius: 6px 6px 0 0; "
                     f"padding: 0.5rem; text-align: center; font-weight: 600; margin-bottom: 0;'>"
                     f"{status} <span style='background: rgba(255,255,255,0.3); border-radius: 9999px; "
-                    f"padding: 0 0.4rem;'>{len(tasks_df[tasks_df['status'] == status])}</span></div>",
+                    f"padding: 0 0.4rem;'>{task_counts['by_status'].get(status, 0)}</span></div>",
                     unsafe_allow_html=True
                 )
                 
-                # Container for tasks in this status
-                status_tasks = tasks_df[tasks_df['status'] == status]
+                # Container for tasks in this status: only the pages loaded so far
+                page_count = st.session_state.column_pages.get(status, 1)
+                pages = []
+                after_key = None
+                for _ in range(page_count):
+                    page, after_key = get_column_page(status, after_key, COLUMN_PAGE_SIZE, task_filter)
+                    pages.append(page)
+                    if after_key is None:
+                        break
+                status_tasks = pd.concat(pages, ignore_index=True) if len(pages) > 1 else pages[0]
                 
                 if status_tasks.empty:
                     st.info("No tasks")
                 
+                # One query for the subtasks of this column's expanded cards
+                shown_children = [child_id for task_id in status_tasks.get('id', [])
+                                  if st.session_state.get(f"expand_{status}_{task_id}")
+                                  for child_id in child_index.get(int(task_id), [])]
+                child_summaries = get_task_summaries(shown_children)
+                
                 for _, task in status_tasks.iterrows():
                     # Prepare data for display
-                    due_status = calculate_due_status(task['due_date'], task['due_time'])
+                    due_status = calculate_due_status(task['due_at'], task['due_time'])
                     task_id = task['id']
                     
                     # Create unique keys for this task
@@ -643,7 +699,10 @@ if not ('show_profile' in st.session_state and st.session_state.show_profile):
                             header_col, priority_col, expand_col = st.columns([6, 2, 1])
                             with header_col:
                                 # Convert title to uppercase and make it bold
-                                st.markdown(f"**{task['title'].upper()}**")
+                                if multi_select:
+                                    st.checkbox(f"**{task['title'].upper()}**", key=f"bulk_select_{task_id}")
+                                else:
+                                    st.markdown(f"**{task['title'].upper()}**")
                             
                             with priority_col:
                                 st.markdown(f"<span style='background-color: {priority_color}; color: white; padding: 2px 6px; border-radius: 12px; font-size: 12px;'>{task['priority']}</span>", unsafe_allow_html=True)
@@ -655,10 +714,10 @@ if not ('show_profile' in st.session_state and st.session_state.show_profile):
                                     st.rerun()
                         
                             # Show due date outside the expansion block (always visible) but not for Done tasks
-                            if pd.notna(task['due_date']) and status != "Done":
+                            if pd.notna(task['due_at']) and status != "Done":
                                 st.markdown(f"<span style='color: {due_status['color']}; font-size: 0.85em;'>⏱️ {due_status['display']} • <strong>{due_status['text']}</strong></span>", unsafe_allow_html=True)
                             # For Done tasks, just show when it was completed
-                            elif pd.notna(task['due_date']) and status == "Done":
+                            elif pd.notna(task['due_at']) and status == "Done":
                                 st.markdown(f"<span style='color: #10b981; font-size: 0.85em;'>✅ Completed</span>", unsafe_allow_html=True)
                         
                         # Only show details and buttons if expanded, but NOT another due date
@@ -667,6 +726,19 @@ if not ('show_profile' in st.session_state and st.session_state.show_profile):
                             description = task['description'] if task['description'] else "No description provided."
                             st.caption(description)
                             
+                            # List subtasks from the cached child index
+                            subtask_ids = child_index.get(int(task_id), [])
+                            if subtask_ids:
+                                st.markdown(
+                                    "<div style='font-size: 0.85em; font-weight: 600;'>Subtasks</div>" +
+                                    "".join(
+                                        f"<div style='font-size: 0.8em; color: {get_status_color(child_summaries[child_id][1])};'>"
+                                        f"• {child_summaries[child_id][0]} ({child_summaries[child_id][1]})</div>"
+                                        for child_id in subtask_ids if child_id in child_summaries
+                                    ),
+                                    unsafe_allow_html=True
+                                )
+                            
                             # Action buttons in a row
                             col1, col2, col3 = st.columns(3)
                             with col1:
@@ -713,6 +785,12 @@ if not ('show_profile' in st.session_state and st.session_state.show_profile):
                         
                         # Add a divider between tasks
                         st.markdown("<hr>", unsafe_allow_html=True)
+                
+                if after_key is not None:
+                    remaining = task_counts['by_status'].get(status, 0) - len(status_tasks)
+                    if st.button(f"Load more ({remaining} left)", key=f"load_more_{status}", use_container_width=True):
+                        st.session_state.column_pages[status] = page_count + 1
+                        st.rerun()
     elif view_type == "Calendar":
         # Calendar View Section
         st.subheader("📅 Calendar View")
@@ -751,6 +829,7 @@ if not ('show_profile' in st.session_state and st.session_state.show_profile):
                 st.session_state.calendar_collapsed = calendar_collapsed
         
         # Get all tasks
+        tasks_df = get_fresh_tasks(task_filter)
         all_calendar_tasks = tasks_df.copy()
         
         # Create a calendar grid
@@ -762,22 +841,23 @@ if not ('show_profile' in st.session_state and st.session_state.show_profile):
             with cols[i]:
                 st.markdown(f"<div style='text-align: center; font-weight: bold; background-color: #f0f2f6; padding: 8px; border-radius: 4px;'>{day_name}</div>", unsafe_allow_html=True)
         
-        # Convert due_date to datetime for comparison
-        calendar_tasks = all_calendar_tasks.copy()
-        calendar_tasks['due_date_parsed'] = pd.to_datetime(calendar_tasks['due_date'], errors='coerce')
+        # Keep the tasks whose due_at falls in the selected month
+        month_start = date(selected_year, selected_month, 1)
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        calendar_tasks = all_calendar_tasks[
+            (all_calendar_tasks['due_at'] >= day_start_epoch(month_start)) &
+            (all_calendar_tasks['due_at'] < day_start_epoch(next_month))
+        ] if not all_calendar_tasks.empty else all_calendar_tasks
         
         # Create day-based task dictionary
         day_task_dict = {}
         
-        # Loop through all tasks and organize by day
+        # Loop through the month's tasks and organize by day
         for _, task in calendar_tasks.iterrows():
-            if pd.notna(task['due_date_parsed']):
-                task_date = task['due_date_parsed'].date()
-                if task_date.month == selected_month and task_date.year == selected_year:
-                    day = task_date.day
-                    if day not in day_task_dict:
-                        day_task_dict[day] = []
-                    day_task_dict[day].append(task)
+            day = date.fromtimestamp(int(task['due_at'])).day
+            if day not in day_task_dict:
+                day_task_dict[day] = []
+            day_task_dict[day].append(task)
         
         # Display the calendar grid with tasks
         for week in monthly_cal:
@@ -849,9 +929,17 @@ if st.session_state.show_analytics:
     st.markdown("<a id='analytics'></a>", unsafe_allow_html=True)
     st.subheader("📊 Analytics")
     
-    # Use cached analytics
-    tasks = get_cached_tasks()
-    analytics = generate_analytics(tasks)
+    # Analytics read the in-memory replica, so they never wait on the writer; archived tasks are only read when asked for
+    reports = current_report_repository()
+    tasks = reports.get_tasks()
+    # Metric cards for live tasks come from the task counters
+    counts = reports.get_counts()
+    if st.checkbox("Include archived tasks", key="analytics_include_archive"):
+        archived = get_archived_tasks(from_replica=True)
+        if not archived.empty:
+            tasks = pd.concat([tasks, archived.drop(columns='archived_date')], ignore_index=True)
+            counts = None
+    analytics = generate_analytics(tasks, label_counts=reports.get_label_counts(), counts=counts)
     
     # Display metric cards
     metrics_cols = st.columns(4)
@@ -906,6 +994,29 @@ if st.session_state.show_analytics:
     
     with chart_cols[1]:
         st.plotly_chart(analytics['priority_chart'], use_container_width=True)
+    
+    if analytics['label_chart'] is not None:
+        st.plotly_chart(analytics['label_chart'], use_container_width=True)
+    
+    # Trends come from the daily snapshot table, a few rows per day
+    trend_days = st.selectbox("Trend period", [14, 30, 90], index=1, format_func=lambda days: f"Last {days} days",
+                              key="analytics_trend_days")
+    history = get_status_history(st.session_state.username if hasattr(st.session_state, 'username') else None, trend_days)
+    if history.empty:
+        st.caption("No status history recorded yet.")
+    else:
+        trend_cols = st.columns(2)
+        with trend_cols[0]:
+            st.plotly_chart(create_cumulative_flow_chart(history), use_container_width=True)
+        with trend_cols[1]:
+            st.plotly_chart(create_burndown_chart(history), use_container_width=True)
+    
+    # Queue folding of the status moves made since the last visit; the replica shows them after its next refresh
+    refresh_flow_metrics()
+    flow = get_flow_metrics(st.session_state.username if hasattr(st.session_state, 'username') else None, trend_days)
+    st.markdown(f"**Flow metrics** · {flow['count']} tasks finished in the last {trend_days} days (days, by percentile)")
+    if flow['count']:
+        st.dataframe(create_flow_metrics_table(flow), use_container_width=True)
 
 # User Profile Section
 if 'show_profile' in st.session_state and st.session_state.show_profile:
@@ -0,0 +1,178 @@
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from connection import get_connection
+from repository import init_db, build_filter_clause, add_sort_datetime, TaskFilter, _next_position
+from migrations import set_task_labels
+from sharding import shard_for, list_shards, open_shard, fan_out
+from replica import replica_path
+import task_cache
+from write_queue import run_write_to, after_commit
+
+# Done tasks untouched for this many days are moved to tasks_archive
+ARCHIVE_AFTER_DAYS = 30
+
+# Tasks moved per transaction, so sessions never wait long for the write lock
+ARCHIVE_BATCH_SIZE = 500
+
+
+def _shared_columns(c):
+    """Return the columns present in both tasks and tasks_archive."""
+    c.execute("PRAGMA table_info(tasks_archive)")
+    archive_columns = {column[1] for column in c.fetchall()}
+    c.execute("PRAGMA table_info(tasks)")
+    return [column[1] for column in c.fetchall() if column[1] in archive_columns]
+
+
+def _archive_batch_op(c, cutoff, batch_size):
+    """Move one batch of old Done tasks to tasks_archive (runs on the writer thread)."""
+    c.execute('''SELECT id, username FROM tasks
+                 WHERE status = 'Done' AND last_updated < ?
+                 AND NOT EXISTS (SELECT 1 FROM tasks child WHERE child.parent_id = tasks.id)
+                 LIMIT ?''', (cutoff, batch_size))
+    batch = c.fetchall()
+    if not batch:
+        return 0
+
+    columns = ', '.join(_shared_columns(c))
+    task_ids = [task_id for task_id, _ in batch]
+    placeholders = ', '.join('?' * len(task_ids))
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    c.execute(f'''INSERT OR REPLACE INTO tasks_archive ({columns}, archived_date)
+                  SELECT {columns}, ? FROM tasks WHERE id IN ({placeholders})''', [now] + task_ids)
+    c.execute(f'DELETE FROM tasks WHERE id IN ({placeholders})', task_ids)
+
+    for username in {username for _, username in batch}:
+        after_commit(lambda username=username: task_cache.bump_version(username, shared=username is None))
+    return len(task_ids)
+
+
+def archive_done_tasks(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, pause=0.0):
+    """Move Done tasks not updated for `days` days into tasks_archive, on every shard.
+
+    Each batch of batch_size tasks is its own write request, so interactive
+    writes queued in between are not held up. A parent is only archived
+    once it has no subtasks left in tasks, so hierarchies move bottom-up.
+    Returns the number of archived tasks.
+    """
+    cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    archived = 0
+
+    for db_path in list_shards():
+        db_path = open_shard(db_path)
+        while True:
+            try:
+                count = run_write_to(db_path, _archive_batch_op, cutoff, batch_size)
+            except Exception as e:
+                print(f"Error archiving tasks: {str(e)}")
+                break
+            if not count:
+                break
+            archived += count
+
+            # Optionally leave the writer idle for a moment between batches
+            if pause:
+                time.sleep(pause)
+
+    return archived
+
+
+def _archive_query(username, filters=None, limit=None):
+    """Build the SELECT for a user's archived tasks, narrowed by a TaskFilter."""
+    # The archive has no FTS index; search falls back to LIKE, which is fine on demand
+    clauses, params = build_filter_clause(filters, use_fts=False)
+    if username:
+        clauses.insert(0, "(username = ? OR username IS NULL)")
+        params.insert(0, username)
+
+    query = 'SELECT * FROM tasks_archive'
+    if clauses:
+        query += ' WHERE ' + ' AND '.join(clauses)
+    query += ' ORDER BY archived_date DESC, id DESC'
+    if limit:
+        query += ' LIMIT ?'
+        params.append(limit)
+    return query, params
+
+
+def get_archived_tasks(username, filters=None, limit=None, from_replica=False):
+    """Return a user's archived tasks, newest archive first.
+
+    Reports pass from_replica=True to read the analytics replica instead of
+    the live database.
+    """
+    try:
+        db_path = shard_for(username)
+        conn = get_connection(replica_path(db_path) if from_replica else db_path)
+
+        query, params = _archive_query(username, filters, limit)
+        df = pd.read_sql_query(query, conn, params=params)
+
+        # Handle empty dataframe case
+        if df.empty:
+            return df
+
+        return add_sort_datetime(df)
+    except Exception as e:
+        print(f"Error retrieving archived tasks: {str(e)}")
+        return pd.DataFrame()
+
+
+def search_archive(username, query, limit=50):
+    """Search a user's archived tasks by title, description or labels."""
+    return get_archived_tasks(username, TaskFilter(search=query), limit=limit)
+
+
+def _restore_archived_task_op(c, username, task_id):
+    """Move an archived task back into tasks (runs on the writer thread)."""
+    if username:
+        c.execute('SELECT status, labels, username FROM tasks_archive WHERE id = ? AND (username = ? OR username IS NULL)',
+                  (task_id, username))
+    else:
+        c.execute('SELECT status, labels, username FROM tasks_archive WHERE id = ?', (task_id,))
+    row = c.fetchone()
+    if not row:
+        return False
+    status, labels, owner = row
+
+    columns = _shared_columns(c)
+    # A parent that is no longer live would break the foreign key, so the task comes back top-level
+    values = ['CASE WHEN parent_id IN (SELECT id FROM tasks) THEN parent_id END' if column == 'parent_id' else column
+              for column in columns]
+    c.execute(f'INSERT INTO tasks ({", ".join(columns)}) SELECT {", ".join(values)} FROM tasks_archive WHERE id = ?',
+              (task_id,))
+    c.execute('UPDATE tasks SET position = ? WHERE id = ?', (_next_position(c, status, owner), task_id))
+    set_task_labels(c, task_id, labels)
+    c.execute('DELETE FROM tasks_archive WHERE id = ?', (task_id,))
+    after_commit(lambda: task_cache.bump_version(owner, shared=owner is None))
+    return True
+
+
+def restore_archived_task(username, task_id):
+    """Move one of a user's archived tasks back to the end of its status column."""
+    try:
+        return run_write_to(shard_for(username), _restore_archived_task_op, username, task_id)
+    except Exception as e:
+        print(f"Error restoring archived task: {str(e)}")
+        return False
+
+
+def get_archive_stats():
+    """Return the number of live and archived tasks over every shard, read from the replicas."""
+    def count(db_path):
+        conn = get_connection(replica_path(db_path))
+        return (conn.execute('SELECT COUNT(*) FROM tasks').fetchone()[0],
+                conn.execute('SELECT COUNT(*) FROM tasks_archive').fetchone()[0])
+
+    counts = fan_out(count).values()
+    return {'live': sum(live for live, _ in counts), 'archived': sum(archived for _, archived in counts)}
+
+
+if __name__ == '__main__':
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_AFTER_DAYS
+    init_db()
+    count = archive_done_tasks(days)
+    print(f"Archived {count} Done tasks older than {days} days")
@@ -8,6 +8,15 @@ import os
 import uuid
 import time
 
+from connection import get_connection, get_connection_stats, USERS_DB
+from task_cache import get_cache_stats
+from write_queue import get_write_stats
+from query_stats import get_query_stats, reset_query_stats, SLOW_QUERY_MS, SLOW_QUERY_LOG
+from archive import archive_done_tasks, get_archive_stats, ARCHIVE_AFTER_DAYS
+from sharding import get_shard_stats, get_all_counts, SHARD_MODE
+from replica import get_replica_stats, REPLICA_ENABLED, REPLICA_MIN_INTERVAL, REPLICA_MAX_BYTES
+from storage_health import get_storage_health, get_last_health_report, report_storage_health
+
 # Create a directory for session tokens if it doesn't exist
 SESSIONS_DIR = "sessions"
 if not os.path.exists(SESSIONS_DIR):
@@ -15,7 +24,7 @@ if not os.path.exists(SESSIONS_DIR):
 
 def init_auth_db():
     """Initialize the authentication database."""
-    conn = sqlite3.connect('users.db')
+    conn = get_connection(USERS_DB)
     c = conn.cursor()
     
     c.execute('''CREATE TABLE IF NOT EXISTS users
@@ -66,7 +75,6 @@ def init_auth_db():
             )
     
     conn.commit()
-    conn.close()
 
 def hash_password(password):
     """Hash a password using SHA-256."""
@@ -233,7 +241,7 @@ def register_user(username, password, email=None):
     if '@' not in email or '.' not in email:
         return False, "Please enter a valid email address"
         
-    conn = sqlite3.connect('users.db')
+    conn = get_connection(USERS_DB)
     c = conn.cursor()
     
     try:
@@ -262,18 +270,13 @@ def register_user(username, password, email=None):
     except Exception as e:
         conn.rollback()
         return False, f"Error during registration: {str(e)}"
-    finally:
-        conn.close()
 
 def authenticate_user(username, password):
     """Authenticate a user."""
     if not username or not password:
         return False
     
-    # Debug information - will show in the console but not to the user
-    print(f"Attempting to authenticate user: {username}")
-        
-    conn = sqlite3.connect('users.db')
+    conn = get_connection(USERS_DB)
     c = conn.cursor()
     
     try:
@@ -285,30 +288,22 @@ def authenticate_user(username, password):
         user = c.fetchone()
         
         if not user:
-            print(f"User not found: {username}")
             return False
             
         stored_password = user[1]
         
-        # Debug: Compare hashed passwords
-        print(f"Input password hash: {hashed_pw}")
-        print(f"Stored password hash: {stored_password}")
-        
         if hashed_pw == stored_password:
             # Update last login time
             now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             c.execute("UPDATE users SET last_login = ? WHERE id = ?", (now, user[0]))
             conn.commit()
-            print(f"Authentication successful for: {username}")
             return True
         else:
-            print(f"Password mismatch for: {username}")
             return False
     except Exception as e:
+        conn.rollback()
         print(f"Authentication error: {str(e)}")
         return False
-    finally:
-        conn.close()
 
 def login_required():
     """Check if user is logged in, if not show login page."""
@@ -501,7 +496,7 @@ def logout_user():
 
 def get_all_users():
     """Get all users from the database."""
-    conn = sqlite3.connect('users.db')
+    conn = get_connection(USERS_DB)
     c = conn.cursor()
     
     try:
@@ -524,12 +519,10 @@ def get_all_users():
     except Exception as e:
         print(f"Error getting users: {str(e)}")
         return []
-    finally:
-        conn.close()
 
 def get_user(user_id):
     """Get a single user by ID."""
-    conn = sqlite3.connect('users.db')
+    conn = get_connection(USERS_DB)
     c = conn.cursor()
     
     try:
@@ -548,15 +541,13 @@ def get_user(user_id):
     except Exception as e:
         print(f"Error getting user: {str(e)}")
         return None
-    finally:
-        conn.close()
 
 def update_user(user_id, username=None, email=None, password=None):
     """Update user details."""
     if not user_id:
         return False, "User ID is required"
     
-    conn = sqlite3.connect('users.db')
+    conn = get_connection(USERS_DB)
     c = conn.cursor()
     
     try:
@@ -608,15 +599,13 @@ def update_user(user_id, username=None, email=None, password=None):
     except Exception as e:
         conn.rollback()
         return False, f"Error updating user: {str(e)}"
-    finally:
-        conn.close()
 
 def delete_user(user_id):
     """Delete a user by ID."""
     if not user_id:
         return False, "User ID is required"
     
-    conn = sqlite3.connect('users.db')
+    conn = get_connection(USERS_DB)
     c = conn.cursor()
     
     try:
@@ -633,15 +622,13 @@ def delete_user(user_id):
     except Exception as e:
         conn.rollback()
         return False, f"Error deleting user: {str(e)}"
-    finally:
-        conn.close()
 
 def get_current_user_profile(username):
     """Get profile data for the currently logged in user."""
     if not username:
         return None
         
-    conn = sqlite3.connect('users.db')
+    conn = get_connection(USERS_DB)
     c = conn.cursor()
     
     try:
@@ -660,15 +647,13 @@ def get_current_user_profile(username):
     except Exception as e:
         print(f"Error getting user profile: {str(e)}")
         return None
-    finally:
-        conn.close()
 
 def update_current_user_profile(user_id, email=None, password=None):
     """Update the current user's profile."""
     if not user_id:
         return False, "User ID is required"
     
-    conn = sqlite3.connect('users.db')
+    conn = get_connection(USERS_DB)
     c = conn.cursor()
     
     try:
@@ -708,15 +693,13 @@ def update_current_user_profile(user_id, email=None, password=None):
     except Exception as e:
         conn.rollback()
         return False, f"Error updating profile: {str(e)}"
-    finally:
-        conn.close()
 
 def is_admin(username):
     """Check if the user is an admin."""
     if not username:
         return False
         
-    conn = sqlite3.connect('users.db')
+    conn = get_connection(USERS_DB)
     c = conn.cursor()
     
     try:
@@ -729,8 +712,6 @@ def is_admin(username):
     except Exception as e:
         print(f"Error checking admin status: {str(e)}")
         return False
-    finally:
-        conn.close()
 
 def admin_panel():
     """Admin panel for user management."""
@@ -794,7 +775,7 @@ def admin_panel():
                     
                     if success:
                         # Then update the admin status separately
-                        conn = sqlite3.connect('users.db')
+                        conn = get_connection(USERS_DB)
                         c = conn.cursor()
                         try:
                             c.execute("UPDATE users SET is_admin = ? WHERE id = ?", 
@@ -806,9 +787,8 @@ def admin_panel():
                             time.sleep(0.5)  # Small delay to ensure changes are committed
                             st.rerun()
                         except Exception as e:
+                            conn.rollback()
                             st.error(f"Error updating admin status: {str(e)}")
-                        finally:
-                            conn.close()
                     else:
                         st.error(message)
                 
@@ -845,7 +825,7 @@ def admin_panel():
                     st.error("Please enter a valid email address")
                 else:
                     # Handle admin flag
-                    conn = sqlite3.connect('users.db')
+                    conn = get_connection(USERS_DB)
                     c = conn.cursor()
                     
                     try:
@@ -862,19 +842,122 @@ def admin_panel():
                         st.success("User added successfully!")
                         st.rerun()
                     except sqlite3.IntegrityError:
+                        conn.rollback()
                         st.error("Username already exists!")
                     except Exception as e:
+                        conn.rollback()
                         st.error(f"Error: {str(e)}")
-                    finally:
-                        conn.close()
     else:
         st.warning("No users found in the database.")
     
+    # Connection pool usage
+    st.subheader("Database Connections")
+    pool_stats = get_connection_stats()
+    pool_cols = st.columns(3)
+    pool_cols[0].metric("Connections Opened", pool_stats['opened'])
+    pool_cols[1].metric("Connections Reused", pool_stats['reused'])
+    pool_cols[2].metric("Open Now", pool_stats['open_connections'])
+    
+    # Effective pragmas of the storage profile and the latency probe from startup
+    st.subheader("Storage Health")
+    if st.button("Re-run Storage Check", key="storage_check_btn"):
+        health = get_storage_health()
+    else:
+        health = get_last_health_report() or report_storage_health()
+    if health:
+        health_cols = st.columns(3)
+        health_cols[0].metric("Profile", health['profile'])
+        if health['probes']:
+            health_cols[1].metric("Commit p50", f"{health['probes'][0]['write_p50_ms']:.2f} ms")
+            health_cols[2].metric("Read p50", f"{health['probes'][0]['read_p50_ms']:.3f} ms")
+        # Values mix numbers and names, so show them as text
+        st.dataframe([{**row, 'expected': str(row['expected']), 'effective': str(row['effective'])}
+                      for row in health['settings']], use_container_width=True, hide_index=True)
+        mismatched = [row['pragma'] for row in health['settings'] if not row['ok']]
+        if mismatched:
+            st.warning(f"SQLite did not apply: {', '.join(sorted(set(mismatched)))}")
+        st.caption(f"SQLite {health['sqlite_version']}; tasks.parent_id ON DELETE: "
+                   f"{health['parent_on_delete'] or 'no foreign key'}. Set TASK_DB_PROFILE to change the profile.")
+    
+    # Process-wide task cache
+    st.subheader("Task Cache")
+    cache_stats = get_cache_stats()
+    lookups = cache_stats['hits'] + cache_stats['misses']
+    cache_cols = st.columns(4)
+    cache_cols[0].metric("Hit Rate", f"{cache_stats['hits'] / lookups:.0%}" if lookups else "-")
+    cache_cols[1].metric("Entries", cache_stats['entries'])
+    cache_cols[2].metric("Memory", f"{cache_stats['bytes'] / (1024 * 1024):.1f} MB")
+    cache_cols[3].metric("Evictions", cache_stats['evictions'])
+    
+    # Single writer thread that group-commits task writes
+    st.subheader("Write Queue")
+    write_stats = get_write_stats()
+    write_cols = st.columns(4)
+    write_cols[0].metric("Queue Depth", write_stats['queue_depth'])
+    write_cols[1].metric("Writes / Commit", f"{write_stats['avg_batch']:.1f}")
+    write_cols[2].metric("Avg Commit", f"{write_stats['avg_commit_ms']:.1f} ms")
+    write_cols[3].metric("p95 Commit", f"{write_stats['p95_commit_ms']:.1f} ms")
+    
+    # Move old Done tasks out of the live table
+    st.subheader("Task Archive")
+    archive_stats = get_archive_stats()
+    archive_cols = st.columns(3)
+    archive_cols[0].metric("Live Tasks", archive_stats['live'])
+    archive_cols[1].metric("Archived Tasks", archive_stats['archived'])
+    with archive_cols[2]:
+        archive_days = st.number_input("Archive Done tasks older than (days)", min_value=0,
+                                       value=ARCHIVE_AFTER_DAYS, key="archive_days")
+    if st.button("Archive Done Tasks", key="archive_done_btn"):
+        archived = archive_done_tasks(int(archive_days))
+        st.success(f"Archived {archived} tasks")
+    
+    # Task totals fanned out over every shard (just tasks.db when sharding is off)
+    st.subheader("Task Shards")
+    all_counts = get_all_counts()
+    shard_stats = get_shard_stats()
+    shard_cols = st.columns(4)
+    shard_cols[0].metric("Shards", len(shard_stats))
+    shard_cols[1].metric("Tasks", all_counts['total'])
+    shard_cols[2].metric("Overdue", all_counts['overdue'])
+    shard_cols[3].metric("Due Soon", all_counts['due_soon'])
+    st.dataframe(shard_stats.round(2), use_container_width=True, hide_index=True)
+    st.caption(f"Sharding mode: {SHARD_MODE}")
+    
+    # In-memory copies that analytics and the stats above are read from
+    st.subheader("Analytics Replicas")
+    replica_stats = get_replica_stats()
+    if replica_stats:
+        st.dataframe(
+            [{key: round(value, 2) if isinstance(value, float) else value for key, value in entry.items()}
+             for entry in replica_stats],
+            use_container_width=True, hide_index=True
+        )
+    st.caption(f"Replicas enabled: {REPLICA_ENABLED}; refreshed at most every {REPLICA_MIN_INTERVAL:g} s "
+               "after the database changes. "
+               + (f"Databases over {REPLICA_MAX_BYTES // (1024 * 1024)} MB are read live." if REPLICA_MAX_BYTES
+                  else "Databases of any size are copied."))
+    
+    # Query timings per call site since startup (or the last reset)
+    st.subheader("Query Stats")
+    query_stats = get_query_stats()
+    if query_stats:
+        st.dataframe(
+            [{key: round(value, 2) if isinstance(value, float) else value for key, value in entry.items()}
+             for entry in query_stats],
+            use_container_width=True, hide_index=True
+        )
+    else:
+        st.caption("No queries recorded yet.")
+    st.caption(f"Queries slower than {SLOW_QUERY_MS:g} ms are written with their query plan to {SLOW_QUERY_LOG}.")
+    if st.button("Reset Query Stats", key="reset_query_stats_btn"):
+        reset_query_stats()
+        st.rerun()
+    
     return True
 
 def reset_admin_password():
     """Reset the admin password to 'admin'."""
-    conn = sqlite3.connect('users.db')
+    conn = get_connection(USERS_DB)
     c = conn.cursor()
     
     # Admin password
@@ -902,6 +985,4 @@ def reset_admin_password():
         return True, "Admin password reset to 'admin'"
     except Exception as e:
         conn.rollback()
-        return False, f"Error resetting admin password: {str(e)}"
-    finally:
-        conn.close() 
\ No newline at end of file
+        return False, f"Error resetting admin password: {str(e)}" 
\ No newline at end of file
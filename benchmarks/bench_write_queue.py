@@ -0,0 +1,105 @@
+"""Benchmark concurrent task inserts with and without the group-commit writer.
+
+Each thread inserts tasks one at a time, as concurrent Streamlit sessions
+do. "direct" gives every thread its own connection and transaction per
+insert (the previous behaviour); "queued" sends the inserts through
+write_queue, which commits everything queued within the batch window in
+one transaction. A second table repeats the queued run for several
+WRITE_BATCH_WINDOW values. Run from the repository root:
+
+    python benchmarks/bench_write_queue.py
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import connection
+from connection import CONNECTION_PRAGMAS
+from migrations import apply_migrations
+import write_queue
+
+THREAD_COUNTS = [1, 4, 16, 32]
+BATCH_WINDOWS_MS = [0, 1, 2, 5]
+INSERTS_PER_THREAD = 100
+INSERT_SQL = "INSERT INTO tasks (title, status, username) VALUES (?, 'To Do', ?)"
+
+
+def direct_worker(db_path, thread_no, errors):
+    """Insert tasks with one transaction per insert on a private connection."""
+    conn = sqlite3.connect(db_path)
+    for pragma, value in CONNECTION_PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    for i in range(INSERTS_PER_THREAD):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(INSERT_SQL, (f"task {thread_no}-{i}", f"user{thread_no}"))
+            conn.commit()
+        except sqlite3.OperationalError:
+            conn.rollback()
+            errors.append(1)
+    conn.close()
+
+
+def queued_worker(db_path, thread_no, errors):
+    """Insert tasks through the writer thread, waiting for each commit."""
+    def insert(c, title, username):
+        c.execute(INSERT_SQL, (title, username))
+
+    for i in range(INSERTS_PER_THREAD):
+        try:
+            write_queue.run_write(insert, f"task {thread_no}-{i}", f"user{thread_no}")
+        except sqlite3.OperationalError:
+            errors.append(1)
+
+
+def run(worker, db_path, thread_count):
+    """Return (seconds, errors) for thread_count threads running worker."""
+    errors = []
+    threads = [threading.Thread(target=worker, args=(db_path, n, errors)) for n in range(thread_count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, len(errors)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench_tasks.db')
+        # Point the pooled connections (and so the writer thread) at the scratch database
+        connection.TASKS_DB = db_path
+        write_queue.TASKS_DB = db_path
+        apply_migrations(connection.get_connection(db_path))
+
+        print(f"{'threads':>8} {'direct (s)':>11} {'errors':>7} {'queued (s)':>11} {'writes/commit':>14} {'p95 commit (ms)':>16}")
+        for thread_count in THREAD_COUNTS:
+            direct, direct_errors = run(direct_worker, db_path, thread_count)
+            write_queue.reset_write_stats()
+            queued, _ = run(queued_worker, db_path, thread_count)
+            stats = write_queue.get_write_stats()
+            print(f"{thread_count:>8} {direct:>11.3f} {direct_errors:>7} {queued:>11.3f} "
+                  f"{stats['avg_batch']:>14.1f} {stats['p95_commit_ms']:>16.2f}")
+
+        print()
+        print(f"{'threads':>8} {'window (ms)':>12} {'queued (s)':>11} {'writes/commit':>14} {'p95 commit (ms)':>16}")
+        default_window = write_queue.WRITE_BATCH_WINDOW
+        for thread_count in THREAD_COUNTS[1:]:
+            for window_ms in BATCH_WINDOWS_MS:
+                write_queue.WRITE_BATCH_WINDOW = window_ms / 1000
+                write_queue.reset_write_stats()
+                queued, _ = run(queued_worker, db_path, thread_count)
+                stats = write_queue.get_write_stats()
+                print(f"{thread_count:>8} {window_ms:>12} {queued:>11.3f} "
+                      f"{stats['avg_batch']:>14.1f} {stats['p95_commit_ms']:>16.2f}")
+        write_queue.WRITE_BATCH_WINDOW = default_window
+        connection.close_all_connections()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""Generate a reproducible synthetic tasks database for benchmarks.
+
+Tasks get realistic status, priority, label, due-date and subtask
+distributions, spread over N users with a few shared (username-less)
+tasks. Dates are relative to today, so the same size and seed produce
+the same database apart from that shift. Run from the repository root:
+
+    python benchmarks/generate_dataset.py --tasks 100000 --users 20 --out bench_tasks.db
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import apply_migrations, POSITION_GAP
+
+STATUSES = ['To Do', 'In Progress', 'Blocked', 'Done']
+STATUS_WEIGHTS = [0.35, 0.20, 0.08, 0.37]
+
+PRIORITIES = ['Critical', 'High', 'Medium', 'Low']
+PRIORITY_WEIGHTS = [0.05, 0.20, 0.45, 0.30]
+
+LABELS = ['backend', 'frontend', 'bug', 'feature', 'docs', 'design', 'infra', 'security', 'performance',
+          'testing', 'ux', 'api', 'database', 'mobile', 'research', 'ops', 'billing', 'support',
+          'release', 'refactor', 'analytics', 'email', 'search', 'auth', 'i18n', 'legal', 'hiring',
+          'marketing', 'sales', 'finance']
+
+VERBS = ['Fix', 'Write', 'Review', 'Update', 'Plan', 'Ship', 'Test', 'Refactor', 'Design', 'Migrate']
+NOUNS = ['report', 'login page', 'invoice export', 'search index', 'onboarding flow', 'release notes',
+         'dashboard', 'API client', 'backup job', 'pricing page']
+
+# Share of tasks without a username, which every user sees
+SHARED_FRACTION = 0.01
+# Share of tasks that are subtasks of an earlier task of the same user
+SUBTASK_FRACTION = 0.15
+# Share of tasks without a due date, and of dated tasks with a due time
+NO_DUE_DATE_FRACTION = 0.15
+DUE_TIME_FRACTION = 0.30
+
+INSERT_CHUNK = 50_000
+
+# due_at is computed in SQL the same way migrations.DUE_AT_EXPRESSION does (?6 = due_date, ?7 = due_time)
+INSERT_SQL = '''INSERT INTO tasks
+                (id, title, description, status, priority, due_date, due_time, due_at,
+                 created_date, last_updated, position, labels, parent_id, username)
+                VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7,
+                        CAST(strftime('%s', ?6 || ' ' || COALESCE(NULLIF(?7, ''), '00:00'), 'utc') AS INTEGER),
+                        ?8, ?9, ?10, ?11, ?12, ?13)'''
+
+
+def build_tasks(n_tasks, n_users, seed=42, today=None):
+    """Return a DataFrame of n_tasks synthetic tasks with ids 1..n_tasks."""
+    rng = np.random.default_rng(seed)
+    today = today or datetime.combine(date.today(), datetime.min.time())
+    ids = np.arange(1, n_tasks + 1)
+
+    # A few heavy users and a long tail, as on a real board
+    user_weights = 1 / np.arange(1, n_users + 1)
+    user_numbers = rng.choice(n_users, n_tasks, p=user_weights / user_weights.sum())
+    usernames = pd.Series([f"user{n}" for n in user_numbers], dtype=object)
+    usernames[rng.random(n_tasks) < SHARED_FRACTION] = None
+
+    status = rng.choice(STATUSES, n_tasks, p=STATUS_WEIGHTS)
+    priority = rng.choice(PRIORITIES, n_tasks, p=PRIORITY_WEIGHTS)
+
+    # Created over the last half year, last touched somewhere between creation and now
+    age_days = rng.uniform(0, 180, n_tasks)
+    created = pd.Timestamp(today) - pd.to_timedelta(age_days, unit='D')
+    updated = created + pd.to_timedelta(age_days * rng.random(n_tasks), unit='D')
+
+    # Due dates cluster a couple of weeks after creation; some are overdue, some have none
+    due_offset = np.clip(rng.normal(14, 20, n_tasks), -5, 120).astype(int)
+    due = (created.normalize() + pd.to_timedelta(due_offset, unit='D')).strftime('%Y-%m-%d')
+    due_date = pd.Series(due, dtype=object)
+    due_date[rng.random(n_tasks) < NO_DUE_DATE_FRACTION] = None
+    due_time = pd.Series(
+        [f"{hour:02d}:{minute:02d}" for hour, minute in zip(rng.integers(8, 19, n_tasks),
+                                                            rng.choice([0, 15, 30, 45], n_tasks))],
+        dtype=object
+    )
+    due_time[due_date.isna() | (rng.random(n_tasks) >= DUE_TIME_FRACTION)] = None
+
+    # Zero to three labels per task, popular labels much more common
+    label_weights = 1 / np.arange(1, len(LABELS) + 1) ** 1.1
+    label_weights /= label_weights.sum()
+    label_counts = rng.choice([0, 1, 2, 3], n_tasks, p=[0.30, 0.40, 0.20, 0.10])
+    label_picks = rng.choice(len(LABELS), (n_tasks, 3), p=label_weights)
+    labels = pd.Series([
+        ', '.join(dict.fromkeys(LABELS[i] for i in picks[:count])) if count else None
+        for picks, count in zip(label_picks, label_counts)
+    ], dtype=object)
+
+    titles = [f"{VERBS[v]} {NOUNS[n]} #{i}" for v, n, i in
+              zip(rng.integers(0, len(VERBS), n_tasks), rng.integers(0, len(NOUNS), n_tasks), ids)]
+    descriptions = pd.Series([f"Details for task {i}." for i in ids], dtype=object)
+    descriptions[rng.random(n_tasks) < 0.5] = None
+
+    tasks = pd.DataFrame({
+        'id': ids,
+        'title': titles,
+        'description': descriptions,
+        'status': status,
+        'priority': priority,
+        'due_date': due_date,
+        'due_time': due_time,
+        'created_date': created.strftime('%Y-%m-%d %H:%M:%S'),
+        'last_updated': updated.strftime('%Y-%m-%d %H:%M:%S'),
+        'labels': labels,
+        'username': usernames,
+    })
+
+    # Subtasks point at a random earlier task of the same user
+    owner = tasks['username'].fillna('')
+    order = np.argsort(owner.to_numpy(), kind='stable')
+    sorted_owner = owner.to_numpy()[order]
+    group_start = np.searchsorted(sorted_owner, sorted_owner, side='left')
+    rank_in_group = np.arange(n_tasks) - group_start
+    parent_sorted = group_start + (rng.random(n_tasks) * rank_in_group).astype(int)
+    is_subtask = (rng.random(n_tasks) < SUBTASK_FRACTION) & (rank_in_group > 0) & (sorted_owner != '')
+    parent_id = np.full(n_tasks, np.nan)
+    parent_id[order[is_subtask]] = ids[order[parent_sorted[is_subtask]]]
+    tasks['parent_id'] = pd.array(parent_id, dtype='Int64')
+
+    # Sparse positions in each column, in creation order
+    tasks['position'] = (tasks.groupby([owner, 'status']).cumcount() + 1) * POSITION_GAP
+    return tasks
+
+
+def generate_dataset(db_path, n_tasks, n_users=20, seed=42):
+    """Create db_path (replacing it) with the current schema and n_tasks synthetic tasks."""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    tasks = build_tasks(n_tasks, n_users, seed)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    apply_migrations(conn)
+    c = conn.cursor()
+    try:
+        c.execute('BEGIN IMMEDIATE')
+        columns = ['id', 'title', 'description', 'status', 'priority', 'due_date', 'due_time',
+                   'created_date', 'last_updated', 'position', 'labels', 'parent_id', 'username']
+        rows = tasks[columns].astype(object).where(tasks[columns].notna(), None)
+        for start in range(0, n_tasks, INSERT_CHUNK):
+            c.executemany(INSERT_SQL, rows.iloc[start:start + INSERT_CHUNK].itertuples(index=False, name=None))
+
+        # Normalized labels, as set_task_labels() would write them
+        c.executemany("INSERT OR IGNORE INTO labels (name) VALUES (?)", [(name,) for name in LABELS])
+        label_ids = dict(c.execute("SELECT name, id FROM labels").fetchall())
+        c.executemany("INSERT OR IGNORE INTO task_labels (task_id, label_id) VALUES (?, ?)", (
+            (task_id, label_ids[name.strip()])
+            for task_id, labels in zip(tasks['id'].tolist(), tasks['labels'].tolist()) if labels
+            for name in labels.split(',')
+        ))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Error generating dataset: {str(e)}")
+        raise e
+
+    conn.execute("ANALYZE")
+    conn.close()
+    return tasks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=10_000, help="number of tasks")
+    parser.add_argument('--users', type=int, default=20, help="number of users")
+    parser.add_argument('--seed', type=int, default=42, help="random seed")
+    parser.add_argument('--out', default='bench_tasks.db', help="database file to create")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generate_dataset(args.out, args.tasks, args.users, args.seed)
+    print(f"Wrote {args.tasks} tasks for {args.users} users to {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
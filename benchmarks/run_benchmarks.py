@@ -0,0 +1,200 @@
+"""Time the data layer on synthetic datasets and write the results as JSON.
+
+For each dataset size a database is generated (or reused from --data-dir)
+and loaded into each storage backend from --backends, working from a scratch
+directory, so the benchmarks run against the real modules. Every benchmark
+runs --repeat times with a cold task cache. Run from the repository root:
+
+    python benchmarks/run_benchmarks.py --sizes 1000 10000 --output results.json
+    python benchmarks/run_benchmarks.py --backends sqlite sqlite-memory python --sizes 10000
+    python benchmarks/run_benchmarks.py --compare results.json
+
+With --compare, medians are checked against an earlier run and the exit
+status is 1 if any benchmark got slower by more than --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import connection
+import task_cache
+from repository import TaskFilter, STATUS_ORDER, COLUMN_PAGE_SIZE
+from storage import configure_storage, get_repository, load_tasks_database, STORAGE_BACKENDS
+from analytics import generate_analytics
+from utils import create_calendar_view
+from generate_dataset import generate_dataset
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+USERS = 20
+SEED = 42
+
+# The busiest generated user, whose board is the largest
+BENCH_USER = 'user0'
+
+# A typical narrowed board: text search plus status, priority and due filters
+FILTERED = TaskFilter(search='report', statuses=('To Do', 'In Progress'), priorities=('Critical', 'High'),
+                      due='Due This Month')
+
+
+def time_call(func, repeat, setup=None):
+    """Run func() repeat times (after setup(), untimed) and return latency stats in ms."""
+    samples = []
+    for i in range(repeat):
+        args = setup(i) if setup else ()
+        task_cache.clear_cache()
+        start = time.perf_counter()
+        func(*args)
+        samples.append(1000 * (time.perf_counter() - start))
+    return {
+        'median_ms': statistics.median(samples),
+        'min_ms': min(samples),
+        'max_ms': max(samples),
+        'repeat': repeat,
+    }
+
+
+def board_filter_chain(repo, task_filter):
+    """What app.py reads to draw the Kanban board: summary counts and the first page of every column."""
+    repo.get_task_counts(task_filter)
+    for status in STATUS_ORDER:
+        repo.get_column_page(status, None, COLUMN_PAGE_SIZE, task_filter)
+
+
+def run_size(n_tasks, repeat, data_dir, backend='sqlite'):
+    """Run every benchmark against a fresh copy of the n_tasks dataset on one storage backend."""
+    os.makedirs(data_dir, exist_ok=True)
+    dataset = os.path.join(data_dir, f"tasks_{n_tasks}_{USERS}_{SEED}_{date.today().isoformat()}.db")
+    if not os.path.exists(dataset):
+        print(f"Generating {n_tasks} tasks...", flush=True)
+        generate_dataset(dataset, n_tasks, USERS, SEED)
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        connection.close_all_connections()
+        try:
+            configure_storage(backend)
+            load_tasks_database(dataset)
+            repo = get_repository(BENCH_USER)
+            tasks = repo.get_tasks()
+            rng = np.random.default_rng(SEED)
+            task_ids = [int(task_id) for task_id in rng.permutation(tasks['id'].to_numpy())[:2 * repeat]]
+            label_counts = repo.get_label_counts()
+            counts = repo.get_counts()
+            today = date.today()
+
+            benchmarks = [
+                ('get_tasks', lambda: repo.get_tasks(), None),
+                ('get_tasks_filtered', lambda: repo.get_tasks(FILTERED), None),
+                ('board_filter_chain', lambda: board_filter_chain(repo, TaskFilter()), None),
+                ('board_filter_chain_filtered', lambda: board_filter_chain(repo, FILTERED), None),
+                ('update_task_status',
+                 lambda task_id: repo.update_task_status(task_id, 'Done'), lambda i: (task_ids[i],)),
+                ('delete_task',
+                 lambda task_id: repo.delete_task(task_id), lambda i: (task_ids[repeat + i],)),
+                ('generate_analytics',
+                 lambda: generate_analytics(tasks, label_counts=label_counts, counts=counts), None),
+                ('create_calendar_view',
+                 lambda df: create_calendar_view(df, today.year, today.month), lambda i: (tasks.copy(),)),
+            ]
+            for name, func, setup in benchmarks:
+                stats = time_call(func, repeat, setup)
+                results.append({'benchmark': name, 'backend': backend, 'rows': n_tasks, 'user_rows': len(tasks),
+                                **stats})
+                print(f"{n_tasks:>9} {backend:<14} {name:<28} {stats['median_ms']:>10.2f} ms", flush=True)
+        finally:
+            connection.close_all_connections()
+            os.chdir(cwd)
+    return results
+
+
+def git_commit():
+    """Return the current commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """Print median changes against a baseline run; return the benchmarks that regressed."""
+    with open(baseline_path) as f:
+        # Runs from before storage backends existed were all on sqlite
+        baseline = {(entry['benchmark'], entry.get('backend', 'sqlite'), entry['rows']): entry
+                    for entry in json.load(f)['results']}
+
+    regressions = []
+    print(f"\n{'rows':>9} {'backend':<14} {'benchmark':<28} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for entry in results:
+        old = baseline.get((entry['benchmark'], entry['backend'], entry['rows']))
+        if old is None:
+            continue
+        ratio = entry['median_ms'] / old['median_ms'] if old['median_ms'] else float('inf')
+        flag = ' REGRESSION' if ratio > threshold else ''
+        print(f"{entry['rows']:>9} {entry['backend']:<14} {entry['benchmark']:<28} {old['median_ms']:>10.2f} "
+              f"{entry['median_ms']:>10.2f} {ratio:>7.2f}{flag}")
+        if flag:
+            regressions.append(entry['benchmark'])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="dataset sizes in tasks")
+    parser.add_argument('--repeat', type=int, default=5, help="runs per benchmark")
+    parser.add_argument('--backends', nargs='+', default=['sqlite'], choices=STORAGE_BACKENDS,
+                        help="storage backends to run every size on")
+    parser.add_argument('--data-dir', default=os.path.join(REPO_DIR, 'benchmarks', 'data'),
+                        help="where generated datasets are kept between runs")
+    parser.add_argument('--output', default=None, help="JSON file for the results")
+    parser.add_argument('--compare', default=None, help="earlier JSON results to compare against")
+    parser.add_argument('--threshold', type=float, default=1.2, help="median ratio counted as a regression")
+    args = parser.parse_args()
+
+    results = []
+    for n_tasks in args.sizes:
+        for backend in args.backends:
+            results.extend(run_size(n_tasks, args.repeat, os.path.abspath(args.data_dir), backend))
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'users': USERS,
+        'seed': SEED,
+        'results': results,
+    }
+    output = args.output or os.path.join(
+        REPO_DIR, 'benchmarks', 'results', f"data_layer_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
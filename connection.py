@@ -0,0 +1,219 @@
+import os
+import sqlite3
+import threading
+
+from query_stats import InstrumentedConnection
+
+# Database files used by the application
+TASKS_DB = 'tasks.db'
+USERS_DB = 'users.db'
+
+# Named pragma sets for every new connection. cache_size is in KiB when
+# negative, mmap_size in bytes. All profiles keep WAL, since the journal mode
+# is stored in the file and shared with other processes.
+STORAGE_PROFILES = {
+    # The Streamlit app: many small reads and writes, durable at checkpoints
+    'interactive': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'ON',
+    },
+    # Loaders and migrations: no fsync and a large cache; a crash may lose the last commits
+    'bulk-import': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'busy_timeout': 30000,
+        'cache_size': -262144,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'ON',
+    },
+    # Reporting jobs: long scans served from a big cache and mmap window
+    'analytics': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -131072,
+        'mmap_size': 1073741824,
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'ON',
+    },
+}
+
+# Profile applied to every connection; set TASK_DB_PROFILE or call configure_profile()
+STORAGE_PROFILE = os.environ.get('TASK_DB_PROFILE', 'interactive')
+if STORAGE_PROFILE not in STORAGE_PROFILES:
+    raise ValueError(f"Unknown TASK_DB_PROFILE: {STORAGE_PROFILE}")
+
+# Pragmas of the active profile
+CONNECTION_PRAGMAS = STORAGE_PROFILES[STORAGE_PROFILE]
+
+# Pool of open connections: {db_path: {thread_id: connection}}
+_pool = {}
+_pool_lock = threading.Lock()
+
+# Databases kept in shared-cache memory instead of on disk: {db_path: keep-alive connection}
+_memory_databases = {}
+
+# Databases served by a provider instead of the pool, such as read replicas: {name: provider()}
+_providers = {}
+
+# Counters so we can see how many connections the pool saves
+_stats = {'opened': 0, 'reused': 0, 'adopted': 0}
+
+
+def _memory_uri(db_path):
+    """Return the URI of the shared-cache in-memory database standing in for db_path."""
+    return f"file:{db_path}?mode=memory&cache=shared"
+
+
+def apply_pragmas(conn):
+    """Apply the active profile's pragmas to a connection outside any transaction."""
+    for pragma, value in CONNECTION_PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+
+
+def _open_connection(db_path):
+    """Open a new connection and apply the configured pragmas.
+
+    Connections are instrumented, so every query shows up in query_stats.
+    """
+    if db_path in _memory_databases:
+        conn = sqlite3.connect(_memory_uri(db_path), uri=True, check_same_thread=False,
+                               factory=InstrumentedConnection)
+        # Shared-cache readers would otherwise fail with "table is locked" while the writer holds a transaction
+        conn.execute("PRAGMA read_uncommitted = 1")
+    else:
+        conn = sqlite3.connect(db_path, check_same_thread=False, factory=InstrumentedConnection)
+    apply_pragmas(conn)
+    return conn
+
+
+def configure_profile(profile):
+    """Switch every connection to a storage profile.
+
+    Pooled connections are closed, so each thread reopens with the new
+    pragmas on its next query.
+    """
+    global STORAGE_PROFILE, CONNECTION_PRAGMAS
+    if profile not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown storage profile: {profile}")
+    STORAGE_PROFILE = profile
+    CONNECTION_PRAGMAS = STORAGE_PROFILES[profile]
+    close_all_connections()
+
+
+def use_memory_database(db_path=TASKS_DB):
+    """Serve db_path from a shared-cache in-memory database instead of the file.
+
+    Every pooled connection to db_path then shares one in-memory database,
+    which lives until the process exits. Connections already open on the
+    file are closed. Readers use read-uncommitted isolation, so they may see
+    a write batch before it commits.
+    """
+    with _pool_lock:
+        if db_path in _memory_databases:
+            return
+        # Keep one connection open so the database survives close_all_connections()
+        _memory_databases[db_path] = sqlite3.connect(_memory_uri(db_path), uri=True, check_same_thread=False)
+        for conn in _pool.pop(db_path, {}).values():
+            conn.close()
+
+
+def use_file_database(db_path=TASKS_DB):
+    """Serve db_path from its file again, discarding its in-memory database."""
+    with _pool_lock:
+        keeper = _memory_databases.pop(db_path, None)
+        if keeper is None:
+            return
+        for conn in _pool.pop(db_path, {}).values():
+            conn.close()
+        keeper.close()
+
+
+def register_connection_provider(name, provider):
+    """Serve get_connection(name) from provider() instead of the pool.
+
+    The provider returns a connection that is shared by every thread.
+    """
+    _providers[name] = provider
+
+
+def is_memory_database(db_path=TASKS_DB):
+    """Return True if db_path is served from memory."""
+    return db_path in _memory_databases
+
+
+def get_connection(db_path=TASKS_DB):
+    """Return the pooled connection for the current thread, opening one if needed.
+
+    Connections are long-lived and must not be closed by callers. A connection
+    left behind by a finished thread is handed over to the next thread that
+    needs one instead of opening a new file handle.
+    """
+    provider = _providers.get(db_path)
+    if provider is not None:
+        return provider()
+
+    thread_id = threading.get_ident()
+    with _pool_lock:
+        connections = _pool.setdefault(db_path, {})
+
+        conn = connections.get(thread_id)
+        if conn is not None:
+            _stats['reused'] += 1
+            return conn
+
+        # Adopt a connection whose owning thread has exited
+        alive = {thread.ident for thread in threading.enumerate()}
+        for owner_id in list(connections):
+            if owner_id not in alive:
+                conn = connections.pop(owner_id)
+                if conn.in_transaction:
+                    conn.rollback()
+                connections[thread_id] = conn
+                _stats['adopted'] += 1
+                _stats['reused'] += 1
+                return conn
+
+        conn = _open_connection(db_path)
+        connections[thread_id] = conn
+        _stats['opened'] += 1
+        return conn
+
+
+def close_all_connections():
+    """Close every pooled connection (used on shutdown and in maintenance scripts).
+
+    In-memory databases keep their contents.
+    """
+    with _pool_lock:
+        for connections in _pool.values():
+            for conn in connections.values():
+                try:
+                    conn.close()
+                except sqlite3.Error as e:
+                    print(f"Error closing connection: {str(e)}")
+        _pool.clear()
+
+
+def get_connection_stats():
+    """Return open/reuse counters for the connection pool."""
+    with _pool_lock:
+        return {
+            'opened': _stats['opened'],
+            'reused': _stats['reused'],
+            'adopted': _stats['adopted'],
+            'open_connections': sum(len(connections) for connections in _pool.values()),
+        }
+
+
+def reset_connection_stats():
+    """Reset the pool counters."""
+    with _pool_lock:
+        for key in _stats:
+            _stats[key] = 0
@@ -1,293 +1,132 @@
-import sqlite3
-import pandas as pd
-from datetime import datetime
 import streamlit as st
 
-def init_db():
-    """Initialize the database with required tables."""
-    conn = sqlite3.connect('tasks.db')
-    c = conn.cursor()
-    
-    # Check if tasks table exists
-    c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='tasks'")
-    table_exists = c.fetchone() is not None
-    
-    if not table_exists:
-        # Create table with username field
-        c.execute('''CREATE TABLE IF NOT EXISTS tasks
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      title TEXT NOT NULL,
-                      description TEXT,
-                      status TEXT DEFAULT 'To Do',
-                      priority TEXT,
-                      created_date TEXT,
-                      due_date TEXT,
-                      due_time TEXT,
-                      position INTEGER,
-                      labels TEXT,
-                      parent_id INTEGER,
-                      last_updated TEXT,
-                      username TEXT,
-                      FOREIGN KEY (parent_id) REFERENCES tasks(id) ON DELETE CASCADE)''')
-    else:
-        # Check if username column exists and add it if not
-        c.execute("PRAGMA table_info(tasks)")
-        columns = [column[1] for column in c.fetchall()]
-        if 'username' not in columns:
-            c.execute("ALTER TABLE tasks ADD COLUMN username TEXT")
-            print("Added username column to tasks table")
-    
-    conn.commit()
-    conn.close()
+# The data layer lives in repository.py, storage.py and archive.py; this module wraps it
+# for the user logged in to the Streamlit session and re-exports what app.py needs
+from repository import TaskFilter, COLUMN_PAGE_SIZE, init_db
+from storage import get_repository, get_report_repository, get_unmigrated_users
+import archive
+
+__all__ = [
+    'TaskFilter', 'COLUMN_PAGE_SIZE', 'init_db', 'get_unmigrated_users',
+    'current_repository', 'current_report_repository', 'get_counts',
+    'add_task', 'get_tasks', 'get_column_page', 'get_task_counts', 'get_tasks_since',
+    'search_tasks', 'get_tasks_by_label', 'get_label_counts', 'get_subtasks',
+    'get_task_tree', 'get_task_summaries', 'get_child_index',
+    'update_task', 'update_task_status', 'delete_task', 'move_task_to_index',
+    'bulk_add_tasks', 'bulk_update_status', 'bulk_update_fields', 'bulk_delete',
+    'get_cached_tasks', 'get_archived_tasks', 'search_archive', 'restore_archived_task',
+]
+
+def current_repository():
+    """Return a repository on the configured storage backend for the user logged in to this session."""
+    # Get current username from session state
+    username = st.session_state.username if hasattr(st.session_state, 'username') else None
+    return get_repository(username)
+
+def current_report_repository():
+    """Return a read-only repository on the analytics replica for the user logged in to this session."""
+    username = st.session_state.username if hasattr(st.session_state, 'username') else None
+    return get_report_repository(username)
+
+def get_counts():
+    """Return total, per-status, per-priority, overdue and due-soon counts for the current user."""
+    return current_repository().get_counts()
 
 def add_task(title, description, status, priority, due_date, due_time, labels="", parent_id=None):
     """Add a new task to the database."""
-    conn = sqlite3.connect('tasks.db')
-    c = conn.cursor()
-    
-    try:
-        # Get current username from session state
-        username = st.session_state.username if hasattr(st.session_state, 'username') else None
-        
-        # Get the maximum position for the current status and user
-        if username:
-            c.execute('SELECT MAX(position) FROM tasks WHERE status = ? AND username = ?', (status, username))
-        else:
-            c.execute('SELECT MAX(position) FROM tasks WHERE status = ?', (status,))
-        max_pos = c.fetchone()[0]
-        position = 1 if max_pos is None else max_pos + 1
-        
-        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Format the due date and time
-        due_date_str = due_date if isinstance(due_date, str) else due_date.strftime('%Y-%m-%d')
-        due_time_str = due_time if isinstance(due_time, str) else due_time.strftime('%H:%M')
-        
-        c.execute('''INSERT INTO tasks 
-                    (title, description, status, priority, created_date, due_date, due_time, position, labels, parent_id, last_updated, username)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                (title, description, status, priority, now, due_date_str, due_time_str, position, labels, parent_id, now, username))
-        
-        task_id = c.lastrowid
-        conn.commit()
-        return task_id
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    return current_repository().add_task(title, description, status, priority, due_date, due_time, labels, parent_id)
+
+def get_tasks(filters=None):
+    """Retrieve tasks for the current user, optionally narrowed by a TaskFilter."""
+    return current_repository().get_tasks(filters)
 
-def get_tasks():
-    """Retrieve all tasks from the database for the current user."""
-    conn = sqlite3.connect('tasks.db')
-    try:
-        # Get current username from session state
-        username = st.session_state.username if hasattr(st.session_state, 'username') else None
-        
-        if username:
-            # Filter tasks by username
-            df = pd.read_sql_query('SELECT * FROM tasks WHERE username = ? OR username IS NULL', conn, params=[username])
-        else:
-            # If no user is logged in, show all tasks (or none, depending on your security model)
-            df = pd.read_sql_query('SELECT * FROM tasks', conn)
-        
-        # Handle empty dataframe case
-        if df.empty:
-            return df
-            
-        # Convert due_date to datetime for proper sorting
-        df['due_date'] = pd.to_datetime(df['due_date'], errors='coerce')
-        df['due_time'] = df['due_time'].fillna('')
-        
-        # Create a combined datetime column for sorting
-        df['sort_datetime'] = df.apply(
-            lambda x: pd.to_datetime(f"{x['due_date'].strftime('%Y-%m-%d')} {x['due_time']}")
-            if pd.notna(x['due_date']) and x['due_time']
-            else (x['due_date'] if pd.notna(x['due_date']) else pd.Timestamp.max), 
-            axis=1
-        )
-        
-        # Sort the dataframe
-        df = df.sort_values(
-            by=['status', 'sort_datetime'],
-            key=lambda x: pd.Categorical(x, categories=['To Do', 'In Progress', 'Blocked', 'Done'])
-            if x.name == 'status' else x
-        )
-        
-        # Format due_date back to string for display
-        df['due_date'] = df['due_date'].dt.strftime('%Y-%m-%d')
-        
-        return df
-    except Exception as e:
-        print(f"Error retrieving tasks: {str(e)}")
-        return pd.DataFrame()
-    finally:
-        conn.close()
+def get_column_page(status, after_key=None, limit=COLUMN_PAGE_SIZE, filters=None):
+    """Return one page of a Kanban column and the key that starts the next page."""
+    return current_repository().get_column_page(status, after_key, limit, filters)
+
+def get_task_counts(filters=None):
+    """Return total, overdue and per-status counts for the filtered board without loading rows."""
+    return current_repository().get_task_counts(filters)
+
+def get_tasks_since(version, filters=None):
+    """Return the tasks inserted, updated or deleted after a change-log version."""
+    return current_repository().get_tasks_since(version, filters)
+
+def search_tasks(query, limit=50):
+    """Full-text search over title, description and labels, best matches first."""
+    return current_repository().search_tasks(query, limit)
+
+def get_tasks_by_label(label):
+    """Retrieve the current user's tasks that carry the given label."""
+    return current_repository().get_tasks_by_label(label)
+
+def get_label_counts():
+    """Return a DataFrame of label names and task counts for the current user."""
+    return current_repository().get_label_counts()
 
 def get_subtasks(task_id):
     """Retrieve subtasks for a given parent task ID."""
-    conn = sqlite3.connect('tasks.db')
-    try:
-        # Get current username from session state
-        username = st.session_state.username if hasattr(st.session_state, 'username') else None
-        
-        if username:
-            # Filter by username and parent_id
-            df = pd.read_sql_query('SELECT * FROM tasks WHERE parent_id = ? AND (username = ? OR username IS NULL)', 
-                                  conn, params=[task_id, username])
-        else:
-            df = pd.read_sql_query('SELECT * FROM tasks WHERE parent_id = ?', conn, params=[task_id])
-        return df
-    except Exception as e:
-        print(f"Error retrieving subtasks: {str(e)}")
-        return pd.DataFrame()
-    finally:
-        conn.close()
+    return current_repository().get_subtasks(task_id)
+
+def get_task_tree(root_ids=None, max_depth=None):
+    """Retrieve whole parent/child task hierarchies in one recursive query."""
+    return current_repository().get_task_tree(root_ids, max_depth)
+
+def get_task_summaries(task_ids):
+    """Return {task_id: (title, status)} for the given tasks of the current user."""
+    return current_repository().get_task_summaries(task_ids)
+
+def get_child_index():
+    """Return a cached {parent_id: [child_id, ...]} map of the current user's tasks."""
+    return current_repository().get_child_index()
 
 def update_task(task_id, title, description, status, priority, due_date, due_time, labels=""):
     """Update an existing task in the database."""
-    conn = sqlite3.connect('tasks.db')
-    c = conn.cursor()
-    
-    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-    # Format the due date and time
-    due_date_str = due_date if isinstance(due_date, str) else due_date.strftime('%Y-%m-%d')
-    due_time_str = due_time if isinstance(due_time, str) else due_time.strftime('%H:%M')
-    
-    # Get current username from session state to ensure users can only update their own tasks
-    username = st.session_state.username if hasattr(st.session_state, 'username') else None
-    
-    if username:
-        # Only update if the task belongs to the user or has no user
-        c.execute('''UPDATE tasks 
-                    SET title = ?, 
-                        description = ?, 
-                        status = ?,
-                        priority = ?, 
-                        due_date = ?,
-                        due_time = ?,
-                        labels = ?,
-                        last_updated = ?,
-                        username = ?
-                    WHERE id = ? AND (username = ? OR username IS NULL)''',
-                (title, description, status, priority, due_date_str, due_time_str, labels, now, username, task_id, username))
-    else:
-        # Standard update without user restriction (should be limited in real-world apps)
-        c.execute('''UPDATE tasks 
-                    SET title = ?, 
-                        description = ?, 
-                        status = ?,
-                        priority = ?, 
-                        due_date = ?,
-                        due_time = ?,
-                        labels = ?,
-                        last_updated = ?
-                    WHERE id = ?''',
-                (title, description, status, priority, due_date_str, due_time_str, labels, now, task_id))
-    
-    conn.commit()
-    conn.close()
+    return current_repository().update_task(task_id, title, description, status, priority, due_date, due_time, labels)
 
 def update_task_status(task_id, new_status):
     """Update a task's status and position in the database."""
-    conn = sqlite3.connect('tasks.db')
-    c = conn.cursor()
-    
-    # Get current username from session state
-    username = st.session_state.username if hasattr(st.session_state, 'username') else None
-    
-    # Get the old status and position
-    if username:
-        c.execute('SELECT status, position FROM tasks WHERE id = ? AND (username = ? OR username IS NULL)', (task_id, username))
-    else:
-        c.execute('SELECT status, position FROM tasks WHERE id = ?', (task_id,))
-    
-    result = c.fetchone()
-    if not result:
-        conn.close()
-        return  # Task not found or not owned by user
-        
-    old_status, old_position = result
-    
-    # Get the maximum position in the new status column for the current user
-    if username:
-        c.execute('SELECT MAX(position) FROM tasks WHERE status = ? AND (username = ? OR username IS NULL)', (new_status, username))
-    else:
-        c.execute('SELECT MAX(position) FROM tasks WHERE status = ?', (new_status,))
-    
-    max_pos = c.fetchone()[0]
-    new_position = 1 if max_pos is None else max_pos + 1
-    
-    # Update positions of other tasks in the old status column
-    if username:
-        c.execute('UPDATE tasks SET position = position - 1 WHERE status = ? AND position > ? AND (username = ? OR username IS NULL)', 
-                 (old_status, old_position, username))
-    else:
-        c.execute('UPDATE tasks SET position = position - 1 WHERE status = ? AND position > ?', 
-                 (old_status, old_position))
-    
-    # Update the task's status and position
-    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-    if username:
-        # Ensure task ownership or unassigned
-        c.execute('UPDATE tasks SET status = ?, position = ?, last_updated = ?, username = ? WHERE id = ? AND (username = ? OR username IS NULL)', 
-                 (new_status, new_position, now, username, task_id, username))
-    else:
-        c.execute('UPDATE tasks SET status = ?, position = ?, last_updated = ? WHERE id = ?', 
-                 (new_status, new_position, now, task_id))
-    
-    conn.commit()
-    conn.close()
+    return current_repository().update_task_status(task_id, new_status)
 
 def delete_task(task_id):
     """Delete a task from the database."""
-    conn = sqlite3.connect('tasks.db')
-    c = conn.cursor()
-    
-    # Get current username from session state
+    return current_repository().delete_task(task_id)
+
+def move_task_to_index(task_id, status, index):
+    """Move a task to a zero-based index in position order (not the due-date order the board shows)."""
+    return current_repository().move_task_to_index(task_id, status, index)
+
+def bulk_add_tasks(tasks):
+    """Insert many tasks in one transaction and return their new IDs."""
+    return current_repository().bulk_add_tasks(tasks)
+
+def bulk_update_status(task_ids, new_status):
+    """Move many tasks to a new status column in one transaction."""
+    return current_repository().bulk_update_status(task_ids, new_status)
+
+def bulk_update_fields(task_ids, **fields):
+    """Set the same field values on many tasks in one transaction."""
+    return current_repository().bulk_update_fields(task_ids, **fields)
+
+def bulk_delete(task_ids):
+    """Delete many tasks in one transaction."""
+    return current_repository().bulk_delete(task_ids)
+
+def get_cached_tasks(filters=None):
+    """Return the current user's tasks from the process-wide cache."""
+    return current_repository().get_cached_tasks(filters)
+
+def get_archived_tasks(filters=None, limit=None, from_replica=False):
+    """Return the current user's archived tasks, newest archive first."""
     username = st.session_state.username if hasattr(st.session_state, 'username') else None
-    
-    try:
-        # Get the status and position of the task to be deleted
-        if username:
-            c.execute('SELECT status, position FROM tasks WHERE id = ? AND (username = ? OR username IS NULL)', (task_id, username))
-        else:
-            c.execute('SELECT status, position FROM tasks WHERE id = ?', (task_id,))
-        
-        result = c.fetchone()
-        if not result:
-            return  # Task not found or not owned by user
-            
-        status, position = result
-        
-        # Update positions of remaining tasks
-        if username:
-            c.execute('UPDATE tasks SET position = position - 1 WHERE status = ? AND position > ? AND (username = ? OR username IS NULL)', 
-                    (status, position, username))
-        else:
-            c.execute('UPDATE tasks SET position = position - 1 WHERE status = ? AND position > ?', 
-                    (status, position))
-        
-        # Delete the task
-        if username:
-            c.execute('DELETE FROM tasks WHERE id = ? AND (username = ? OR username IS NULL)', (task_id, username))
-        else:
-            c.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
-        
-        conn.commit()
-    except Exception as e:
-        print(f"Error deleting task: {str(e)}")
-        conn.rollback()
-    finally:
-        conn.close()
+    return archive.get_archived_tasks(username, filters, limit, from_replica)
 
-# Cache functionality
-def get_cached_tasks():
-    """Return all tasks from the database (for caching)."""
-    return get_tasks()
+def search_archive(query, limit=50):
+    """Search the current user's archived tasks by title, description or labels."""
+    username = st.session_state.username if hasattr(st.session_state, 'username') else None
+    return archive.search_archive(username, query, limit)
 
-def get_cached_analytics(tasks):
-    """Generate analytics from cached tasks."""
-    return tasks 
\ No newline at end of file
+def restore_archived_task(task_id):
+    """Move one of the current user's archived tasks back to its status column."""
+    username = st.session_state.username if hasattr(st.session_state, 'username') else None
+    return archive.restore_archived_task(username, task_id)
@@ -0,0 +1,183 @@
+import sys
+import threading
+import time
+
+import pandas as pd
+
+from connection import get_connection
+from repository import init_db
+from migrations import STATUS_CODES
+from sharding import shard_for, list_shards, open_shard, fan_out
+from replica import replica_path
+from write_queue import run_write_to, submit_write_to
+
+IN_PROGRESS = STATUS_CODES['In Progress']
+BLOCKED = STATUS_CODES['Blocked']
+DONE = STATUS_CODES['Done']
+
+# status_events folded per write request
+EVENT_BATCH_SIZE = 5000
+
+# Percentiles reported by get_flow_metrics()
+PERCENTILES = (50, 85, 95)
+
+STATE_COLUMNS = ('username', 'created_at', 'started_at', 'status', 'status_since', 'blocked_seconds')
+
+# refresh_flow_metrics() queues new folds at most this often (seconds)
+FLOW_REFRESH_INTERVAL = 60
+
+_last_refresh = 0.0
+_pending_folds = set()
+_refresh_lock = threading.Lock()
+
+
+def _fold_events_op(c, batch_size):
+    """Fold the next batch of status_events into flow_task_state and flow_samples.
+
+    Runs on the writer thread, so the events, the derived rows and the
+    progress marker always commit together. Returns the number of events
+    processed.
+    """
+    c.execute('SELECT last_event_id FROM flow_metrics_progress WHERE id = 1')
+    last_id = c.fetchone()[0]
+    c.execute('''SELECT id, task_id, username, from_status, to_status, at FROM status_events
+                 WHERE id > ? ORDER BY id LIMIT ?''', (last_id, batch_size))
+    events = c.fetchall()
+    if not events:
+        return 0
+
+    # Load the running state of just the tasks in this batch
+    task_ids = list({event[1] for event in events})
+    placeholders = ', '.join('?' * len(task_ids))
+    c.execute(f'SELECT task_id, {", ".join(STATE_COLUMNS)} FROM flow_task_state WHERE task_id IN ({placeholders})',
+              task_ids)
+    states = {row[0]: dict(zip(STATE_COLUMNS, row[1:])) for row in c.fetchall()}
+    samples = {}
+
+    for _, task_id, username, from_status, to_status, at in events:
+        state = states.get(task_id)
+        # A task restored from the archive logs a creation event but keeps its history
+        restored = state is not None and from_status is None
+        if state is None:
+            state = states[task_id] = {'username': username, 'created_at': at, 'started_at': None,
+                                       'status': None, 'status_since': at, 'blocked_seconds': 0}
+        elif state['status'] == BLOCKED:
+            state['blocked_seconds'] += max(at - state['status_since'], 0)
+
+        state['username'] = username
+        if to_status == IN_PROGRESS and state['started_at'] is None:
+            state['started_at'] = at
+        if to_status == DONE and not restored:
+            samples[task_id] = (username, at, at - state['created_at'],
+                                at - state['started_at'] if state['started_at'] is not None else None,
+                                state['blocked_seconds'])
+        state['status'] = to_status
+        state['status_since'] = at
+
+    c.executemany(f'''INSERT OR REPLACE INTO flow_task_state (task_id, {", ".join(STATE_COLUMNS)})
+                      VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                  [(task_id,) + tuple(state[column] for column in STATE_COLUMNS) for task_id, state in states.items()])
+    c.executemany('''INSERT OR REPLACE INTO flow_samples
+                     (task_id, username, completed_at, lead_seconds, cycle_seconds, blocked_seconds)
+                     VALUES (?, ?, ?, ?, ?, ?)''',
+                  [(task_id,) + sample for task_id, sample in samples.items()])
+    c.execute('UPDATE flow_metrics_progress SET last_event_id = ? WHERE id = 1', (events[-1][0],))
+    return len(events)
+
+
+def update_flow_metrics(batch_size=EVENT_BATCH_SIZE):
+    """Process status_events added since the last run on every shard; returns the number of events processed.
+
+    Only new events are read, so the cost follows the number of moves
+    since the last call rather than the size of the history.
+    """
+    processed = 0
+    for db_path in list_shards():
+        db_path = open_shard(db_path)
+        while True:
+            try:
+                count = run_write_to(db_path, _fold_events_op, batch_size)
+            except Exception as e:
+                print(f"Error updating flow metrics: {str(e)}")
+                break
+            processed += count
+            if count < batch_size:
+                break
+    return processed
+
+
+def _queue_fold(db_path, batch_size):
+    """Queue one fold on db_path's writer, and the next one if this batch was full."""
+    def done(future):
+        try:
+            count = future.result()
+        except Exception as e:
+            print(f"Error updating flow metrics: {str(e)}")
+            count = 0
+        if count >= batch_size:
+            _queue_fold(db_path, batch_size)
+        else:
+            with _refresh_lock:
+                _pending_folds.discard(db_path)
+
+    submit_write_to(db_path, _fold_events_op, batch_size).add_done_callback(done)
+
+
+def refresh_flow_metrics(batch_size=EVENT_BATCH_SIZE):
+    """Queue folding of new status events on every shard unless that ran recently.
+
+    Called when the analytics section renders; the folds are queued without
+    waiting, like refresh_snapshots(), so the page never waits behind other
+    writes. A shard whose previous fold is still queued is skipped.
+    """
+    global _last_refresh
+    with _refresh_lock:
+        now = time.monotonic()
+        if _last_refresh and now - _last_refresh < FLOW_REFRESH_INTERVAL:
+            return
+        _last_refresh = now
+        shards = [db_path for db_path in map(open_shard, list_shards()) if db_path not in _pending_folds]
+        _pending_folds.update(shards)
+    for db_path in shards:
+        _queue_fold(db_path, batch_size)
+
+
+def get_flow_metrics(username, days=90):
+    """Return lead time, cycle time and time-in-Blocked percentiles (in days) for recently finished tasks.
+
+    Lead time runs from creation to Done, cycle time from the first move to
+    In Progress to Done. The result maps each metric to {percentile: days}
+    plus 'count', the number of tasks finished in the period. A username
+    of None covers every shard. Samples are read from the replicas.
+    """
+    since = int(time.time()) - days * 86400
+    try:
+        if username:
+            query = '''SELECT lead_seconds, cycle_seconds, blocked_seconds FROM flow_samples
+                       WHERE (username = ? OR username IS NULL) AND completed_at >= ?'''
+            samples = pd.read_sql_query(query, get_connection(replica_path(shard_for(username))), params=(username, since))
+        else:
+            query = 'SELECT lead_seconds, cycle_seconds, blocked_seconds FROM flow_samples WHERE completed_at >= ?'
+            samples = pd.concat(fan_out(lambda db_path: pd.read_sql_query(query, get_connection(replica_path(db_path)),
+                                                                         params=(since,))).values(),
+                                ignore_index=True)
+    except Exception as e:
+        print(f"Error reading flow metrics: {str(e)}")
+        samples = pd.DataFrame(columns=['lead_seconds', 'cycle_seconds', 'blocked_seconds'])
+
+    metrics = {'count': len(samples)}
+    for name, column in (('lead_time', 'lead_seconds'), ('cycle_time', 'cycle_seconds'),
+                         ('blocked_time', 'blocked_seconds')):
+        values = samples[column].dropna() / 86400
+        metrics[name] = {p: float(values.quantile(p / 100)) if not values.empty else None for p in PERCENTILES}
+    return metrics
+
+
+if __name__ == '__main__':
+    init_db()
+    print(f"Processed {update_flow_metrics()} status events")
+    metrics = get_flow_metrics(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(f"Finished tasks: {metrics['count']}")
+    for name in ('lead_time', 'cycle_time', 'blocked_time'):
+        print(f"{name}: " + ", ".join(
+            f"p{p}={value:.1f}d" if value is not None else f"p{p}=-" for p, value in metrics[name].items()))
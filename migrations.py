@@ -0,0 +1,479 @@
+import sys
+from datetime import datetime
+
+from connection import get_connection, TASKS_DB
+from validation import split_labels
+
+# Distance between neighbouring card positions in a freshly numbered column
+POSITION_GAP = 1024
+
+# SQL for the UTC epoch of a task's local due date and time (midnight when no time is set)
+DUE_AT_EXPRESSION = "CAST(strftime('%s', due_date || ' ' || COALESCE(NULLIF(due_time, ''), '00:00'), 'utc') AS INTEGER)"
+
+# Compact status codes used in status_events (0 for anything else)
+STATUS_CODES = {'To Do': 1, 'In Progress': 2, 'Blocked': 3, 'Done': 4}
+
+# Board sort key within a column: due_at, with undated tasks last. Queries must
+# use this exact expression for SQLite to match the expression index.
+DUE_SORT_KEY = "IFNULL(due_at, 9223372036854775807)"
+
+
+def _create_tasks_table(c):
+    """Create the tasks table, or add the username column to an older one."""
+    # Check if tasks table exists
+    c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='tasks'")
+    table_exists = c.fetchone() is not None
+
+    if not table_exists:
+        # Create table with username field
+        c.execute('''CREATE TABLE IF NOT EXISTS tasks
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      title TEXT NOT NULL,
+                      description TEXT,
+                      status TEXT DEFAULT 'To Do',
+                      priority TEXT,
+                      created_date TEXT,
+                      due_date TEXT,
+                      due_time TEXT,
+                      position INTEGER,
+                      labels TEXT,
+                      parent_id INTEGER,
+                      last_updated TEXT,
+                      username TEXT,
+                      FOREIGN KEY (parent_id) REFERENCES tasks(id) ON DELETE CASCADE)''')
+    else:
+        # Check if username column exists and add it if not
+        c.execute("PRAGMA table_info(tasks)")
+        columns = [column[1] for column in c.fetchall()]
+        if 'username' not in columns:
+            c.execute("ALTER TABLE tasks ADD COLUMN username TEXT")
+            print("Added username column to tasks table")
+
+
+def _create_task_indexes(c):
+    """Add secondary indexes for the per-user board queries."""
+    # MAX(position) lookups and position shifts within a status column
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_status_position ON tasks (username, status, position)")
+    # Subtask lookups
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_parent ON tasks (parent_id)")
+    # Per-user task loading and due date filters
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_due_date ON tasks (username, due_date)")
+    c.execute("ANALYZE tasks")
+
+
+def fts5_available(c):
+    """Return True if this SQLite build includes the FTS5 extension."""
+    c.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+    if c.fetchone()[0]:
+        return True
+    # Some builds load FTS5 without advertising the compile option
+    try:
+        c.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        c.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except Exception:
+        return False
+
+
+def _create_search_index(c):
+    """Add an FTS5 index over title, description and labels, kept in sync by triggers."""
+    if not fts5_available(c):
+        print("FTS5 is not available; task search will use LIKE scans")
+        return
+
+    # External-content table: the index stores tokens only, rows live in tasks
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5
+                 (title, description, labels,
+                  content='tasks', content_rowid='id',
+                  tokenize='unicode61 remove_diacritics 2',
+                  prefix='2 3')''')
+
+    c.execute('''CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+                     INSERT INTO tasks_fts (rowid, title, description, labels)
+                     VALUES (new.id, new.title, new.description, new.labels);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+                     INSERT INTO tasks_fts (tasks_fts, rowid, title, description, labels)
+                     VALUES ('delete', old.id, old.title, old.description, old.labels);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF title, description, labels ON tasks BEGIN
+                     INSERT INTO tasks_fts (tasks_fts, rowid, title, description, labels)
+                     VALUES ('delete', old.id, old.title, old.description, old.labels);
+                     INSERT INTO tasks_fts (rowid, title, description, labels)
+                     VALUES (new.id, new.title, new.description, new.labels);
+                 END''')
+
+    # Index the tasks that already exist
+    c.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+
+
+def _create_label_tables(c):
+    """Normalize comma-joined task labels into labels and task_labels tables."""
+    c.execute('''CREATE TABLE IF NOT EXISTS labels
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  name TEXT NOT NULL UNIQUE COLLATE NOCASE)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS task_labels
+                 (task_id INTEGER NOT NULL,
+                  label_id INTEGER NOT NULL,
+                  PRIMARY KEY (task_id, label_id),
+                  FOREIGN KEY (task_id) REFERENCES tasks(id) ON DELETE CASCADE,
+                  FOREIGN KEY (label_id) REFERENCES labels(id)) WITHOUT ROWID''')
+    # Label -> tasks lookups
+    c.execute("CREATE INDEX IF NOT EXISTS idx_task_labels_label ON task_labels (label_id, task_id)")
+
+    # Foreign keys are not enforced on every connection, so clean up explicitly
+    c.execute('''CREATE TRIGGER IF NOT EXISTS task_labels_delete AFTER DELETE ON tasks BEGIN
+                     DELETE FROM task_labels WHERE task_id = old.id;
+                 END''')
+
+    # Split the existing label strings
+    c.execute("SELECT id, labels FROM tasks WHERE labels IS NOT NULL AND labels != ''")
+    for task_id, labels in c.fetchall():
+        set_task_labels(c, task_id, labels)
+
+
+def _space_out_positions(c):
+    """Renumber every status column with sparse positions (POSITION_GAP apart)."""
+    c.execute('''SELECT id, ROW_NUMBER() OVER (PARTITION BY username, status
+                                              ORDER BY position IS NULL, position, id)
+                 FROM tasks''')
+    c.executemany("UPDATE tasks SET position = ? WHERE id = ?",
+                  [(rank * POSITION_GAP, task_id) for task_id, rank in c.fetchall()])
+
+
+def _add_due_at_column(c):
+    """Add an indexed due_at column (UTC epoch seconds) and backfill it."""
+    c.execute("PRAGMA table_info(tasks)")
+    columns = [column[1] for column in c.fetchall()]
+    if 'due_at' not in columns:
+        c.execute("ALTER TABLE tasks ADD COLUMN due_at INTEGER")
+
+    c.execute(f"UPDATE tasks SET due_at = {DUE_AT_EXPRESSION} WHERE due_date IS NOT NULL AND due_date != ''")
+
+    # Range filters and sorting now run on due_at, which makes the due_date index redundant
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_due_at ON tasks (username, due_at)")
+    c.execute("DROP INDEX IF EXISTS idx_tasks_user_due_date")
+    c.execute("ANALYZE tasks")
+
+
+def _create_change_log(c):
+    """Add an append-only task_changes log, written by triggers on tasks."""
+    # AUTOINCREMENT keeps versions increasing even after old rows are pruned
+    c.execute('''CREATE TABLE IF NOT EXISTS task_changes
+                 (version INTEGER PRIMARY KEY AUTOINCREMENT,
+                  task_id INTEGER NOT NULL,
+                  op TEXT NOT NULL,
+                  username TEXT,
+                  changed_at TEXT DEFAULT CURRENT_TIMESTAMP)''')
+
+    c.execute('''CREATE TRIGGER IF NOT EXISTS task_changes_insert AFTER INSERT ON tasks BEGIN
+                     INSERT INTO task_changes (task_id, op, username) VALUES (new.id, 'insert', new.username);
+                 END''')
+    # A change of owner is logged for both users so the old owner sees the task leave
+    c.execute('''CREATE TRIGGER IF NOT EXISTS task_changes_update AFTER UPDATE ON tasks BEGIN
+                     INSERT INTO task_changes (task_id, op, username) VALUES (new.id, 'update', new.username);
+                     INSERT INTO task_changes (task_id, op, username)
+                     SELECT old.id, 'update', old.username WHERE old.username IS NOT new.username;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS task_changes_delete AFTER DELETE ON tasks BEGIN
+                     INSERT INTO task_changes (task_id, op, username) VALUES (old.id, 'delete', old.username);
+                 END''')
+
+
+def _create_column_page_index(c):
+    """Index each user's status columns in board order for keyset pagination."""
+    c.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_user_status_due ON tasks (username, status, {DUE_SORT_KEY}, id)")
+    c.execute("ANALYZE tasks")
+
+
+def _create_archive_table(c):
+    """Add tasks_archive, the cold store for old Done tasks."""
+    # Archived rows keep their original id so they can be restored unchanged
+    c.execute('''CREATE TABLE IF NOT EXISTS tasks_archive
+                 (id INTEGER PRIMARY KEY,
+                  title TEXT NOT NULL,
+                  description TEXT,
+                  status TEXT,
+                  priority TEXT,
+                  created_date TEXT,
+                  due_date TEXT,
+                  due_time TEXT,
+                  due_at INTEGER,
+                  position INTEGER,
+                  labels TEXT,
+                  parent_id INTEGER,
+                  last_updated TEXT,
+                  username TEXT,
+                  archived_date TEXT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_archive_user_updated ON tasks_archive (username, last_updated)")
+    # Finding Done tasks old enough to archive
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_updated ON tasks (status, last_updated)")
+
+
+def _create_task_counters(c):
+    """Add task_counters, per-user status and priority counts kept current by triggers."""
+    # Tasks without a username (or status/priority) are counted under ''
+    # because NULLs never conflict in a primary key
+    c.execute('''CREATE TABLE IF NOT EXISTS task_counters
+                 (username TEXT NOT NULL,
+                  kind TEXT NOT NULL,
+                  value TEXT NOT NULL,
+                  count INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (username, kind, value)) WITHOUT ROWID''')
+
+    c.execute("DELETE FROM task_counters")
+    for kind in ('status', 'priority'):
+        c.execute(f'''INSERT INTO task_counters (username, kind, value, count)
+                      SELECT COALESCE(username, ''), '{kind}', COALESCE({kind}, ''), COUNT(*)
+                      FROM tasks GROUP BY 1, 3''')
+
+    def bump(row, kind, delta):
+        return (f"INSERT INTO task_counters (username, kind, value, count) "
+                f"VALUES (COALESCE({row}.username, ''), '{kind}', COALESCE({row}.{kind}, ''), {delta}) "
+                f"ON CONFLICT (username, kind, value) DO UPDATE SET count = count + ({delta});")
+
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS task_counters_insert AFTER INSERT ON tasks BEGIN
+                     {bump('new', 'status', 1)}
+                     {bump('new', 'priority', 1)}
+                 END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS task_counters_delete AFTER DELETE ON tasks BEGIN
+                     {bump('old', 'status', -1)}
+                     {bump('old', 'priority', -1)}
+                 END''')
+    # Position and text edits are by far the most common updates and leave the counters alone
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS task_counters_update AFTER UPDATE OF status, priority, username ON tasks
+                 WHEN old.status IS NOT new.status OR old.priority IS NOT new.priority
+                      OR old.username IS NOT new.username
+                 BEGIN
+                     {bump('old', 'status', -1)}
+                     {bump('old', 'priority', -1)}
+                     {bump('new', 'status', 1)}
+                     {bump('new', 'priority', 1)}
+                 END''')
+
+
+def _create_snapshot_table(c):
+    """Add daily_status_snapshot, one row per user, day and status, for trend charts."""
+    # Tasks without a username are stored under '', as in task_counters
+    c.execute('''CREATE TABLE IF NOT EXISTS daily_status_snapshot
+                 (username TEXT NOT NULL,
+                  snapshot_date TEXT NOT NULL,
+                  status TEXT NOT NULL,
+                  count INTEGER NOT NULL,
+                  PRIMARY KEY (username, snapshot_date, status)) WITHOUT ROWID''')
+
+
+def _status_code_sql(column):
+    """Return SQL mapping a status column to its STATUS_CODES value."""
+    return "CASE " + column + " " + " ".join(
+        f"WHEN '{status}' THEN {code}" for status, code in STATUS_CODES.items()
+    ) + " ELSE 0 END"
+
+
+def _create_status_events(c):
+    """Add status_events, an append-only log of status transitions written by triggers."""
+    # from_status is NULL for the event that records a task's creation
+    c.execute('''CREATE TABLE IF NOT EXISTS status_events
+                 (id INTEGER PRIMARY KEY,
+                  task_id INTEGER NOT NULL,
+                  username TEXT,
+                  from_status INTEGER,
+                  to_status INTEGER NOT NULL,
+                  at INTEGER NOT NULL)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_status_events_task ON status_events (task_id, id)")
+
+    # History before this migration is estimated: created as To Do, moved to the current status at last_updated
+    c.execute("DELETE FROM status_events")
+    c.execute('''INSERT INTO status_events (task_id, username, from_status, to_status, at)
+                 SELECT id, username, NULL, 1, CAST(strftime('%s', created_date, 'utc') AS INTEGER)
+                 FROM tasks WHERE created_date IS NOT NULL''')
+    c.execute(f'''INSERT INTO status_events (task_id, username, from_status, to_status, at)
+                  SELECT id, username, 1, {_status_code_sql('status')},
+                         CAST(strftime('%s', COALESCE(last_updated, created_date), 'utc') AS INTEGER)
+                  FROM tasks WHERE status IS NOT 'To Do' AND created_date IS NOT NULL''')
+
+    # Triggers put each event in the same transaction as the write that caused it
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS status_events_insert AFTER INSERT ON tasks BEGIN
+                      INSERT INTO status_events (task_id, username, from_status, to_status, at)
+                      VALUES (new.id, new.username, NULL, {_status_code_sql('new.status')},
+                              CAST(strftime('%s', 'now') AS INTEGER));
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS status_events_update AFTER UPDATE OF status ON tasks
+                  WHEN old.status IS NOT new.status
+                  BEGIN
+                      INSERT INTO status_events (task_id, username, from_status, to_status, at)
+                      VALUES (new.id, new.username, {_status_code_sql('old.status')}, {_status_code_sql('new.status')},
+                              CAST(strftime('%s', 'now') AS INTEGER));
+                  END''')
+
+
+def _create_flow_metric_tables(c):
+    """Add the tables flow_metrics.py folds status_events into."""
+    # Running state of each task: when it was created, first started and how long it was blocked
+    c.execute('''CREATE TABLE IF NOT EXISTS flow_task_state
+                 (task_id INTEGER PRIMARY KEY,
+                  username TEXT,
+                  created_at INTEGER,
+                  started_at INTEGER,
+                  status INTEGER,
+                  status_since INTEGER,
+                  blocked_seconds INTEGER NOT NULL DEFAULT 0)''')
+    # One sample per finished task, from its latest move to Done
+    c.execute('''CREATE TABLE IF NOT EXISTS flow_samples
+                 (task_id INTEGER PRIMARY KEY,
+                  username TEXT,
+                  completed_at INTEGER NOT NULL,
+                  lead_seconds INTEGER,
+                  cycle_seconds INTEGER,
+                  blocked_seconds INTEGER)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_flow_samples_user_completed ON flow_samples (username, completed_at)")
+    c.execute('''CREATE TABLE IF NOT EXISTS flow_metrics_progress
+                 (id INTEGER PRIMARY KEY CHECK (id = 1),
+                  last_event_id INTEGER NOT NULL)''')
+    c.execute("INSERT OR IGNORE INTO flow_metrics_progress (id, last_event_id) VALUES (1, 0)")
+
+
+def set_task_labels(c, task_id, labels):
+    """Replace the task_labels rows of a task with the labels in a comma-joined string."""
+    c.execute("DELETE FROM task_labels WHERE task_id = ?", (task_id,))
+    for name in split_labels(labels):
+        c.execute("INSERT OR IGNORE INTO labels (name) VALUES (?)", (name,))
+        c.execute("SELECT id FROM labels WHERE name = ?", (name,))
+        label_id = c.fetchone()[0]
+        c.execute("INSERT OR IGNORE INTO task_labels (task_id, label_id) VALUES (?, ?)", (task_id, label_id))
+
+
+# Ordered list of (version, description, migration function)
+MIGRATIONS = [
+    (1, "Create tasks table", _create_tasks_table),
+    (2, "Add indexes for hot task queries", _create_task_indexes),
+    (3, "Add full-text search index", _create_search_index),
+    (4, "Normalize task labels", _create_label_tables),
+    (5, "Use sparse card positions", _space_out_positions),
+    (6, "Add due_at epoch column", _add_due_at_column),
+    (7, "Add task change log", _create_change_log),
+    (8, "Add column pagination index", _create_column_page_index),
+    (9, "Add task archive", _create_archive_table),
+    (10, "Add per-user task counters", _create_task_counters),
+    (11, "Add daily status snapshots", _create_snapshot_table),
+    (12, "Add status transition log", _create_status_events),
+    (13, "Add flow metric tables", _create_flow_metric_tables),
+]
+
+
+def get_schema_version(conn):
+    """Return the highest applied migration version (0 for a fresh database)."""
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                    (version INTEGER PRIMARY KEY,
+                     description TEXT,
+                     applied_date TEXT)''')
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(conn, migrations=MIGRATIONS):
+    """Apply all pending migrations, each in its own transaction."""
+    applied = []
+    current_version = get_schema_version(conn)
+
+    for version, description, migrate in migrations:
+        if version <= current_version:
+            continue
+
+        c = conn.cursor()
+        try:
+            # Take the write lock first so concurrent sessions cannot apply the same migration twice
+            c.execute("BEGIN IMMEDIATE")
+            c.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,))
+            if c.fetchone():
+                conn.rollback()
+                continue
+
+            migrate(c)
+
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            c.execute("INSERT INTO schema_version (version, description, applied_date) VALUES (?, ?, ?)",
+                      (version, description, now))
+            conn.commit()
+            applied.append(version)
+        except Exception as e:
+            conn.rollback()
+            print(f"Error applying migration {version} ({description}): {str(e)}")
+            raise e
+
+    return applied
+
+
+# Hot queries issued by database.py, with sample parameters for EXPLAIN QUERY PLAN
+HOT_QUERIES = [
+    ("next position in column",
+     "SELECT MAX(position) FROM tasks WHERE status = ? AND (username = ? OR username IS NULL)",
+     ('To Do', 'user')),
+    ("column in board order",
+     "SELECT id, position FROM tasks WHERE status = ? AND (username = ? OR username IS NULL) ORDER BY position, id",
+     ('To Do', 'user')),
+    ("subtasks of parent",
+     "SELECT * FROM tasks WHERE parent_id = ? AND (username = ? OR username IS NULL)",
+     (1, 'user')),
+    ("tasks for user",
+     "SELECT * FROM tasks WHERE username = ? OR username IS NULL",
+     ('user',)),
+    ("tasks with label",
+     "SELECT task_id FROM task_labels WHERE label_id = (SELECT id FROM labels WHERE name = ?)",
+     ('api',)),
+    ("changes since version",
+     "SELECT task_id FROM task_changes WHERE version > ? AND (username = ? OR username IS NULL)",
+     (0, 'user')),
+    ("column page after key",
+     f"SELECT * FROM tasks WHERE username = ? AND status = ? AND {DUE_SORT_KEY} >= ? "
+     f"AND ({DUE_SORT_KEY}, id) > (?, ?) ORDER BY {DUE_SORT_KEY}, id LIMIT ?",
+     ('user', 'Done', 0, 0, 0, 50)),
+    ("done tasks to archive",
+     "SELECT id FROM tasks WHERE status = 'Done' AND last_updated < ? LIMIT ?",
+     ('2000-01-01 00:00:00', 500)),
+    ("tasks due before time",
+     "SELECT * FROM tasks WHERE (username = ? OR username IS NULL) AND due_at < ?",
+     ('user', 946684800)),
+    ("counters for user",
+     "SELECT kind, value, SUM(count) FROM task_counters WHERE username IN (?, '') GROUP BY kind, value",
+     ('user',)),
+    ("status history for user",
+     "SELECT snapshot_date, status, SUM(count) FROM daily_status_snapshot "
+     "WHERE username IN (?, '') AND snapshot_date >= ? GROUP BY snapshot_date, status",
+     ('user', '2000-01-01')),
+    ("status events after id",
+     "SELECT * FROM status_events WHERE id > ? ORDER BY id LIMIT ?",
+     (0, 5000)),
+    ("flow samples for user",
+     "SELECT * FROM flow_samples WHERE (username = ? OR username IS NULL) AND completed_at >= ?",
+     ('user', 946684800)),
+]
+
+
+def check_query_plans(conn, queries=HOT_QUERIES):
+    """Run EXPLAIN QUERY PLAN for each hot query and report whether it avoids a full table scan."""
+    report = []
+    for name, sql, params in queries:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+        # "SCAN tasks" without an index means every row is visited
+        full_scan = any(step.startswith('SCAN') and 'INDEX' not in step for step in plan)
+        report.append({
+            'name': name,
+            'query': sql,
+            'plan': plan,
+            'uses_index': not full_scan,
+        })
+    return report
+
+
+if __name__ == '__main__':
+    conn = get_connection(sys.argv[1] if len(sys.argv) > 1 else TASKS_DB)
+    apply_migrations(conn)
+    print(f"Schema version: {get_schema_version(conn)}")
+
+    report = check_query_plans(conn)
+    for entry in report:
+        status = "OK  " if entry['uses_index'] else "SCAN"
+        print(f"[{status}] {entry['name']}: {' | '.join(entry['plan'])}")
+
+    sys.exit(0 if all(entry['uses_index'] for entry in report) else 1)
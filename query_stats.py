@@ -0,0 +1,213 @@
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+# Set to False to run queries without timing them
+QUERY_STATS_ENABLED = True
+
+# Queries slower than this (execute plus fetching the rows) go to the slow-query log
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+
+# Rotating slow-query log: file, size per file and number of old files kept
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', 'slow_queries.log')
+SLOW_QUERY_LOG_BYTES = 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 3
+
+# Latencies kept per call site for the percentiles
+LATENCY_SAMPLES = 1000
+
+# Frames from these files are skipped when looking for the calling function
+_SKIPPED_FILES = (os.path.abspath(__file__), os.path.dirname(os.path.abspath(__file__)) + os.sep + 'connection.py')
+_SKIPPED_PACKAGES = (os.sep + 'pandas' + os.sep, os.sep + 'sqlite3' + os.sep)
+
+_stats_lock = threading.Lock()
+_site_stats = {}
+
+_slow_log = None
+_slow_log_lock = threading.Lock()
+
+
+def _call_site():
+    """Return 'module.function' of the first caller outside this module, pandas and sqlite3."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename not in _SKIPPED_FILES and not any(package in filename for package in _SKIPPED_PACKAGES):
+            module = os.path.splitext(os.path.basename(filename))[0]
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return 'unknown'
+
+
+def _get_slow_log():
+    """Return the slow-query logger, creating its rotating file handler on first use."""
+    global _slow_log
+    with _slow_log_lock:
+        if _slow_log is None:
+            _slow_log = logging.getLogger('slow_queries')
+            _slow_log.setLevel(logging.INFO)
+            _slow_log.propagate = False
+            handler = RotatingFileHandler(SLOW_QUERY_LOG, maxBytes=SLOW_QUERY_LOG_BYTES,
+                                          backupCount=SLOW_QUERY_LOG_BACKUPS)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            _slow_log.addHandler(handler)
+        return _slow_log
+
+
+def _explain(conn, sql, params):
+    """Return the EXPLAIN QUERY PLAN steps of a statement, or an error note."""
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')):
+        return []
+    try:
+        cursor = sqlite3.Cursor(conn)
+        return [row[3] for row in cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+    except sqlite3.Error as e:
+        return [f"(no plan: {str(e)})"]
+
+
+def _record(conn, site, sql, params, elapsed, rows):
+    """Add one finished query to the per-site stats and log it if it was slow."""
+    with _stats_lock:
+        stats = _site_stats.get(site)
+        if stats is None:
+            stats = _site_stats[site] = {'count': 0, 'total': 0.0, 'max': 0.0, 'rows': 0,
+                                         'latencies': deque(maxlen=LATENCY_SAMPLES)}
+        stats['count'] += 1
+        stats['total'] += elapsed
+        stats['max'] = max(stats['max'], elapsed)
+        stats['rows'] += rows
+        stats['latencies'].append(elapsed)
+
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        plan = _explain(conn, sql, params)
+        try:
+            _get_slow_log().info("%.1f ms %s (%d rows)\n  %s\n  plan: %s", elapsed * 1000, site, rows,
+                                 ' '.join(sql.split()), ' | '.join(plan))
+        except Exception as e:
+            print(f"Error writing slow-query log: {str(e)}")
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times each statement, including fetching its rows, per call site."""
+
+    def _start(self, sql, params):
+        self._finish()
+        self._query = (_call_site(), sql, params)
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def _finish(self):
+        query = getattr(self, '_query', None)
+        if query is not None:
+            self._query = None
+            _record(self.connection, query[0], query[1], query[2], self._elapsed, self._rows)
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._elapsed += time.perf_counter() - start
+
+    def execute(self, sql, parameters=()):
+        if not QUERY_STATS_ENABLED:
+            return super().execute(sql, parameters)
+        self._start(sql, parameters)
+        self._timed(super().execute, sql, parameters)
+        # Statements without a result set are done once executed
+        if self.description is None:
+            self._rows = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        if not QUERY_STATS_ENABLED:
+            return super().executemany(sql, seq_of_parameters)
+        seq_of_parameters = list(seq_of_parameters)
+        self._start(sql, seq_of_parameters[0] if seq_of_parameters else ())
+        self._timed(super().executemany, sql, seq_of_parameters)
+        self._rows = max(self.rowcount, 0)
+        self._finish()
+        return self
+
+    def fetchone(self):
+        if getattr(self, '_query', None) is None:
+            return super().fetchone()
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        if getattr(self, '_query', None) is None:
+            return super().fetchmany(size or self.arraysize)
+        size = size or self.arraysize
+        rows = self._timed(super().fetchmany, size)
+        self._rows += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        if getattr(self, '_query', None) is None:
+            return super().fetchall()
+        rows = self._timed(super().fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # A SELECT whose rows were never fully fetched is recorded when the cursor goes away
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, including those of conn.execute(), are instrumented."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute() builds its own cursor without calling cursor(), so route it here
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def get_query_stats():
+    """Return per-call-site query counts, times (ms) and rows, slowest total first."""
+    with _stats_lock:
+        report = []
+        for site, stats in _site_stats.items():
+            latencies = sorted(stats['latencies'])
+            report.append({
+                'call_site': site,
+                'queries': stats['count'],
+                'total_ms': 1000 * stats['total'],
+                'p50_ms': 1000 * latencies[int(0.50 * (len(latencies) - 1))],
+                'p95_ms': 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+                'max_ms': 1000 * stats['max'],
+                'rows': stats['rows'],
+            })
+    return sorted(report, key=lambda entry: entry['total_ms'], reverse=True)
+
+
+def reset_query_stats():
+    """Forget all recorded query stats."""
+    with _stats_lock:
+        _site_stats.clear()
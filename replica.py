@@ -0,0 +1,178 @@
+import os
+import sqlite3
+import threading
+import time
+
+import connection
+from connection import TASKS_DB
+from query_stats import InstrumentedConnection
+
+# Set to False to run analytics and reports on the live database again
+REPLICA_ENABLED = True
+
+# Least number of seconds between two refreshes of a replica, so a busy
+# writer does not make every analytics rerun copy the whole database
+REPLICA_MIN_INTERVAL = 2.0
+
+# Databases larger than this are read live instead of copied, since every
+# refresh copies the whole file into memory. 0 copies databases of any size.
+REPLICA_MAX_BYTES = int(os.environ.get('REPLICA_MAX_MB', 256)) * 1024 * 1024
+
+# Replicas by database file: {db_path: Replica}
+_replicas = {}
+_replicas_lock = threading.Lock()
+
+
+class Replica:
+    """A read-only in-memory copy of one database, refreshed when the database changes.
+
+    The copy is made with the SQLite online backup API from a dedicated
+    connection. On a WAL file the backup reads a snapshot, so it neither
+    waits for the writer thread nor holds it up. A refresh builds a new
+    copy next to the current one and swaps it in, so readers keep using
+    the old copy until the new one is complete.
+
+    Each refresh copies the whole database, so memory and refresh time grow
+    with its size. Above REPLICA_MAX_BYTES the copy is dropped and
+    replica_path() sends reads to the live database.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = None
+        self.generation = 0
+        self.data_version = None
+        self.refreshed_at = 0.0
+        self.checked_at = 0.0
+        self.refresh_ms = 0.0
+        self.size_bytes = 0
+        self.size_checked_at = 0.0
+        self._source = None
+        self._refresh_lock = threading.Lock()
+
+    def _source_connection(self):
+        """Return the connection the replica copies from, opening it on first use."""
+        if self._source is None:
+            if connection.is_memory_database(self.db_path):
+                self._source = sqlite3.connect(connection._memory_uri(self.db_path), uri=True,
+                                               check_same_thread=False)
+            else:
+                self._source = sqlite3.connect(self.db_path, check_same_thread=False)
+            connection.apply_pragmas(self._source)
+        return self._source
+
+    def _current_version(self):
+        """Return PRAGMA data_version, which changes whenever another connection commits."""
+        return self._source_connection().execute('PRAGMA data_version').fetchone()[0]
+
+    def over_size_limit(self):
+        """Return True if the database is larger than REPLICA_MAX_BYTES, dropping the copy if so.
+
+        The size is read from the page count at most every
+        REPLICA_MIN_INTERVAL seconds, so a database that grows past the limit
+        switches to live reads, and one that shrinks again back to the copy.
+        """
+        if not REPLICA_MAX_BYTES:
+            return False
+        if time.time() - self.size_checked_at >= REPLICA_MIN_INTERVAL and self._refresh_lock.acquire(blocking=False):
+            try:
+                source = self._source_connection()
+                page_count = source.execute('PRAGMA page_count').fetchone()[0]
+                self.size_bytes = page_count * source.execute('PRAGMA page_size').fetchone()[0]
+                self.size_checked_at = time.time()
+                if self.size_bytes > REPLICA_MAX_BYTES:
+                    # Readers still holding the old copy keep it until they are done
+                    self.conn = None
+                    self.data_version = None
+            except Exception as e:
+                print(f"Error reading the size of {self.db_path}: {str(e)}")
+            finally:
+                self._refresh_lock.release()
+        return self.size_bytes > REPLICA_MAX_BYTES
+
+    def refresh(self):
+        """Copy the database into a new in-memory connection and swap it in."""
+        start = time.perf_counter()
+        source = self._source_connection()
+        # Read the version first, so a commit made during the copy triggers the next refresh
+        version = self._current_version()
+        target = sqlite3.connect(':memory:', check_same_thread=False, factory=InstrumentedConnection)
+        source.backup(target)
+        target.execute('PRAGMA query_only = 1')
+        self.conn = target
+        self.generation += 1
+        self.data_version = version
+        self.refreshed_at = self.checked_at = time.time()
+        self.refresh_ms = 1000 * (time.perf_counter() - start)
+
+    def get_connection(self):
+        """Return the current copy, refreshing it first if the database has changed.
+
+        Only one thread refreshes at a time; the others go on with the copy
+        they already have. The old copy is closed once no reader holds it.
+        """
+        if self.conn is None:
+            with self._refresh_lock:
+                if self.conn is None:
+                    self.refresh()
+        elif time.time() - self.checked_at >= REPLICA_MIN_INTERVAL and self._refresh_lock.acquire(blocking=False):
+            try:
+                if self._current_version() != self.data_version:
+                    self.refresh()
+                else:
+                    self.checked_at = time.time()
+            except Exception as e:
+                print(f"Error refreshing replica of {self.db_path}: {str(e)}")
+            finally:
+                self._refresh_lock.release()
+        return self.conn
+
+    def close(self):
+        """Drop the copy and the source connection."""
+        with self._refresh_lock:
+            if self._source is not None:
+                self._source.close()
+                self._source = None
+            self.conn = None
+            self.data_version = None
+
+
+def get_replica(db_path=TASKS_DB):
+    """Return the replica of db_path, creating it on first use."""
+    replica = _replicas.get(db_path)
+    if replica is None:
+        with _replicas_lock:
+            replica = _replicas.get(db_path)
+            if replica is None:
+                replica = _replicas[db_path] = Replica(db_path)
+                connection.register_connection_provider(f"replica:{db_path}", replica.get_connection)
+    return replica
+
+
+def replica_path(db_path=TASKS_DB):
+    """Return the name to pass to get_connection() or TaskRepository to read db_path from its replica.
+
+    The name only serves reads; writes through it fail. With the replica
+    turned off, or the database larger than REPLICA_MAX_BYTES, db_path
+    itself is returned and reads go to the live database.
+    """
+    if not REPLICA_ENABLED or get_replica(db_path).over_size_limit():
+        return db_path
+    return f"replica:{db_path}"
+
+
+def close_replicas():
+    """Drop every replica; the next read makes a fresh copy."""
+    with _replicas_lock:
+        for replica in _replicas.values():
+            replica.close()
+
+
+def get_replica_stats():
+    """Return one dict per replica with its generation, age, last refresh time and size, for the admin panel."""
+    now = time.time()
+    return [{'database': db_path, 'generation': replica.generation,
+             'age_s': now - replica.refreshed_at if replica.conn is not None else None,
+             'refresh_ms': replica.refresh_ms, 'size_mb': replica.size_bytes / (1024 * 1024),
+             'live_reads': bool(REPLICA_MAX_BYTES) and replica.size_bytes > REPLICA_MAX_BYTES}
+            for db_path, replica in list(_replicas.items())]
@@ -0,0 +1,1057 @@
+import re
+import threading
+import pandas as pd
+from dataclasses import dataclass
+from datetime import datetime, date, timedelta
+
+from connection import get_connection, TASKS_DB
+from migrations import apply_migrations, set_task_labels, POSITION_GAP, DUE_AT_EXPRESSION, DUE_SORT_KEY
+from utils import day_start_epoch, epochs_to_local
+import task_cache
+from write_queue import run_write_to, submit_write_to, after_commit
+
+# Board order of the status columns when sorting tasks
+STATUS_ORDER = ['To Do', 'In Progress', 'Blocked', 'Done']
+STATUS_ORDER_SQL = "CASE status " + " ".join(
+    f"WHEN '{status}' THEN {rank}" for rank, status in enumerate(STATUS_ORDER)
+) + f" ELSE {len(STATUS_ORDER)} END"
+
+# Search results are relevance-ranked only when at most this many rows match
+SEARCH_RANK_LIMIT = 5000
+
+# Columns whose neighbouring positions get this close are respaced in the background
+MIN_POSITION_GAP = 8
+
+# Cards loaded per Kanban column page
+COLUMN_PAGE_SIZE = 50
+
+# Newest task_changes rows kept by the periodic prune; clients further behind reload in full
+TASK_CHANGES_KEEP = 100000
+
+_pending_rebalances = set()
+_rebalance_lock = threading.Lock()
+
+def due_epoch(due_date_str, due_time_str=None):
+    """Return the UTC epoch seconds of a local due date and optional HH:MM time."""
+    if not due_date_str:
+        return None
+    try:
+        return int(datetime.strptime(f"{due_date_str} {due_time_str or '00:00'}", '%Y-%m-%d %H:%M').timestamp())
+    except ValueError:
+        return None
+
+def init_db():
+    """Initialize the database and bring its schema up to date."""
+    conn = get_connection(TASKS_DB)
+    apply_migrations(conn)
+
+def _invalidate_after_commit(username, shared=False):
+    """Bump the user's task cache version once the current write commits."""
+    after_commit(lambda: task_cache.bump_version(username, shared=shared))
+
+def _add_task_op(c, username, title, description, status, priority, due_date, due_time, labels, parent_id):
+    """Insert a task at the end of its status column (runs on the writer thread)."""
+    # Place the new task at the end of its status column
+    position = _next_position(c, status, username)
+    
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    # Format the due date and time
+    due_date_str = due_date if isinstance(due_date, str) else due_date.strftime('%Y-%m-%d')
+    due_time_str = due_time if isinstance(due_time, str) else due_time.strftime('%H:%M')
+    
+    c.execute('''INSERT INTO tasks 
+                (title, description, status, priority, created_date, due_date, due_time, due_at, position, labels, parent_id, last_updated, username)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            (title, description, status, priority, now, due_date_str, due_time_str, due_epoch(due_date_str, due_time_str),
+             position, labels, parent_id, now, username))
+    
+    task_id = c.lastrowid
+    set_task_labels(c, task_id, labels)
+    _invalidate_after_commit(username)
+    return task_id
+
+@dataclass(frozen=True)
+class TaskFilter:
+    """Board filters that get_tasks() compiles into a SQL WHERE clause.
+    
+    Date filters are applied in priority order: no_due_date, then the
+    start_date/end_date range, then the named due window.
+    """
+    search: str = ""
+    statuses: tuple = ()
+    priorities: tuple = ()
+    due: str = "All"  # "All", "Overdue", "Due Today", "Due This Week" or "Due This Month"
+    start_date: date = None
+    end_date: date = None
+    no_due_date: bool = False
+    labels: tuple = ()  # Match tasks carrying any of these labels
+
+def _escape_like(text):
+    """Escape LIKE wildcards so user input is matched literally."""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def build_fts_query(text):
+    """Turn free text into an FTS5 query that prefix-matches every word."""
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"*' for word in words)
+
+def has_search_index(conn):
+    """Return True if the FTS5 search index exists in this database."""
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tasks_fts'").fetchone()
+    return row is not None
+
+def build_filter_clause(filters, today=None, use_fts=False):
+    """Translate a TaskFilter into a list of SQL conditions and their parameters."""
+    clauses = []
+    params = []
+    if filters is None:
+        return clauses, params
+    
+    today = today or date.today()
+    
+    # Search title, description and labels via the FTS index when available
+    fts_query = build_fts_query(filters.search) if use_fts and filters.search else ""
+    if fts_query:
+        clauses.append("id IN (SELECT rowid FROM tasks_fts WHERE tasks_fts MATCH ?)")
+        params.append(fts_query)
+    elif filters.search:
+        # Case-insensitive substring search over title, description and labels
+        pattern = f"%{_escape_like(filters.search)}%"
+        clauses.append("(title LIKE ? ESCAPE '\\' OR description LIKE ? ESCAPE '\\' OR labels LIKE ? ESCAPE '\\')")
+        params.extend([pattern, pattern, pattern])
+    
+    if filters.statuses:
+        clauses.append(f"status IN ({', '.join('?' * len(filters.statuses))})")
+        params.extend(filters.statuses)
+    
+    if filters.priorities:
+        clauses.append(f"priority IN ({', '.join('?' * len(filters.priorities))})")
+        params.extend(filters.priorities)
+    
+    # Label matches go through the task_labels index, not a substring scan
+    if filters.labels:
+        clauses.append(f'''id IN (SELECT task_labels.task_id FROM task_labels
+                                  JOIN labels ON labels.id = task_labels.label_id
+                                  WHERE labels.name IN ({', '.join('?' * len(filters.labels))}))''')
+        params.extend(filters.labels)
+    
+    # Date filters compare due_at epochs against local day boundaries
+    if filters.no_due_date:
+        clauses.append("due_at IS NULL")
+    elif filters.start_date and filters.end_date:
+        clauses.append("due_at >= ? AND due_at < ?")
+        params.extend([day_start_epoch(filters.start_date), day_start_epoch(filters.end_date + timedelta(days=1))])
+    elif filters.due == "Overdue":
+        clauses.append("due_at < ?")
+        params.append(day_start_epoch(today))
+    elif filters.due == "Due Today":
+        clauses.append("due_at >= ? AND due_at < ?")
+        params.extend([day_start_epoch(today), day_start_epoch(today + timedelta(days=1))])
+    elif filters.due == "Due This Week":
+        end_of_week = today + timedelta(days=(6 - today.weekday()))
+        clauses.append("due_at >= ? AND due_at < ?")
+        params.extend([day_start_epoch(today), day_start_epoch(end_of_week + timedelta(days=1))])
+    elif filters.due == "Due This Month":
+        next_month = today.replace(day=1) + timedelta(days=32)
+        clauses.append("due_at >= ? AND due_at < ?")
+        params.extend([day_start_epoch(today), day_start_epoch(next_month.replace(day=1))])
+    
+    return clauses, params
+
+def _query_tasks(conn, username, filters, changed_since=None):
+    """Run the filtered task query for a user and return it in board order.
+    
+    With changed_since, only tasks logged in task_changes after that version are read.
+    """
+    clauses, params = build_filter_clause(filters, use_fts=has_search_index(conn))
+    if changed_since is not None:
+        clauses.insert(0, "id IN (SELECT task_id FROM task_changes WHERE version > ?)")
+        params.insert(0, changed_since)
+    if username:
+        # Filter tasks by username
+        clauses.insert(0, "(username = ? OR username IS NULL)")
+        params.insert(0, username)
+    # If no user is logged in, show all tasks (or none, depending on your security model)
+    
+    query = 'SELECT * FROM tasks'
+    if clauses:
+        query += ' WHERE ' + ' AND '.join(clauses)
+    # Board order: status column, then due_at with undated tasks last
+    query += f' ORDER BY {STATUS_ORDER_SQL}, due_at IS NULL, due_at, id'
+    df = pd.read_sql_query(query, conn, params=params)
+    
+    # Handle empty dataframe case
+    if df.empty:
+        return df
+        
+    return add_sort_datetime(df)
+
+def _query_column_page(conn, username, status, after_key, limit, filters):
+    """Read one page of a status column in board order, starting after a (sort_key, id) key."""
+    filter_clauses, filter_params = build_filter_clause(filters, use_fts=has_search_index(conn))
+    
+    # Each owner condition reads its own index range, so no branch reads more than one page
+    owners = [("username = ?", [username]), ("username IS NULL", [])] if username else [(None, [])]
+    branches = []
+    params = []
+    for owner_clause, owner_params in owners:
+        clauses = ["status = ?"]
+        branch_params = [status]
+        if owner_clause:
+            clauses.insert(0, owner_clause)
+            branch_params[:0] = owner_params
+        if after_key is not None:
+            # The plain >= bound lets SQLite seek in the index; the row value makes it exact
+            clauses.append(f"{DUE_SORT_KEY} >= ? AND ({DUE_SORT_KEY}, id) > (?, ?)")
+            branch_params.extend([after_key[0], after_key[0], after_key[1]])
+        clauses.extend(filter_clauses)
+        branch_params.extend(filter_params)
+        
+        branches.append(f'''SELECT * FROM (SELECT *, {DUE_SORT_KEY} AS sort_key FROM tasks
+                                          WHERE {' AND '.join(clauses)}
+                                          ORDER BY {DUE_SORT_KEY}, id LIMIT ?)''')
+        params.extend(branch_params + [limit + 1])
+    
+    # One extra row tells us whether another page follows
+    query = ' UNION ALL '.join(branches) + ' ORDER BY sort_key, id LIMIT ?'
+    params.append(limit + 1)
+    df = pd.read_sql_query(query, conn, params=params)
+    
+    has_more = len(df) > limit
+    df = df.iloc[:limit]
+    next_key = (int(df['sort_key'].iloc[-1]), int(df['id'].iloc[-1])) if has_more else None
+    df = df.drop(columns='sort_key').reset_index(drop=True)
+    
+    # Handle empty dataframe case
+    if df.empty:
+        return df, next_key
+    return add_sort_datetime(df), next_key
+
+def get_counts(username, db_path=TASKS_DB):
+    """Return total, per-status, per-priority, overdue and due-soon counts for a user.
+    
+    Status and priority counts come from task_counters, which triggers keep
+    current, so no task rows are read. Overdue and due-soon depend on
+    today's date and are counted on the (username, due_at) index instead.
+    A username of None counts every task.
+    """
+    conn = get_connection(db_path)
+    try:
+        if username:
+            rows = conn.execute('''SELECT kind, value, SUM(count) FROM task_counters
+                                    WHERE username IN (?, '') GROUP BY kind, value''', (username,)).fetchall()
+        else:
+            rows = conn.execute('''SELECT kind, value, SUM(count) FROM task_counters
+                                    GROUP BY kind, value''').fetchall()
+        
+        counts = {'status': {}, 'priority': {}}
+        for kind, value, count in rows:
+            if count:
+                # Tasks without a status or priority are counted under ''
+                counts[kind][value or None] = count
+        
+        # Due windows are half-open epoch ranges starting today at midnight
+        today = date.today()
+        due_query = 'SELECT COALESCE(SUM(due_at < ?), 0), COALESCE(SUM(due_at >= ? AND due_at < ?), 0) FROM tasks WHERE due_at < ?'
+        due_params = [day_start_epoch(today), day_start_epoch(today),
+                      day_start_epoch(today + timedelta(days=4)), day_start_epoch(today + timedelta(days=4))]
+        if username:
+            due_query += ' AND (username = ? OR username IS NULL)'
+            due_params.append(username)
+        overdue, due_soon = conn.execute(due_query, due_params).fetchone()
+        
+        return {
+            'total': sum(counts['status'].values()),
+            'by_status': counts['status'],
+            'by_priority': counts['priority'],
+            'overdue': overdue,
+            'due_soon': due_soon
+        }
+    except Exception as e:
+        print(f"Error reading task counters: {str(e)}")
+        return {'total': 0, 'by_status': {}, 'by_priority': {}, 'overdue': 0, 'due_soon': 0}
+
+@dataclass
+class TaskDelta:
+    """Rows changed since a change-log version, as returned by get_tasks_since().
+    
+    upserts holds the current version of every inserted or updated task that
+    is visible (and matches the filters); deleted_ids lists tasks to drop.
+    full_reload is True when the changes since the requested version have
+    been pruned, in which case upserts holds the complete result.
+    """
+    version: int
+    upserts: pd.DataFrame
+    deleted_ids: list
+    full_reload: bool = False
+
+def get_change_version(conn=None):
+    """Return the latest task_changes version (0 before any change)."""
+    conn = conn or get_connection(TASKS_DB)
+    # sqlite_sequence still holds the last version after the log has been pruned
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'task_changes'").fetchone()
+    return row[0] if row else 0
+
+def apply_task_delta(df, delta):
+    """Patch a task DataFrame with a TaskDelta and restore board order."""
+    if delta.full_reload:
+        return delta.upserts
+    if delta.upserts.empty and not delta.deleted_ids:
+        return df
+    
+    # Replace changed rows and drop deleted ones
+    dropped = set(delta.deleted_ids)
+    if not delta.upserts.empty:
+        dropped.update(delta.upserts['id'].tolist())
+    kept = df[~df['id'].isin(dropped)] if 'id' in df else df
+    if delta.upserts.empty:
+        return kept.reset_index(drop=True)
+    if kept.empty:
+        return delta.upserts
+    patched = pd.concat([kept, delta.upserts], ignore_index=True)
+    
+    # Same order as get_tasks(): status column, then due time with undated tasks last, then id
+    return patched.sort_values(
+        by=['status', 'sort_datetime', 'id'],
+        key=lambda x: pd.Categorical(x, categories=STATUS_ORDER)
+        if x.name == 'status' else x
+    ).reset_index(drop=True)
+
+def _prune_task_changes_op(c, keep_versions):
+    """Delete all but the newest keep_versions rows of task_changes (runs on the writer thread)."""
+    c.execute("DELETE FROM task_changes WHERE version <= (SELECT MAX(version) FROM task_changes) - ?",
+              (keep_versions,))
+    return c.rowcount
+
+def prune_task_changes(keep_versions=TASK_CHANGES_KEEP, db_path=TASKS_DB):
+    """Delete all but the newest keep_versions rows of the task_changes log.
+    
+    Callers holding an older version get a full reload from get_tasks_since().
+    refresh_snapshots() queues this for every shard along with the daily snapshot.
+    """
+    try:
+        return run_write_to(db_path, _prune_task_changes_op, keep_versions)
+    except Exception as e:
+        print(f"Error pruning task changes: {str(e)}")
+        return 0
+
+def compute_sort_datetime(due_at):
+    """Turn due_at epochs into local due datetimes, with Timestamp.max for undated tasks.
+    
+    Tasks saved without a time have due_at at local midnight of their due date.
+    """
+    return epochs_to_local(due_at).fillna(pd.Timestamp.max)
+
+def add_sort_datetime(df):
+    """Add the sort_datetime column from due_at and normalize due_date/due_time for display."""
+    # due_at already holds the parsed due moment, so the date and time strings are not parsed again
+    df['sort_datetime'] = compute_sort_datetime(df['due_at'])
+    
+    # Dates that never produced a due_at (empty or malformed) show as missing
+    df['due_date'] = df['due_date'].where(df['due_at'].notna())
+    df['due_time'] = df['due_time'].fillna('')
+    
+    return df
+
+def _update_task_op(c, username, task_id, title, description, status, priority, due_date, due_time, labels):
+    """Overwrite a task's fields (runs on the writer thread)."""
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    # Format the due date and time
+    due_date_str = due_date if isinstance(due_date, str) else due_date.strftime('%Y-%m-%d')
+    due_time_str = due_time if isinstance(due_time, str) else due_time.strftime('%H:%M')
+    
+    shared = _touches_shared_tasks(c, [task_id])
+    if username:
+        # Only update if the task belongs to the user or has no user
+        c.execute('''UPDATE tasks 
+                    SET title = ?, 
+                        description = ?, 
+                        status = ?,
+                        priority = ?, 
+                        due_date = ?,
+                        due_time = ?,
+                        due_at = ?,
+                        labels = ?,
+                        last_updated = ?,
+                        username = ?
+                    WHERE id = ? AND (username = ? OR username IS NULL)''',
+                (title, description, status, priority, due_date_str, due_time_str, due_epoch(due_date_str, due_time_str),
+                 labels, now, username, task_id, username))
+    else:
+        # Standard update without user restriction (should be limited in real-world apps)
+        c.execute('''UPDATE tasks 
+                    SET title = ?, 
+                        description = ?, 
+                        status = ?,
+                        priority = ?, 
+                        due_date = ?,
+                        due_time = ?,
+                        due_at = ?,
+                        labels = ?,
+                        last_updated = ?
+                    WHERE id = ?''',
+                (title, description, status, priority, due_date_str, due_time_str, due_epoch(due_date_str, due_time_str),
+                 labels, now, task_id))
+    
+    if c.rowcount:
+        set_task_labels(c, task_id, labels)
+        _invalidate_after_commit(username, shared)
+
+def _update_task_status_op(c, username, task_id, new_status):
+    """Move a task to the end of another status column (runs on the writer thread)."""
+    # Get the old status and position
+    if username:
+        c.execute('SELECT status, position FROM tasks WHERE id = ? AND (username = ? OR username IS NULL)', (task_id, username))
+    else:
+        c.execute('SELECT status, position FROM tasks WHERE id = ?', (task_id,))
+    
+    result = c.fetchone()
+    if not result:
+        return  # Task not found or not owned by user
+        
+    # Append to the end of the new status column; positions are sparse, so
+    # the rest of the old column keeps its positions
+    new_position = _next_position(c, new_status, username)
+    shared = _touches_shared_tasks(c, [task_id])
+    
+    # Update the task's status and position
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    if username:
+        # Ensure task ownership or unassigned
+        c.execute('UPDATE tasks SET status = ?, position = ?, last_updated = ?, username = ? WHERE id = ? AND (username = ? OR username IS NULL)', 
+                 (new_status, new_position, now, username, task_id, username))
+    else:
+        c.execute('UPDATE tasks SET status = ?, position = ?, last_updated = ? WHERE id = ?', 
+                 (new_status, new_position, now, task_id))
+    _invalidate_after_commit(username, shared)
+
+def _with_subtasks(c, task_ids):
+    """Return task_ids plus all their subtasks, deepest first.
+
+    Deleting in this order does what ON DELETE CASCADE on parent_id would,
+    and also works on older tasks tables whose foreign key has no CASCADE.
+    """
+    task_ids = [int(task_id) for task_id in task_ids]
+    if not task_ids:
+        return []
+    placeholders = ', '.join('?' * len(task_ids))
+    c.execute(f'''WITH RECURSIVE subtree (id, depth) AS (
+                      SELECT id, 0 FROM tasks WHERE id IN ({placeholders})
+                      UNION
+                      SELECT t.id, subtree.depth + 1 FROM tasks t JOIN subtree ON t.parent_id = subtree.id
+                      WHERE subtree.depth < 100
+                  )
+                  SELECT id FROM subtree GROUP BY id ORDER BY MAX(depth) DESC, id''', task_ids)
+    return [row[0] for row in c.fetchall()]
+
+def _delete_task_op(c, username, task_id):
+    """Delete a task and its subtasks (runs on the writer thread)."""
+    # Positions are sparse, so the remaining tasks do not need renumbering
+    owned = list(_owned_task_ids(c, [task_id], username))
+    subtree = _with_subtasks(c, owned)
+    shared = _touches_shared_tasks(c, subtree)
+    # Children go first, so enforced foreign keys never see an orphan
+    c.executemany('DELETE FROM tasks WHERE id = ?', [(task_id,) for task_id in subtree])
+    _invalidate_after_commit(username, shared)
+
+def _next_position(c, status, username):
+    """Return a position after the last task in a status column."""
+    if username:
+        c.execute('SELECT MAX(position) FROM tasks WHERE status = ? AND (username = ? OR username IS NULL)', (status, username))
+    else:
+        c.execute('SELECT MAX(position) FROM tasks WHERE status = ?', (status,))
+    max_pos = c.fetchone()[0]
+    return POSITION_GAP if max_pos is None else max_pos + POSITION_GAP
+
+def _column_positions(c, status, username, exclude_id=None):
+    """Return the (id, position) pairs of a status column in board order."""
+    query = 'SELECT id, position FROM tasks WHERE status = ?'
+    params = [status]
+    if username:
+        query += ' AND (username = ? OR username IS NULL)'
+        params.append(username)
+    if exclude_id is not None:
+        query += ' AND id != ?'
+        params.append(exclude_id)
+    c.execute(query + ' ORDER BY position, id', params)
+    return c.fetchall()
+
+def _rebalance_column(c, status, username):
+    """Respace a status column so neighbouring positions are POSITION_GAP apart."""
+    rows = _column_positions(c, status, username)
+    c.executemany('UPDATE tasks SET position = ? WHERE id = ?',
+                  [((index + 1) * POSITION_GAP, task_id) for index, (task_id, _) in enumerate(rows)])
+    return len(rows)
+
+def _rebalance_op(c, status, username):
+    """Respace one status column (runs on the writer thread)."""
+    count = _rebalance_column(c, status, username)
+    # The column may include tasks without a username
+    _invalidate_after_commit(username, shared=True)
+    return count
+
+def rebalance_positions(status, username=None, db_path=TASKS_DB):
+    """Respace the positions of one status column in its own transaction."""
+    try:
+        return run_write_to(db_path, _rebalance_op, status, username)
+    except Exception as e:
+        print(f"Error rebalancing positions: {str(e)}")
+        return 0
+
+def _schedule_rebalance(status, username, db_path=TASKS_DB):
+    """Queue a column rebalance once its gaps are running low, without waiting for it."""
+    key = (db_path, status, username)
+    with _rebalance_lock:
+        if key in _pending_rebalances:
+            return
+        _pending_rebalances.add(key)
+    
+    def done(future):
+        with _rebalance_lock:
+            _pending_rebalances.discard(key)
+        if future.exception() is not None:
+            print(f"Error rebalancing positions: {str(future.exception())}")
+    
+    submit_write_to(db_path, _rebalance_op, status, username).add_done_callback(done)
+
+def _move_task_to_index_op(c, username, task_id, status, index):
+    """Give a task a position between its new neighbours (runs on the writer thread).
+    
+    Returns (moved, respace): respace is True when the gap used was nearly exhausted.
+    """
+    if username:
+        c.execute('SELECT id FROM tasks WHERE id = ? AND (username = ? OR username IS NULL)', (task_id, username))
+    else:
+        c.execute('SELECT id FROM tasks WHERE id = ?', (task_id,))
+    if not c.fetchone():
+        return False, False  # Task not found or not owned by user
+    
+    # The writer holds the write lock, so a rebalance cannot interleave with these reads
+    shared = _touches_shared_tasks(c, [task_id])
+    column = _column_positions(c, status, username, exclude_id=task_id)
+    index = max(0, min(index, len(column)))
+    
+    before = column[index - 1][1] if index > 0 else None
+    after = column[index][1] if index < len(column) else None
+    if before is not None and after is not None and after - before < 2:
+        # No integer left between the neighbours: renumber this column once
+        _rebalance_column(c, status, username)
+        column = _column_positions(c, status, username, exclude_id=task_id)
+        before = column[index - 1][1] if index > 0 else None
+        after = column[index][1] if index < len(column) else None
+    
+    if before is None and after is None:
+        new_position = POSITION_GAP
+    elif before is None:
+        new_position = after - POSITION_GAP
+    elif after is None:
+        new_position = before + POSITION_GAP
+    else:
+        new_position = (before + after) // 2
+    
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    if username:
+        c.execute('UPDATE tasks SET status = ?, position = ?, last_updated = ?, username = ? WHERE id = ? AND (username = ? OR username IS NULL)', 
+                 (status, new_position, now, username, task_id, username))
+    else:
+        c.execute('UPDATE tasks SET status = ?, position = ?, last_updated = ? WHERE id = ?', 
+                 (status, new_position, now, task_id))
+    _invalidate_after_commit(username, shared)
+    
+    # Respace ahead of time when repeated inserts have nearly used up the gap
+    respace = before is not None and after is not None and after - before <= MIN_POSITION_GAP
+    return True, respace
+
+def _format_due(due_date, due_time):
+    """Format due date and time values as the stored YYYY-MM-DD / HH:MM strings."""
+    due_date_str = due_date if due_date is None or isinstance(due_date, str) else due_date.strftime('%Y-%m-%d')
+    due_time_str = due_time if due_time is None or isinstance(due_time, str) else due_time.strftime('%H:%M')
+    return due_date_str, due_time_str
+
+def _owned_task_ids(c, task_ids, username):
+    """Return the subset of task_ids the user may modify, with their current status."""
+    task_ids = [int(task_id) for task_id in task_ids]
+    if not task_ids:
+        return {}
+    placeholders = ', '.join('?' * len(task_ids))
+    query = f'SELECT id, status FROM tasks WHERE id IN ({placeholders})'
+    params = list(task_ids)
+    if username:
+        query += ' AND (username = ? OR username IS NULL)'
+        params.append(username)
+    c.execute(query, params)
+    return dict(c.fetchall())
+
+def _touches_shared_tasks(c, task_ids):
+    """Return True if any of the tasks has no username, i.e. is visible to every user."""
+    task_ids = [int(task_id) for task_id in task_ids]
+    if not task_ids:
+        return False
+    placeholders = ', '.join('?' * len(task_ids))
+    c.execute(f'SELECT 1 FROM tasks WHERE id IN ({placeholders}) AND username IS NULL LIMIT 1', task_ids)
+    return c.fetchone() is not None
+
+def _bulk_add_tasks_op(c, username, tasks):
+    """Insert many tasks and return their new IDs (runs on the writer thread)."""
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    next_positions = {}
+    rows = []
+    for task in tasks:
+        status = task.get('status', 'To Do')
+        if status not in next_positions:
+            next_positions[status] = _next_position(c, status, username)
+        position = next_positions[status]
+        next_positions[status] += POSITION_GAP
+        
+        due_date_str, due_time_str = _format_due(task.get('due_date'), task.get('due_time'))
+        rows.append((task['title'], task.get('description', ''), status, task.get('priority'), now,
+                     due_date_str, due_time_str, due_epoch(due_date_str, due_time_str), position,
+                     task.get('labels', ''), task.get('parent_id'), now, username))
+    
+    c.executemany('''INSERT INTO tasks 
+                    (title, description, status, priority, created_date, due_date, due_time, due_at, position, labels, parent_id, last_updated, username)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+    
+    # The writer holds the write lock, so the new rows got consecutive AUTOINCREMENT ids
+    c.execute("SELECT seq FROM sqlite_sequence WHERE name = 'tasks'")
+    last_id = c.fetchone()[0]
+    task_ids = list(range(last_id - len(rows) + 1, last_id + 1))
+    
+    for task_id, task in zip(task_ids, tasks):
+        if task.get('labels'):
+            set_task_labels(c, task_id, task['labels'])
+    
+    _invalidate_after_commit(username)
+    return task_ids
+
+def _bulk_update_status_op(c, username, task_ids, new_status):
+    """Move the user's tasks among task_ids to new_status (runs on the writer thread)."""
+    owned = _owned_task_ids(c, task_ids, username)
+    moving = [task_id for task_id, status in owned.items() if status != new_status]
+    if not moving:
+        return 0
+    
+    shared = _touches_shared_tasks(c, moving)
+    
+    # One position lookup for the target column; the source columns stay sparse
+    position = _next_position(c, new_status, username)
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    rows = []
+    for task_id in moving:
+        rows.append((new_status, position, now, username, task_id))
+        position += POSITION_GAP
+    
+    c.executemany('UPDATE tasks SET status = ?, position = ?, last_updated = ?, username = COALESCE(?, username) WHERE id = ?', rows)
+    _invalidate_after_commit(username, shared)
+    return len(rows)
+
+# Columns that bulk_update_fields() may change
+BULK_UPDATABLE_FIELDS = ('title', 'description', 'priority', 'due_date', 'due_time', 'labels', 'parent_id')
+
+def _bulk_update_fields_op(c, username, task_ids, fields):
+    """Set the same field values on the user's tasks among task_ids (runs on the writer thread)."""
+    owned = list(_owned_task_ids(c, task_ids, username))
+    if not owned:
+        return 0
+    shared = _touches_shared_tasks(c, owned)
+    
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    assignments = ', '.join(f"{column} = ?" for column in fields)
+    values = list(fields.values())
+    c.executemany(f'UPDATE tasks SET {assignments}, last_updated = ?, username = COALESCE(?, username) WHERE id = ?',
+                  [values + [now, username, task_id] for task_id in owned])
+    
+    # Only one of due_date/due_time may have changed, so recompute due_at from the stored pair
+    if 'due_date' in fields or 'due_time' in fields:
+        c.executemany(f'UPDATE tasks SET due_at = {DUE_AT_EXPRESSION} WHERE id = ?',
+                      [(task_id,) for task_id in owned])
+    
+    if 'labels' in fields:
+        for task_id in owned:
+            set_task_labels(c, task_id, fields['labels'])
+    
+    _invalidate_after_commit(username, shared)
+    return len(owned)
+
+def _bulk_delete_op(c, username, task_ids):
+    """Delete the user's tasks among task_ids and their subtasks (runs on the writer thread)."""
+    owned = list(_owned_task_ids(c, task_ids, username))
+    subtree = _with_subtasks(c, owned)
+    shared = _touches_shared_tasks(c, subtree)
+    # Positions are sparse, so no column needs compacting afterwards
+    c.executemany('DELETE FROM tasks WHERE id = ?', [(task_id,) for task_id in subtree])
+    _invalidate_after_commit(username, shared)
+    return len(owned)
+
+def get_cached_analytics(tasks):
+    """Generate analytics from cached tasks."""
+    return tasks 
+
+class TaskRepository:
+    """Task reads and writes on behalf of one user, without any Streamlit dependency.
+    
+    A user sees their own tasks plus tasks without a username. A username
+    of None applies no owner filter. db_path is the database file holding
+    the tasks (a shard, when sharding is on). Repositories hold no
+    connection of their own, so they are cheap to create and can be used
+    from any thread, a CLI or a benchmark.
+    """
+    
+    def __init__(self, username=None, db_path=TASKS_DB):
+        self.username = username
+        self.db_path = db_path
+    
+    def add_task(self, title, description, status, priority, due_date, due_time, labels="", parent_id=None):
+        """Add a new task to the database."""
+        return run_write_to(self.db_path, _add_task_op, self.username, title, description, status, priority, due_date, due_time, labels, parent_id)
+    
+    def get_tasks(self, filters=None):
+        """Retrieve tasks for this user, optionally narrowed by a TaskFilter."""
+        conn = get_connection(self.db_path)
+        try:
+            return _query_tasks(conn, self.username, filters)
+        except Exception as e:
+            print(f"Error retrieving tasks: {str(e)}")
+            return pd.DataFrame()
+    
+    def get_column_page(self, status, after_key=None, limit=COLUMN_PAGE_SIZE, filters=None):
+        """Return one page of a Kanban column and the key that starts the next page.
+        
+        Pages follow board order (due date and time, undated last, then id) and
+        are read by keyset, so a late page costs the same as the first one.
+        next_key is None on the last page. Pages are cached until the user's
+        data changes or the date rolls over, per database.
+        """
+        conn = get_connection(self.db_path)
+        try:
+            return task_cache.get_or_load(
+                self.username, ('column_page', self.db_path, status, after_key, limit, filters, date.today()),
+                lambda: _query_column_page(conn, self.username, status, after_key, limit, filters)
+            )
+        except Exception as e:
+            print(f"Error retrieving column page: {str(e)}")
+            return pd.DataFrame(), None
+    
+    def get_counts(self):
+        """Return this user's counts from the task counters; see get_counts()."""
+        return get_counts(self.username, self.db_path)
+    
+    def get_task_counts(self, filters=None):
+        """Return total, overdue and per-status counts for the filtered board without loading rows."""
+        conn = get_connection(self.db_path)
+        
+        # The unfiltered board is answered from the trigger-maintained counters
+        if filters is None or filters == TaskFilter():
+            return get_counts(self.username, self.db_path)
+        
+        def load():
+            clauses, params = build_filter_clause(filters, use_fts=has_search_index(conn))
+            if self.username:
+                clauses.insert(0, "(username = ? OR username IS NULL)")
+                params.insert(0, self.username)
+            query = 'SELECT status, COUNT(*), COALESCE(SUM(due_at < ?), 0) FROM tasks'
+            params.insert(0, day_start_epoch(date.today()))
+            if clauses:
+                query += ' WHERE ' + ' AND '.join(clauses)
+            query += ' GROUP BY status'
+            
+            by_status = {}
+            overdue = 0
+            for status, count, status_overdue in conn.execute(query, params).fetchall():
+                by_status[status] = count
+                overdue += status_overdue
+            return {'total': sum(by_status.values()), 'overdue': overdue, 'by_status': by_status}
+        
+        try:
+            return task_cache.get_or_load(self.username, ('task_counts', self.db_path, filters, date.today()), load)
+        except Exception as e:
+            print(f"Error counting tasks: {str(e)}")
+            return {'total': 0, 'overdue': 0, 'by_status': {}}
+    
+    def get_tasks_since(self, version, filters=None):
+        """Return the tasks inserted, updated or deleted after a change-log version.
+        
+        Pass the version of the previous result (0 for a first load) and keep
+        the returned version for the next call.
+        """
+        conn = get_connection(self.db_path)
+        
+        try:
+            # Read the version and the rows from one snapshot
+            conn.execute('BEGIN')
+            current = get_change_version(conn)
+            oldest = conn.execute("SELECT MIN(version) FROM task_changes").fetchone()[0]
+            
+            pruned = version < current and (oldest is None or version < oldest - 1)
+            if version <= 0 or pruned:
+                return TaskDelta(current, _query_tasks(conn, self.username, filters), [], full_reload=True)
+            
+            changed_query = 'SELECT DISTINCT task_id FROM task_changes WHERE version > ? AND version <= ?'
+            changed_params = [version, current]
+            if self.username:
+                changed_query += ' AND (username = ? OR username IS NULL)'
+                changed_params.append(self.username)
+            changed_ids = {row[0] for row in conn.execute(changed_query, changed_params).fetchall()}
+            
+            # Changed rows that are still visible are upserts; the rest have left this view
+            upserts = _query_tasks(conn, self.username, filters, changed_since=version)
+            deleted_ids = sorted(changed_ids - set(upserts['id'].tolist() if not upserts.empty else []))
+            return TaskDelta(current, upserts, deleted_ids)
+        except Exception as e:
+            print(f"Error retrieving task changes: {str(e)}")
+            return TaskDelta(version, pd.DataFrame(), [])
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+    
+    def search_tasks(self, query, limit=50):
+        """Full-text search over title, description and labels, best matches first.
+        
+        Every word in the query is prefix-matched, so "dep prod" finds
+        "Deploy to production". Title hits rank above label hits, which rank
+        above description hits. Queries matching more than SEARCH_RANK_LIMIT
+        rows return the newest matches instead, so very common words do not
+        pay for scoring the whole table.
+        """
+        conn = get_connection(self.db_path)
+        try:
+            fts_query = build_fts_query(query or "")
+            if not fts_query:
+                return pd.DataFrame()
+            
+            if not has_search_index(conn):
+                # No FTS5 in this SQLite build: fall back to a substring scan
+                return self.get_tasks(TaskFilter(search=query)).head(limit)
+            
+            # Matches this user can see; other users' rows must not decide whether results get ranked
+            match_sql = 'FROM tasks_fts JOIN tasks ON tasks.id = tasks_fts.rowid WHERE tasks_fts MATCH ?'
+            params = [fts_query]
+            if self.username:
+                match_sql += ' AND (tasks.username = ? OR tasks.username IS NULL)'
+                params.append(self.username)
+            
+            # Only rank when the match set is small enough to score cheaply
+            match_count = conn.execute(
+                f'SELECT COUNT(*) FROM (SELECT 1 {match_sql} LIMIT ?)', params + [SEARCH_RANK_LIMIT + 1]
+            ).fetchone()[0]
+            ranked = match_count <= SEARCH_RANK_LIMIT
+            
+            sql = f"SELECT tasks.*, {'bm25(tasks_fts, 10.0, 1.0, 5.0)' if ranked else 'NULL'} AS rank {match_sql}"
+            sql += ' ORDER BY rank LIMIT ?' if ranked else ' ORDER BY tasks_fts.rowid DESC LIMIT ?'
+            params.append(limit)
+            
+            return pd.read_sql_query(sql, conn, params=params)
+        except Exception as e:
+            print(f"Error searching tasks: {str(e)}")
+            return pd.DataFrame()
+    
+    def get_tasks_by_label(self, label):
+        """Retrieve this user's tasks that carry the given label."""
+        return self.get_tasks(TaskFilter(labels=(label,)))
+    
+    def get_label_counts(self):
+        """Return a DataFrame of label names and task counts for this user."""
+        conn = get_connection(self.db_path)
+        try:
+            query = '''SELECT labels.name AS label, COUNT(*) AS count
+                       FROM task_labels
+                       JOIN labels ON labels.id = task_labels.label_id
+                       JOIN tasks ON tasks.id = task_labels.task_id'''
+            params = []
+            if self.username:
+                query += ' WHERE (tasks.username = ? OR tasks.username IS NULL)'
+                params.append(self.username)
+            query += ' GROUP BY labels.id ORDER BY count DESC, label'
+            
+            return pd.read_sql_query(query, conn, params=params)
+        except Exception as e:
+            print(f"Error retrieving label counts: {str(e)}")
+            return pd.DataFrame(columns=['label', 'count'])
+    
+    def get_subtasks(self, task_id):
+        """Retrieve subtasks for a given parent task ID."""
+        conn = get_connection(self.db_path)
+        try:
+            if self.username:
+                # Filter by username and parent_id
+                df = pd.read_sql_query('SELECT * FROM tasks WHERE parent_id = ? AND (username = ? OR username IS NULL)', 
+                                      conn, params=[task_id, self.username])
+            else:
+                df = pd.read_sql_query('SELECT * FROM tasks WHERE parent_id = ?', conn, params=[task_id])
+            return df
+        except Exception as e:
+            print(f"Error retrieving subtasks: {str(e)}")
+            return pd.DataFrame()
+    
+    def get_task_summaries(self, task_ids):
+        """Return {task_id: (title, status)} for the given tasks this user can see, in one query."""
+        task_ids = [int(task_id) for task_id in task_ids]
+        if not task_ids:
+            return {}
+        conn = get_connection(self.db_path)
+        try:
+            query = f"SELECT id, title, status FROM tasks WHERE id IN ({', '.join('?' * len(task_ids))})"
+            params = list(task_ids)
+            if self.username:
+                query += ' AND (username = ? OR username IS NULL)'
+                params.append(self.username)
+            return {task_id: (title, status) for task_id, title, status in conn.execute(query, params).fetchall()}
+        except Exception as e:
+            print(f"Error retrieving task summaries: {str(e)}")
+            return {}
+    
+    def get_task_tree(self, root_ids=None, max_depth=None):
+        """Retrieve whole parent/child task hierarchies in one recursive query.
+        
+        Starts from root_ids, or from every top-level task when None (tasks
+        whose parent no longer exists count as top-level). Each row gets a
+        depth (0 for roots) and a slash-separated path of ancestor IDs, and
+        rows are ordered so children directly follow their parent.
+        """
+        conn = get_connection(self.db_path)
+        try:
+            owner_clause = ' AND (t.username = ? OR t.username IS NULL)' if self.username else ''
+            owner_params = [self.username] if self.username else []
+            
+            if root_ids is None:
+                root_clause = 't.parent_id IS NULL OR NOT EXISTS (SELECT 1 FROM tasks p WHERE p.id = t.parent_id)'
+                root_params = []
+            else:
+                root_ids = [int(root_id) for root_id in root_ids]
+                if not root_ids:
+                    return pd.DataFrame()
+                root_clause = f"t.id IN ({', '.join('?' * len(root_ids))})"
+                root_params = root_ids
+            
+            depth_clause = ' AND tree.depth < ?' if max_depth is not None else ''
+            depth_params = [max_depth] if max_depth is not None else []
+            
+            query = f'''WITH RECURSIVE tree(id, depth, path) AS (
+                            SELECT t.id, 0, CAST(t.id AS TEXT)
+                            FROM tasks t
+                            WHERE ({root_clause}){owner_clause}
+                            UNION ALL
+                            SELECT t.id, tree.depth + 1, tree.path || '/' || t.id
+                            FROM tasks t
+                            JOIN tree ON t.parent_id = tree.id
+                            WHERE instr('/' || tree.path || '/', '/' || t.id || '/') = 0{owner_clause}{depth_clause}
+                        )
+                        SELECT tasks.*, tree.depth, tree.path
+                        FROM tree
+                        JOIN tasks ON tasks.id = tree.id
+                        ORDER BY tree.path'''
+            params = root_params + owner_params + owner_params + depth_params
+            
+            return pd.read_sql_query(query, conn, params=params)
+        except Exception as e:
+            print(f"Error retrieving task tree: {str(e)}")
+            return pd.DataFrame()
+    
+    def get_child_index(self):
+        """Return a cached {parent_id: [child_id, ...]} map of this user's tasks.
+        
+        The map is built from one get_task_tree() query and reused until the
+        user's data changes, so renderers can look up children in O(1).
+        """
+        def build():
+            tree = self.get_task_tree()
+            child_index = {}
+            if not tree.empty:
+                for task_id, parent_id in tree[['id', 'parent_id']].itertuples(index=False):
+                    if pd.notna(parent_id):
+                        child_index.setdefault(int(parent_id), []).append(int(task_id))
+            return child_index
+        
+        return task_cache.get_or_load(self.username, ('child_index', self.db_path), build)
+    
+    def update_task(self, task_id, title, description, status, priority, due_date, due_time, labels=""):
+        """Update an existing task in the database."""
+        run_write_to(self.db_path, _update_task_op, self.username, task_id, title, description, status, priority, due_date, due_time, labels)
+    
+    def update_task_status(self, task_id, new_status):
+        """Update a task's status and position in the database."""
+        run_write_to(self.db_path, _update_task_status_op, self.username, task_id, new_status)
+    
+    def delete_task(self, task_id):
+        """Delete a task from the database."""
+        try:
+            run_write_to(self.db_path, _delete_task_op, self.username, task_id)
+        except Exception as e:
+            print(f"Error deleting task: {str(e)}")
+    
+    def move_task_to_index(self, task_id, status, index):
+        """Move a task to a zero-based index within a status column, counted in position order.
+        
+        The task gets a position halfway between its new neighbours, so no
+        other row is rewritten. A column is only renumbered when two
+        neighbours have no room left between them.
+        
+        Note that the board, get_tasks() and get_column_page() order cards
+        by due date, not by position, and app.py does not call this method.
+        The index only places the card among the stored manual positions,
+        which the UI currently ignores; it is kept for API clients that
+        order by position themselves.
+        """
+        moved, respace = run_write_to(self.db_path, _move_task_to_index_op, self.username, task_id, status, index)
+        if respace:
+            _schedule_rebalance(status, self.username, self.db_path)
+        return moved
+    
+    def bulk_add_tasks(self, tasks):
+        """Insert many tasks in one transaction and return their new IDs.
+        
+        Each item is a dict with the add_task() arguments as keys. The next
+        position of every affected status column is looked up once.
+        """
+        if not tasks:
+            return []
+        
+        return run_write_to(self.db_path, _bulk_add_tasks_op, self.username, list(tasks))
+    
+    def bulk_update_status(self, task_ids, new_status):
+        """Move many tasks to a new status column in one transaction."""
+        return run_write_to(self.db_path, _bulk_update_status_op, self.username, list(task_ids), new_status)
+    
+    def bulk_update_fields(self, task_ids, **fields):
+        """Set the same field values on many tasks in one transaction."""
+        unknown = set(fields) - set(BULK_UPDATABLE_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot bulk update: {', '.join(sorted(unknown))}")
+        if not fields:
+            return 0
+        
+        if 'due_date' in fields or 'due_time' in fields:
+            due_date_str, due_time_str = _format_due(fields.get('due_date'), fields.get('due_time'))
+            if 'due_date' in fields:
+                fields['due_date'] = due_date_str
+            if 'due_time' in fields:
+                fields['due_time'] = due_time_str
+        
+        return run_write_to(self.db_path, _bulk_update_fields_op, self.username, list(task_ids), fields)
+    
+    def bulk_delete(self, task_ids):
+        """Delete many tasks in one transaction."""
+        try:
+            return run_write_to(self.db_path, _bulk_delete_op, self.username, list(task_ids))
+        except Exception as e:
+            print(f"Error deleting tasks: {str(e)}")
+            return 0
+    
+    def get_cached_tasks(self, filters=None):
+        """Return this user's tasks from the process-wide cache.
+        
+        Entries stay valid until a write bumps the user's data version, so
+        repeated reruns reuse the same result instead of querying again.
+        The key holds the database and today's date, so shards and replicas
+        never share entries and the due-date filters roll over at midnight.
+        """
+        conn = get_connection(self.db_path)
+        try:
+            return task_cache.get_or_load(self.username, ('tasks', self.db_path, filters, date.today()),
+                                          lambda: _query_tasks(conn, self.username, filters))
+        except Exception as e:
+            print(f"Error retrieving tasks: {str(e)}")
+            return pd.DataFrame()
@@ -0,0 +1,337 @@
+import argparse
+import os
+import re
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+
+import pandas as pd
+
+from connection import get_connection, TASKS_DB
+from migrations import apply_migrations
+from repository import TaskRepository, STATUS_ORDER, get_counts, init_db
+from replica import replica_path
+from write_queue import run_write_to
+
+# How tasks are split over database files: 'off' keeps everyone in tasks.db,
+# 'user' gives every user their own file and 'hash' spreads users over
+# SHARD_BUCKETS files. Tasks without a username stay in tasks.db, where no
+# sharded board reads them, so the app refuses to start while any are left.
+SHARD_MODES = ('off', 'user', 'hash')
+SHARD_MODE = os.environ.get('TASK_SHARDING', 'off')
+if SHARD_MODE not in SHARD_MODES:
+    raise ValueError(f"Unknown TASK_SHARDING mode: {SHARD_MODE}")
+
+# Shard files in 'hash' mode; changing it sends users to different files
+SHARD_BUCKETS = int(os.environ.get('TASK_SHARD_BUCKETS', 16))
+
+# Directory holding the shard files
+SHARD_DIR = os.environ.get('TASK_SHARD_DIR', 'shards')
+
+# Threads querying shards in parallel for cross-shard reads
+FAN_OUT_WORKERS = 8
+
+_opened = set()
+_open_lock = threading.Lock()
+
+_fan_out_pool = None
+_fan_out_lock = threading.Lock()
+
+# Set once tasks.db is known to hold no named user's rows, so the check runs once per process
+_unsharded_checked = False
+
+
+def shard_path(username):
+    """Return the database file that holds a user's tasks."""
+    if SHARD_MODE == 'off' or not username:
+        return TASKS_DB
+    # crc32 rather than hash(), so every process routes a user to the same file
+    checksum = zlib.crc32(username.encode('utf-8'))
+    if SHARD_MODE == 'hash':
+        return os.path.join(SHARD_DIR, f"tasks_{checksum % SHARD_BUCKETS:03d}.db")
+    # Usernames are alphanumeric, but keep odd ones from clashing or escaping the directory
+    name = username if username.isalnum() else f"{re.sub(r'[^A-Za-z0-9]', '_', username)}_{checksum:08x}"
+    return os.path.join(SHARD_DIR, f"tasks_user_{name}.db")
+
+
+def open_shard(db_path):
+    """Create and migrate a shard the first time this process uses it; return its path."""
+    if db_path in _opened:
+        return db_path
+    with _open_lock:
+        if db_path not in _opened:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            apply_migrations(get_connection(db_path))
+            _opened.add(db_path)
+    return db_path
+
+
+def shard_for(username):
+    """Return the ready-to-use database file of a user's tasks."""
+    return open_shard(shard_path(username))
+
+
+def get_shard_repository(username):
+    """Return a TaskRepository on the user's shard."""
+    return TaskRepository(username, shard_for(username))
+
+
+def list_shards():
+    """Return every shard file on disk, tasks.db first."""
+    shards = [TASKS_DB]
+    if SHARD_MODE != 'off':
+        shards.extend(sorted(glob(os.path.join(SHARD_DIR, 'tasks_*.db'))))
+    return shards
+
+
+def fan_out(func):
+    """Call func(db_path) on every shard in parallel and return {db_path: result}."""
+    shards = [open_shard(db_path) for db_path in list_shards()]
+    if len(shards) == 1:
+        return {shards[0]: func(shards[0])}
+
+    global _fan_out_pool
+    with _fan_out_lock:
+        if _fan_out_pool is None:
+            _fan_out_pool = ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS, thread_name_prefix="shard-fan-out")
+    return dict(zip(shards, _fan_out_pool.map(func, shards)))
+
+
+def get_all_counts():
+    """Return get_counts() totals over every user on every shard, read from the replicas."""
+    totals = {'total': 0, 'by_status': {}, 'by_priority': {}, 'overdue': 0, 'due_soon': 0}
+    for counts in fan_out(lambda db_path: get_counts(None, replica_path(db_path))).values():
+        for key in ('total', 'overdue', 'due_soon'):
+            totals[key] += counts[key]
+        for key in ('by_status', 'by_priority'):
+            for value, count in counts[key].items():
+                totals[key][value] = totals[key].get(value, 0) + count
+    return totals
+
+
+def get_shard_stats():
+    """Return one row per shard with its file size and task counts, for the admin panel."""
+    def stats(db_path):
+        counts = get_counts(None, replica_path(db_path))
+        row = {'shard': db_path, 'size_mb': os.path.getsize(db_path) / (1024 * 1024) if os.path.exists(db_path) else 0.0,
+               'tasks': counts['total'], 'overdue': counts['overdue']}
+        row.update({status: counts['by_status'].get(status, 0) for status in STATUS_ORDER})
+        return row
+
+    return pd.DataFrame(list(fan_out(stats).values()))
+
+
+def get_all_tasks(filters=None):
+    """Return every task on every shard in board order, with the shard it lives on.
+
+    Task ids are only unique within a shard, so rows are identified by (shard, id).
+    Rows are read from the replicas, so they may lag the last write by a moment.
+    """
+    def load(db_path):
+        df = TaskRepository(None, replica_path(db_path)).get_tasks(filters)
+        return df.assign(shard=db_path) if not df.empty else df
+
+    frames = [df for df in fan_out(load).values() if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    tasks = pd.concat(frames, ignore_index=True)
+    return tasks.sort_values(
+        by=['status', 'sort_datetime', 'shard', 'id'],
+        key=lambda x: pd.Categorical(x, categories=STATUS_ORDER)
+        if x.name == 'status' else x
+    ).reset_index(drop=True)
+
+
+def get_unsharded_users():
+    """Return the users whose tasks or archived tasks are still in tasks.db although sharding is on.
+
+    Their boards would look empty, since with sharding on a user's rows are
+    only read from their own shard; migrate_to_shards() moves them. Shared
+    tasks (no username) are not read from tasks.db by any sharded board
+    either, so their presence is reported as None at the end of the list.
+    """
+    global _unsharded_checked
+    if SHARD_MODE == 'off' or _unsharded_checked:
+        return []
+    conn = get_connection(TASKS_DB)
+    rows = conn.execute('''SELECT NULLIF(username, '') FROM task_counters WHERE count > 0
+                           UNION SELECT username FROM tasks_archive''').fetchall()
+    users = sorted(row[0] for row in rows if row[0] is not None)
+    if any(row[0] is None for row in rows):
+        users.append(None)
+    _unsharded_checked = not users
+    return users
+
+
+def _read_user_rows(username):
+    """Read a user's tasks, labels, archive, change log, status events and snapshots from tasks.db."""
+    conn = get_connection(TASKS_DB)
+
+    def select(query):
+        cursor = conn.execute(query, (username,))
+        return [column[0] for column in cursor.description], cursor.fetchall()
+
+    return {
+        'tasks': select('SELECT * FROM tasks WHERE username = ? ORDER BY id'),
+        'archive': select('SELECT * FROM tasks_archive WHERE username = ? ORDER BY id'),
+        'labels': conn.execute('''SELECT tl.task_id, l.name FROM task_labels tl
+                                  JOIN labels l ON l.id = tl.label_id
+                                  JOIN tasks t ON t.id = tl.task_id
+                                  WHERE t.username = ?''', (username,)).fetchall(),
+        'changes': select('SELECT task_id, op, username, changed_at FROM task_changes WHERE username = ? ORDER BY version'),
+        'events': select('SELECT task_id, username, from_status, to_status, at FROM status_events WHERE username = ? ORDER BY id'),
+        'snapshots': select('SELECT username, snapshot_date, status, count FROM daily_status_snapshot WHERE username = ?'),
+    }
+
+
+def _insert_rows(c, table, rows, verb='INSERT'):
+    """Insert (columns, values) read by _read_user_rows() into a table."""
+    columns, values = rows
+    if values:
+        c.executemany(f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", values)
+
+
+def _import_user_op(c, username, rows):
+    """Copy a user's rows read from tasks.db into their shard (runs on the shard's writer thread).
+
+    Task ids are kept, so subtasks, labels and events still point at the
+    right rows. Returns the number of tasks copied, or 0 when an earlier
+    run already copied them.
+    """
+    # A task is recognised by its id, owner and creation time
+    copied = {}
+    for columns, values in (rows['tasks'], rows['archive']):
+        id_index, user_index, created_index = (columns.index(name) for name in ('id', 'username', 'created_date'))
+        copied.update((row[id_index], (row[user_index], row[created_index])) for row in values)
+    task_ids = list(copied)
+    found = {}
+    for start in range(0, len(task_ids), 500):
+        chunk = task_ids[start:start + 500]
+        placeholders = ', '.join('?' * len(chunk))
+        c.execute(f'''SELECT id, username, created_date FROM tasks WHERE id IN ({placeholders})
+                      UNION ALL SELECT id, username, created_date FROM tasks_archive WHERE id IN ({placeholders})''',
+                  chunk + chunk)
+        found.update((task_id, (owner, created)) for task_id, owner, created in c.fetchall())
+    # The copy is one transaction, so either every row is already there or none is
+    if found and found == copied:
+        return 0
+    if found:
+        clashes = sorted(task_id for task_id in found if found[task_id] != copied[task_id])
+        raise ValueError(f"task ids {clashes[:10]} are already used by other tasks on the shard")
+
+    # The insert triggers log a fresh 'insert' change and status event per task; the originals replace them
+    c.execute('SELECT COALESCE(MAX(version), 0) FROM task_changes')
+    last_version = c.fetchone()[0]
+    c.execute('SELECT COALESCE(MAX(id), 0) FROM status_events')
+    last_event_id = c.fetchone()[0]
+
+    # A subtask whose parent belongs to another user would break the shard's foreign key, so it
+    # comes over top-level; within the transaction a subtask may still come before its parent
+    columns, values = rows['tasks']
+    parent_index = columns.index('parent_id')
+    own_ids = {row[0] for row in values}
+    values = [row if row[parent_index] is None or row[parent_index] in own_ids
+              else row[:parent_index] + (None,) + row[parent_index + 1:] for row in values]
+    c.execute('PRAGMA defer_foreign_keys = ON')
+    _insert_rows(c, 'tasks', (columns, values))
+    c.execute('DELETE FROM task_changes WHERE version > ?', (last_version,))
+    c.execute('DELETE FROM status_events WHERE id > ?', (last_event_id,))
+
+    # Label ids differ between files, so labels are matched by name
+    for task_id, name in rows['labels']:
+        c.execute("INSERT OR IGNORE INTO labels (name) VALUES (?)", (name,))
+        c.execute("SELECT id FROM labels WHERE name = ?", (name,))
+        c.execute("INSERT OR IGNORE INTO task_labels (task_id, label_id) VALUES (?, ?)", (task_id, c.fetchone()[0]))
+
+    _insert_rows(c, 'tasks_archive', rows['archive'])
+    _insert_rows(c, 'task_changes', rows['changes'])
+    # New event ids sort after the shard's folded events, so the next flow metrics pass folds them
+    _insert_rows(c, 'status_events', rows['events'])
+    _insert_rows(c, 'daily_status_snapshot', rows['snapshots'], verb='INSERT OR REPLACE')
+    return len(rows['tasks'][1])
+
+
+def _drop_user_op(c, username):
+    """Delete a user's rows from tasks.db once their shard holds them (runs on the tasks.db writer thread)."""
+    c.execute('DELETE FROM tasks_archive WHERE username = ?', (username,))
+    # Other users' subtasks of these tasks stay behind top-level, rather than being cascaded away
+    # or, where parent_id has no ON DELETE CASCADE, failing the delete
+    c.execute('''UPDATE tasks SET parent_id = NULL
+                 WHERE username IS NOT ? AND parent_id IN (SELECT id FROM tasks WHERE username = ?)''',
+              (username, username))
+    # What is left under these tasks is the user's own, so one statement removes parents and
+    # children together, which even a NO ACTION key only checks once the statement ends;
+    # task_labels, search entries and counters follow through the delete triggers
+    c.execute('DELETE FROM tasks WHERE username = ?', (username,))
+    for table in ('task_changes', 'status_events', 'flow_task_state', 'flow_samples',
+                  'daily_status_snapshot', 'task_counters'):
+        c.execute(f'DELETE FROM {table} WHERE username = ?', (username,))
+
+
+def migrate_user(username):
+    """Move a user's rows from tasks.db to their shard and return the number of tasks moved.
+
+    The copy commits on the shard before the rows are deleted from tasks.db,
+    so a run cut short leaves the rows in both files; running it again
+    skips the copy and finishes the delete.
+    """
+    rows = _read_user_rows(username)
+    moved = run_write_to(shard_for(username), _import_user_op, username, rows)
+    run_write_to(TASKS_DB, _drop_user_op, username)
+    return moved or len(rows['tasks'][1])
+
+
+def _assign_shared_op(c, username):
+    """Give the shared tasks in tasks.db an owner (runs on the tasks.db writer thread)."""
+    c.execute('UPDATE tasks SET username = ? WHERE username IS NULL', (username,))
+    assigned = c.rowcount
+    for table in ('tasks_archive', 'status_events', 'flow_task_state', 'flow_samples'):
+        c.execute(f'UPDATE {table} SET username = ? WHERE username IS NULL', (username,))
+    return assigned
+
+
+def migrate_to_shards(shared_owner=None):
+    """Move every named user's rows from tasks.db to their shard; returns {username: tasks moved}.
+
+    Run it with the app stopped, after setting TASK_SHARDING. Shared tasks
+    are handed to shared_owner first and move with that user's rows;
+    without one they stay in tasks.db and the app keeps refusing to start.
+    A user whose task ids are already taken on their shard is reported
+    and left in tasks.db.
+    """
+    if SHARD_MODE == 'off':
+        raise ValueError("Set TASK_SHARDING to 'user' or 'hash' before migrating to shards")
+    if shared_owner:
+        run_write_to(TASKS_DB, _assign_shared_op, shared_owner)
+    conn = get_connection(TASKS_DB)
+    rows = conn.execute("""SELECT username FROM tasks WHERE username IS NOT NULL
+                           UNION SELECT username FROM tasks_archive WHERE username IS NOT NULL
+                           UNION SELECT username FROM task_changes WHERE username IS NOT NULL
+                           UNION SELECT username FROM status_events WHERE username IS NOT NULL
+                           UNION SELECT username FROM daily_status_snapshot WHERE username != ''""").fetchall()
+    moved = {}
+    for (username,) in rows:
+        try:
+            moved[username] = migrate_user(username)
+        except Exception as e:
+            print(f"Error migrating {username} to {shard_path(username)}: {str(e)}")
+    return moved
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move users' tasks out of tasks.db into their TASK_SHARDING shards.")
+    parser.add_argument('command', choices=['migrate'])
+    parser.add_argument('--shared-owner', metavar='USER',
+                        help="give tasks without a username to USER, so they move to USER's shard")
+    args = parser.parse_args()
+    init_db()
+    moved = migrate_to_shards(args.shared_owner)
+    for username, count in moved.items():
+        print(f"  {username}: {count} tasks moved to {shard_path(username)}")
+    print(f"Moved {sum(moved.values())} tasks of {len(moved)} users out of {TASKS_DB}")
+    shared = get_connection(TASKS_DB).execute('SELECT COUNT(*) FROM tasks WHERE username IS NULL').fetchone()[0]
+    if shared:
+        print(f"{shared} shared tasks are still in {TASKS_DB}; rerun with --shared-owner USER to move them")
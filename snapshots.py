@@ -0,0 +1,173 @@
+import json
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+
+from connection import get_connection, TASKS_DB
+from repository import init_db, _prune_task_changes_op, TASK_CHANGES_KEEP
+from sharding import shard_for, list_shards, open_shard, fan_out
+from replica import replica_path
+from write_queue import run_write_to, submit_write_to
+
+# Today's snapshot is refreshed at most this often (seconds), so the last
+# refresh of a day stands in for its end-of-day state
+SNAPSHOT_INTERVAL = 600
+
+# How far back backfill_snapshots() reconstructs history by default
+BACKFILL_DAYS = 365
+
+_last_snapshot = 0.0
+_backfilled = False
+_snapshot_lock = threading.Lock()
+
+
+def _take_snapshot_op(c, day):
+    """Replace the snapshot rows of a day with the current counts (runs on the writer thread)."""
+    c.execute('DELETE FROM daily_status_snapshot WHERE snapshot_date = ?', (day,))
+    # Live tasks come from the trigger-maintained counters; archived tasks keep counting as Done
+    c.execute('''INSERT INTO daily_status_snapshot (username, snapshot_date, status, count)
+                 SELECT username, ?, status, SUM(count) FROM (
+                     SELECT username, value AS status, count FROM task_counters
+                     WHERE kind = 'status' AND count > 0
+                     UNION ALL
+                     SELECT COALESCE(username, ''), COALESCE(status, ''), COUNT(*) FROM tasks_archive
+                     GROUP BY 1, 2)
+                 GROUP BY username, status''', (day,))
+    return c.rowcount
+
+
+def take_snapshot(day=None, db_path=TASKS_DB):
+    """Record every user's per-status task counts for a day (today by default) on one shard."""
+    day = (day or date.today()).isoformat()
+    try:
+        return run_write_to(db_path, _take_snapshot_op, day)
+    except Exception as e:
+        print(f"Error taking status snapshot: {str(e)}")
+        return 0
+
+
+def _backfill_op(c, start, end):
+    """Reconstruct snapshots for days in [start, end] that have none (runs on the writer thread)."""
+    c.execute('SELECT DISTINCT snapshot_date FROM daily_status_snapshot WHERE snapshot_date BETWEEN ? AND ?',
+              (start.isoformat(), end.isoformat()))
+    recorded = {row[0] for row in c.fetchall()}
+    missing = [(start + timedelta(days=offset)).isoformat() for offset in range((end - start).days + 1)]
+    missing = [day for day in missing if day not in recorded]
+    if not missing:
+        return 0
+
+    # Only the current status is known, so a task counts as To Do from its
+    # creation until its last update and with its current status afterwards
+    c.execute('''WITH days(day) AS (SELECT value FROM json_each(?)),
+                      all_tasks AS (SELECT username, status, created_date, last_updated FROM tasks
+                                    UNION ALL
+                                    SELECT username, status, created_date, last_updated FROM tasks_archive)
+                 INSERT INTO daily_status_snapshot (username, snapshot_date, status, count)
+                 SELECT COALESCE(t.username, ''), d.day,
+                        CASE WHEN date(t.last_updated) <= d.day THEN COALESCE(t.status, '') ELSE 'To Do' END,
+                        COUNT(*)
+                 FROM days d JOIN all_tasks t ON date(t.created_date) <= d.day
+                 GROUP BY 1, 2, 3''', (json.dumps(missing),))
+    return len(missing)
+
+
+def backfill_snapshots(days=BACKFILL_DAYS, db_path=TASKS_DB):
+    """Fill in snapshots of one shard for past days that have none, up to yesterday.
+
+    History is estimated from created_date and last_updated. Days that
+    already have snapshot rows are left alone, so running this again only
+    fills new gaps. Returns the number of days filled.
+    """
+    conn = get_connection(db_path)
+    first = conn.execute('''SELECT MIN(first_day) FROM (
+                                SELECT date(MIN(created_date)) AS first_day FROM tasks
+                                UNION ALL
+                                SELECT date(MIN(created_date)) FROM tasks_archive)''').fetchone()[0]
+    end = date.today() - timedelta(days=1)
+    start = end - timedelta(days=days - 1)
+    if first:
+        start = max(start, date.fromisoformat(first))
+    if not first or start > end:
+        return 0
+
+    try:
+        return run_write_to(db_path, _backfill_op, start, end)
+    except Exception as e:
+        print(f"Error backfilling status snapshots: {str(e)}")
+        return 0
+
+
+def _backfill_all_shards():
+    """Backfill the snapshots of every shard."""
+    for db_path in list_shards():
+        backfill_snapshots(db_path=open_shard(db_path))
+
+
+def refresh_snapshots():
+    """Queue today's snapshot of every shard (and a one-off backfill) unless one ran recently.
+
+    The same pass trims each shard's task_changes log to TASK_CHANGES_KEEP rows.
+
+    Called on every page load; the write is queued without waiting, so it
+    never delays the page.
+    """
+    global _last_snapshot, _backfilled
+    with _snapshot_lock:
+        now = time.monotonic()
+        if _last_snapshot and now - _last_snapshot < SNAPSHOT_INTERVAL:
+            return
+        _last_snapshot = now
+        backfill = not _backfilled
+        _backfilled = True
+
+    if backfill:
+        threading.Thread(target=_backfill_all_shards, name="snapshot-backfill", daemon=True).start()
+    for db_path in list_shards():
+        db_path = open_shard(db_path)
+        submit_write_to(db_path, _take_snapshot_op, date.today().isoformat())
+        submit_write_to(db_path, _prune_task_changes_op, TASK_CHANGES_KEEP)
+
+
+def _read_status_history(db_path, username, start):
+    """Read the summed snapshot rows of one shard since start from its replica."""
+    conn = get_connection(replica_path(db_path))
+    if username:
+        query = '''SELECT snapshot_date, status, SUM(count) AS count FROM daily_status_snapshot
+                   WHERE username IN (?, '') AND snapshot_date >= ?
+                   GROUP BY snapshot_date, status ORDER BY snapshot_date'''
+        params = (username, start)
+    else:
+        query = '''SELECT snapshot_date, status, SUM(count) AS count FROM daily_status_snapshot
+                   WHERE snapshot_date >= ?
+                   GROUP BY snapshot_date, status ORDER BY snapshot_date'''
+        params = (start,)
+    return pd.read_sql_query(query, conn, params=params)
+
+
+def get_status_history(username, days=30):
+    """Return (snapshot_date, status, count) rows for the tasks a user can see over the last days.
+
+    A username of None sums every shard.
+    """
+    start = (date.today() - timedelta(days=days - 1)).isoformat()
+    try:
+        if username:
+            return _read_status_history(shard_for(username), username, start)
+        frames = list(fan_out(lambda db_path: _read_status_history(db_path, None, start)).values())
+        history = pd.concat(frames, ignore_index=True)
+        return history.groupby(['snapshot_date', 'status'], as_index=False)['count'].sum()
+    except Exception as e:
+        print(f"Error reading status history: {str(e)}")
+        return pd.DataFrame(columns=['snapshot_date', 'status', 'count'])
+
+
+if __name__ == '__main__':
+    init_db()
+    for db_path in list_shards():
+        open_shard(db_path)
+        if '--backfill' in sys.argv:
+            print(f"{db_path}: backfilled {backfill_snapshots(db_path=db_path)} days")
+        print(f"{db_path}: recorded {take_snapshot(db_path=db_path)} snapshot rows for {date.today().isoformat()}")
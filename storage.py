@@ -0,0 +1,714 @@
+import os
+import re
+import shutil
+import sqlite3
+import threading
+from bisect import bisect_right
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+import connection
+import task_cache
+from connection import get_connection, TASKS_DB
+from migrations import POSITION_GAP
+from sharding import get_shard_repository, shard_for, get_unsharded_users
+from replica import replica_path, close_replicas
+from repository import (
+    TaskRepository, TaskFilter, TaskDelta, STATUS_ORDER, SEARCH_RANK_LIMIT, MIN_POSITION_GAP,
+    COLUMN_PAGE_SIZE, BULK_UPDATABLE_FIELDS, due_epoch, add_sort_datetime, _format_due
+)
+from utils import day_start_epoch
+from validation import split_labels
+
+# 'sqlite' keeps tasks in the tasks.db file, 'sqlite-memory' in a shared-cache
+# in-memory SQLite database and 'python' in plain dicts without any SQL
+STORAGE_BACKENDS = ('sqlite', 'sqlite-memory', 'python')
+
+# Backend behind database.py; set TASKS_STORAGE or call configure_storage() before the first query
+STORAGE_BACKEND = os.environ.get('TASKS_STORAGE', 'sqlite')
+
+# Columns of a task row, in tasks table order
+TASK_COLUMNS = ['id', 'title', 'description', 'status', 'priority', 'created_date', 'due_date', 'due_time',
+                'position', 'labels', 'parent_id', 'last_updated', 'username', 'due_at']
+
+# Column sort key of undated tasks, as in migrations.DUE_SORT_KEY
+UNDATED_SORT_KEY = 9223372036854775807
+
+# Per-field search weights, the column weights search_tasks() passes to bm25(). _search_score()
+# only sums them over fields with a prefix hit rather than computing bm25, so results are ranked
+# by which fields matched and may come back in a different order than on the SQLite backends
+SEARCH_WEIGHTS = {'title': 10.0, 'labels': 5.0, 'description': 1.0}
+
+_STATUS_RANK = {status: rank for rank, status in enumerate(STATUS_ORDER)}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def configure_storage(backend):
+    """Select the storage backend used by get_repository() in this process."""
+    global STORAGE_BACKEND
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    STORAGE_BACKEND = backend
+    if backend == 'sqlite-memory':
+        connection.use_memory_database(TASKS_DB)
+    else:
+        connection.use_file_database(TASKS_DB)
+
+
+def get_repository(username=None):
+    """Return a task repository for username on the configured backend.
+
+    On the sqlite backend the repository works on the user's shard, which
+    is tasks.db unless sharding is on.
+    """
+    if STORAGE_BACKEND == 'python':
+        return DictTaskRepository(username, get_dict_store())
+    if STORAGE_BACKEND == 'sqlite':
+        return get_shard_repository(username)
+    return TaskRepository(username)
+
+
+def get_report_repository(username=None):
+    """Return a read-only task repository for analytics and reports.
+
+    On the SQLite backends it reads the in-memory replica of the user's
+    database, so report queries never wait on the writer thread. The python
+    backend has no writer to wait on and reads its store directly.
+    """
+    if STORAGE_BACKEND == 'python':
+        return get_repository(username)
+    db_path = shard_for(username) if STORAGE_BACKEND == 'sqlite' else TASKS_DB
+    return TaskRepository(username, replica_path(db_path))
+
+
+def get_unmigrated_users():
+    """Return the users whose rows are still in tasks.db although the sqlite backend reads them from shards."""
+    if STORAGE_BACKEND != 'sqlite':
+        return []
+    return get_unsharded_users()
+
+
+def get_dict_store():
+    """Return the process-wide store of the python backend, creating it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DictTaskStore()
+        return _store
+
+
+def load_tasks_database(path):
+    """Replace the tasks of the configured backend with those of a tasks database file.
+
+    Load tests and benchmarks use this to start every backend from the same data.
+    """
+    task_cache.clear_cache()
+    close_replicas()
+    if STORAGE_BACKEND == 'sqlite':
+        connection.close_all_connections()
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(TASKS_DB + suffix):
+                os.remove(TASKS_DB + suffix)
+        shutil.copy(path, TASKS_DB)
+        return
+
+    source = sqlite3.connect(path)
+    try:
+        if STORAGE_BACKEND == 'python':
+            get_dict_store().load(source)
+        else:
+            source.backup(get_connection(TASKS_DB))
+    finally:
+        source.close()
+
+
+def _now():
+    """Return the current local time in the stored timestamp format."""
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _board_key(row):
+    """Board order: status column, then due_at with undated tasks last, then id."""
+    return (_STATUS_RANK.get(row['status'], len(STATUS_ORDER)), row['due_at'] is None, row['due_at'] or 0, row['id'])
+
+
+def _column_key(row):
+    """Keyset order of a Kanban column page: (sort_key, id)."""
+    return (UNDATED_SORT_KEY if row['due_at'] is None else row['due_at'], row['id'])
+
+
+def _search_score(row, words):
+    """Return the weighted field hits of a row for prefix-matched words, or 0 if a word matches nowhere."""
+    tokens = {field: re.findall(r'\w+', (row[field] or '').lower()) for field in SEARCH_WEIGHTS}
+    score = 0.0
+    for word in words:
+        hits = [weight for field, weight in SEARCH_WEIGHTS.items()
+                if any(token.startswith(word) for token in tokens[field])]
+        if not hits:
+            return 0.0
+        score += sum(hits)
+    return score
+
+
+def compile_filter(filters, today=None):
+    """Turn a TaskFilter into a row predicate with the same rules as build_filter_clause()."""
+    if filters is None:
+        return lambda row: True
+
+    today = today or date.today()
+    checks = []
+
+    # Words are prefix-matched like the FTS index; text without words is matched as a substring
+    words = [word.lower() for word in re.findall(r'\w+', filters.search)]
+    if words:
+        checks.append(lambda row: _search_score(row, words) > 0)
+    elif filters.search:
+        needle = filters.search.lower()
+        checks.append(lambda row: any(needle in (row[field] or '').lower()
+                                      for field in ('title', 'description', 'labels')))
+
+    if filters.statuses:
+        checks.append(lambda row: row['status'] in filters.statuses)
+    if filters.priorities:
+        checks.append(lambda row: row['priority'] in filters.priorities)
+    # Label names compare without case, like the NOCASE labels table
+    if filters.labels:
+        wanted = {label.casefold() for label in filters.labels}
+        checks.append(lambda row: any(name.casefold() in wanted for name in split_labels(row['labels'])))
+
+    # Date filters compare due_at epochs against local day boundaries; end is the first day left out
+    start = end = None
+    if filters.no_due_date:
+        checks.append(lambda row: row['due_at'] is None)
+    elif filters.start_date and filters.end_date:
+        start, end = filters.start_date, filters.end_date + timedelta(days=1)
+    elif filters.due == "Overdue":
+        before = day_start_epoch(today)
+        checks.append(lambda row: row['due_at'] is not None and row['due_at'] < before)
+    elif filters.due == "Due Today":
+        start, end = today, today + timedelta(days=1)
+    elif filters.due == "Due This Week":
+        start, end = today, today + timedelta(days=(7 - today.weekday()))
+    elif filters.due == "Due This Month":
+        next_month = today.replace(day=1) + timedelta(days=32)
+        start, end = today, next_month.replace(day=1)
+    if start is not None:
+        first, last = day_start_epoch(start), day_start_epoch(end)
+        checks.append(lambda row: row['due_at'] is not None and first <= row['due_at'] < last)
+
+    return lambda row: all(check(row) for check in checks)
+
+
+def _frame(rows, columns=TASK_COLUMNS):
+    """Build a task DataFrame from row dicts."""
+    return pd.DataFrame(rows, columns=columns)
+
+
+class DictTaskStore:
+    """All tasks of the python backend, held in plain Python structures.
+
+    rows maps task id to a dict with the tasks table columns. Every change
+    appends (task_id, username) to changes, under an increasing version,
+    like the task_changes log. label_names maps each casefolded label to
+    the first spelling stored, as the labels table does. Callers hold lock
+    for every access.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.rows = {}
+        self.next_id = 1
+        self.version = 0
+        self.change_versions = []
+        self.changes = []
+        self.label_names = {}
+
+    def load(self, conn):
+        """Replace every task with the tasks table of an SQLite connection."""
+        cursor = conn.execute(f"SELECT {', '.join(TASK_COLUMNS)} FROM tasks")
+        rows = {row[0]: dict(zip(TASK_COLUMNS, row)) for row in cursor}
+        label_names = {}
+        for (name,) in conn.execute("SELECT name FROM labels ORDER BY id"):
+            label_names.setdefault(name.casefold(), name)
+        with self.lock:
+            self.rows = rows
+            self.next_id = max(rows, default=0) + 1
+            self.version = 0
+            self.change_versions = []
+            self.changes = []
+            self.label_names = label_names
+            for task_id in sorted(rows):
+                self.register_labels(rows[task_id]['labels'])
+
+    def register_labels(self, labels):
+        """Remember the first spelling of each label in a comma-joined string."""
+        for name in split_labels(labels):
+            self.label_names.setdefault(name.casefold(), name)
+
+    def log_change(self, task_id, username):
+        """Record a change to a task as seen by username."""
+        self.version += 1
+        self.change_versions.append(self.version)
+        self.changes.append((task_id, username))
+
+    def insert(self, row):
+        """Add a task row under the next id and return the id."""
+        task_id = self.next_id
+        self.next_id += 1
+        row['id'] = task_id
+        self.rows[task_id] = row
+        self.register_labels(row.get('labels'))
+        self.log_change(task_id, row['username'])
+        return task_id
+
+    def update(self, task_id, **values):
+        """Change fields of a task, logging the change for its old and new owner."""
+        row = self.rows[task_id]
+        old_username = row['username']
+        row.update(values)
+        if 'labels' in values:
+            self.register_labels(values['labels'])
+        self.log_change(task_id, row['username'])
+        if old_username != row['username']:
+            self.log_change(task_id, old_username)
+
+    def delete(self, task_id):
+        """Remove a task."""
+        row = self.rows.pop(task_id)
+        self.log_change(task_id, row['username'])
+
+    def with_subtasks(self, task_ids):
+        """Return task_ids plus all their subtasks, deepest first, like repository._with_subtasks()."""
+        children = {}
+        for row in self.rows.values():
+            if row['parent_id'] is not None:
+                children.setdefault(row['parent_id'], []).append(row['id'])
+        depths = {}
+        level = [task_id for task_id in task_ids if task_id in self.rows]
+        depth = 0
+        while level and depth <= 100:
+            for task_id in level:
+                depths[task_id] = depth
+            level = [child for task_id in level for child in children.get(task_id, [])]
+            depth += 1
+        return sorted(depths, key=lambda task_id: (-depths[task_id], task_id))
+
+    def changes_since(self, version):
+        """Return the (task_id, username) changes logged after a version."""
+        return self.changes[bisect_right(self.change_versions, version):]
+
+
+class DictTaskRepository:
+    """TaskRepository with the same methods and results, backed by a DictTaskStore.
+
+    Reads scan the store's rows in Python and writes apply immediately,
+    without the write queue, so runs on this backend measure the app's own
+    overhead with no SQL engine or disk I/O. Snapshots, flow metrics and the
+    archive are SQL-only and keep reading tasks.db.
+    """
+
+    def __init__(self, username=None, store=None):
+        self.username = username
+        self.store = store or get_dict_store()
+
+    def _visible(self, row):
+        """Return True if this user may see (and change) a task."""
+        return not self.username or row['username'] is None or row['username'] == self.username
+
+    def _select(self, predicate=None):
+        """Return copies of the visible rows matching predicate, in id order."""
+        with self.store.lock:
+            return [dict(row) for row in self.store.rows.values()
+                    if self._visible(row) and (predicate is None or predicate(row))]
+
+    def _owned(self, task_ids):
+        """Return the visible rows among task_ids, by id."""
+        owned = {}
+        for task_id in task_ids:
+            row = self.store.rows.get(int(task_id))
+            if row is not None and self._visible(row):
+                owned[int(task_id)] = row
+        return owned
+
+    def _owner(self, row):
+        """Return the username a write leaves on a task: this user, or its current owner."""
+        return self.username if self.username else row['username']
+
+    def _next_position(self, status):
+        """Return a position after the last task in a status column."""
+        positions = [row['position'] for row in self.store.rows.values()
+                     if row['status'] == status and row['position'] is not None and self._visible(row)]
+        return max(positions) + POSITION_GAP if positions else POSITION_GAP
+
+    def _column_positions(self, status, exclude_id=None):
+        """Return the (id, position) pairs of a status column in board order."""
+        column = [row for row in self.store.rows.values()
+                  if row['status'] == status and row['id'] != exclude_id and self._visible(row)]
+        column.sort(key=lambda row: (row['position'] is not None, row['position'] or 0, row['id']))
+        return [(row['id'], row['position']) for row in column]
+
+    def _rebalance_column(self, status):
+        """Respace a status column so neighbouring positions are POSITION_GAP apart."""
+        for index, (task_id, _) in enumerate(self._column_positions(status)):
+            self.store.update(task_id, position=(index + 1) * POSITION_GAP)
+
+    def _query_tasks(self, filters):
+        """Return the visible tasks matching filters in board order."""
+        rows = self._select(compile_filter(filters))
+        rows.sort(key=_board_key)
+        df = _frame(rows)
+        if df.empty:
+            return df
+        return add_sort_datetime(df)
+
+    def add_task(self, title, description, status, priority, due_date, due_time, labels="", parent_id=None):
+        """Add a new task to the store."""
+        due_date_str, due_time_str = _format_due(due_date, due_time)
+        now = _now()
+        with self.store.lock:
+            task_id = self.store.insert({
+                'title': title, 'description': description, 'status': status, 'priority': priority,
+                'created_date': now, 'due_date': due_date_str, 'due_time': due_time_str,
+                'position': self._next_position(status), 'labels': labels, 'parent_id': parent_id,
+                'last_updated': now, 'username': self.username, 'due_at': due_epoch(due_date_str, due_time_str)
+            })
+        task_cache.bump_version(self.username)
+        return task_id
+
+    def get_tasks(self, filters=None):
+        """Retrieve tasks for this user, optionally narrowed by a TaskFilter."""
+        return self._query_tasks(filters)
+
+    def get_column_page(self, status, after_key=None, limit=COLUMN_PAGE_SIZE, filters=None):
+        """Return one page of a Kanban column and the key that starts the next page."""
+        def load():
+            matches = compile_filter(filters)
+            rows = self._select(lambda row: row['status'] == status and matches(row)
+                                and (after_key is None or _column_key(row) > tuple(after_key)))
+            rows.sort(key=_column_key)
+            next_key = _column_key(rows[limit - 1]) if len(rows) > limit else None
+            df = _frame(rows[:limit])
+            if df.empty:
+                return df, next_key
+            return add_sort_datetime(df), next_key
+
+        return task_cache.get_or_load(self.username, ('column_page', status, after_key, limit, filters, date.today()), load)
+
+    def get_counts(self):
+        """Return total, per-status, per-priority, overdue and due-soon counts; see repository.get_counts()."""
+        today = day_start_epoch(date.today())
+        soon = day_start_epoch(date.today() + timedelta(days=4))
+        with self.store.lock:
+            rows = [row for row in self.store.rows.values() if self._visible(row)]
+            by_status = Counter(row['status'] or None for row in rows)
+            by_priority = Counter(row['priority'] or None for row in rows)
+            overdue = sum(1 for row in rows if row['due_at'] is not None and row['due_at'] < today)
+            due_soon = sum(1 for row in rows if row['due_at'] is not None and today <= row['due_at'] < soon)
+        return {
+            'total': len(rows),
+            'by_status': dict(by_status),
+            'by_priority': dict(by_priority),
+            'overdue': overdue,
+            'due_soon': due_soon
+        }
+
+    def get_task_counts(self, filters=None):
+        """Return total, overdue and per-status counts for the filtered board."""
+        if filters is None or filters == TaskFilter():
+            return self.get_counts()
+
+        def load():
+            today = day_start_epoch(date.today())
+            rows = self._select(compile_filter(filters))
+            by_status = dict(Counter(row['status'] for row in rows))
+            overdue = sum(1 for row in rows if row['due_at'] is not None and row['due_at'] < today)
+            return {'total': len(rows), 'overdue': overdue, 'by_status': by_status}
+
+        return task_cache.get_or_load(self.username, ('task_counts', filters, date.today()), load)
+
+    def get_tasks_since(self, version, filters=None):
+        """Return the tasks inserted, updated or deleted after a change version."""
+        with self.store.lock:
+            current = self.store.version
+            if version <= 0:
+                return TaskDelta(current, self._query_tasks(filters), [], full_reload=True)
+
+            changes = self.store.changes_since(version)
+            touched = {task_id for task_id, _ in changes}
+            changed_ids = {task_id for task_id, username in changes
+                           if not self.username or username is None or username == self.username}
+            matches = compile_filter(filters)
+            rows = self._select(lambda row: row['id'] in touched and matches(row))
+
+        rows.sort(key=_board_key)
+        upserts = _frame(rows)
+        if not upserts.empty:
+            upserts = add_sort_datetime(upserts)
+        deleted_ids = sorted(changed_ids - {row['id'] for row in rows})
+        return TaskDelta(current, upserts, deleted_ids)
+
+    def search_tasks(self, query, limit=50):
+        """Prefix search over title, description and labels, best matches first."""
+        words = [word.lower() for word in re.findall(r'\w+', query or "")]
+        if not words:
+            return pd.DataFrame()
+
+        with self.store.lock:
+            matches = [(score, dict(row)) for row in self.store.rows.values() if self._visible(row)
+                       for score in [_search_score(row, words)] if score]
+
+        # Only rank when the match set is small, like the SQL backend
+        if len(matches) <= SEARCH_RANK_LIMIT:
+            matches.sort(key=lambda match: (-match[0], match[1]['id']))
+            rows = [dict(row, rank=-score) for score, row in matches[:limit]]
+        else:
+            matches.sort(key=lambda match: match[1]['id'], reverse=True)
+            rows = [dict(row, rank=None) for _, row in matches[:limit]]
+        return _frame(rows, TASK_COLUMNS + ['rank'])
+
+    def get_tasks_by_label(self, label):
+        """Retrieve this user's tasks that carry the given label."""
+        return self.get_tasks(TaskFilter(labels=(label,)))
+
+    def get_label_counts(self):
+        """Return a DataFrame of label names and task counts for this user."""
+        counts = Counter(name.casefold() for row in self._select() for name in split_labels(row['labels']))
+        with self.store.lock:
+            names = [(self.store.label_names.get(key, key), count) for key, count in counts.items()]
+        df = pd.DataFrame(names, columns=['label', 'count'])
+        return df.sort_values(['count', 'label'], ascending=[False, True],
+                              key=lambda column: column.str.casefold() if column.name == 'label' else column
+                              ).reset_index(drop=True)
+
+    def get_subtasks(self, task_id):
+        """Retrieve subtasks for a given parent task ID."""
+        return _frame(self._select(lambda row: row['parent_id'] == task_id))
+
+    def get_task_summaries(self, task_ids):
+        """Return {task_id: (title, status)} for the given tasks this user can see."""
+        with self.store.lock:
+            rows = [self.store.rows.get(int(task_id)) for task_id in task_ids]
+            return {row['id']: (row['title'], row['status']) for row in rows if row is not None and self._visible(row)}
+
+    def get_task_tree(self, root_ids=None, max_depth=None):
+        """Retrieve whole parent/child task hierarchies, ordered like the recursive SQL query."""
+        with self.store.lock:
+            visible = {task_id: dict(row) for task_id, row in self.store.rows.items() if self._visible(row)}
+            if root_ids is None:
+                roots = [task_id for task_id, row in visible.items()
+                         if row['parent_id'] is None or row['parent_id'] not in self.store.rows]
+            else:
+                roots = [int(root_id) for root_id in root_ids if int(root_id) in visible]
+                if not root_ids:
+                    return pd.DataFrame()
+
+        children = {}
+        for task_id in sorted(visible):
+            parent_id = visible[task_id]['parent_id']
+            if parent_id is not None:
+                children.setdefault(parent_id, []).append(task_id)
+
+        rows = []
+        pending = [(task_id, 0, str(task_id)) for task_id in roots]
+        while pending:
+            task_id, depth, path = pending.pop()
+            rows.append(dict(visible[task_id], depth=depth, path=path))
+            if max_depth is not None and depth >= max_depth:
+                continue
+            # Skip children already on the path, so a parent cycle cannot recurse forever
+            for child_id in children.get(task_id, []):
+                if f'/{child_id}/' not in f'/{path}/':
+                    pending.append((child_id, depth + 1, f'{path}/{child_id}'))
+
+        rows.sort(key=lambda row: row['path'])
+        return _frame(rows, TASK_COLUMNS + ['depth', 'path'])
+
+    def get_child_index(self):
+        """Return a cached {parent_id: [child_id, ...]} map of this user's tasks."""
+        def build():
+            tree = self.get_task_tree()
+            child_index = {}
+            if not tree.empty:
+                for task_id, parent_id in tree[['id', 'parent_id']].itertuples(index=False):
+                    if pd.notna(parent_id):
+                        child_index.setdefault(int(parent_id), []).append(int(task_id))
+            return child_index
+
+        return task_cache.get_or_load(self.username, 'child_index', build)
+
+    def update_task(self, task_id, title, description, status, priority, due_date, due_time, labels=""):
+        """Update an existing task in the store."""
+        due_date_str, due_time_str = _format_due(due_date, due_time)
+        with self.store.lock:
+            row = self._owned([task_id]).get(int(task_id))
+            if row is None:
+                return
+            shared = row['username'] is None
+            self.store.update(int(task_id), title=title, description=description, status=status, priority=priority,
+                              due_date=due_date_str, due_time=due_time_str,
+                              due_at=due_epoch(due_date_str, due_time_str), labels=labels,
+                              last_updated=_now(), username=self._owner(row))
+        task_cache.bump_version(self.username, shared)
+
+    def update_task_status(self, task_id, new_status):
+        """Move a task to the end of another status column."""
+        with self.store.lock:
+            row = self._owned([task_id]).get(int(task_id))
+            if row is None:
+                return
+            shared = row['username'] is None
+            self.store.update(int(task_id), status=new_status, position=self._next_position(new_status),
+                              last_updated=_now(), username=self._owner(row))
+        task_cache.bump_version(self.username, shared)
+
+    def delete_task(self, task_id):
+        """Delete a task and its subtasks from the store."""
+        with self.store.lock:
+            if int(task_id) not in self._owned([task_id]):
+                return
+            subtree = self.store.with_subtasks([int(task_id)])
+            shared = any(self.store.rows[task_id]['username'] is None for task_id in subtree)
+            for task_id in subtree:
+                self.store.delete(task_id)
+        task_cache.bump_version(self.username, shared)
+
+    def move_task_to_index(self, task_id, status, index):
+        """Move a task to a zero-based index within a status column, counted in position order.
+
+        As in TaskRepository, the index places the card among manual
+        positions that the due-date-ordered board does not show.
+        """
+        with self.store.lock:
+            row = self._owned([task_id]).get(int(task_id))
+            if row is None:
+                return False
+            shared = row['username'] is None
+            column = self._column_positions(status, exclude_id=int(task_id))
+            index = max(0, min(index, len(column)))
+
+            before = column[index - 1][1] if index > 0 else None
+            after = column[index][1] if index < len(column) else None
+            if before is not None and after is not None and after - before < 2:
+                # No integer left between the neighbours: renumber this column once
+                self._rebalance_column(status)
+                column = self._column_positions(status, exclude_id=int(task_id))
+                before = column[index - 1][1] if index > 0 else None
+                after = column[index][1] if index < len(column) else None
+
+            if before is None and after is None:
+                new_position = POSITION_GAP
+            elif before is None:
+                new_position = after - POSITION_GAP
+            elif after is None:
+                new_position = before + POSITION_GAP
+            else:
+                new_position = (before + after) // 2
+            self.store.update(int(task_id), status=status, position=new_position, last_updated=_now(),
+                              username=self._owner(row))
+
+            # Writes apply immediately here, so respace right away instead of in the background
+            if before is not None and after is not None and after - before <= MIN_POSITION_GAP:
+                self._rebalance_column(status)
+                shared = True
+        task_cache.bump_version(self.username, shared)
+        return True
+
+    def bulk_add_tasks(self, tasks):
+        """Insert many tasks and return their new IDs."""
+        if not tasks:
+            return []
+
+        now = _now()
+        task_ids = []
+        with self.store.lock:
+            next_positions = {}
+            for task in tasks:
+                status = task.get('status', 'To Do')
+                if status not in next_positions:
+                    next_positions[status] = self._next_position(status)
+                position = next_positions[status]
+                next_positions[status] += POSITION_GAP
+
+                due_date_str, due_time_str = _format_due(task.get('due_date'), task.get('due_time'))
+                task_ids.append(self.store.insert({
+                    'title': task['title'], 'description': task.get('description', ''), 'status': status,
+                    'priority': task.get('priority'), 'created_date': now, 'due_date': due_date_str,
+                    'due_time': due_time_str, 'position': position, 'labels': task.get('labels', ''),
+                    'parent_id': task.get('parent_id'), 'last_updated': now, 'username': self.username,
+                    'due_at': due_epoch(due_date_str, due_time_str)
+                }))
+        task_cache.bump_version(self.username)
+        return task_ids
+
+    def bulk_update_status(self, task_ids, new_status):
+        """Move many tasks to a new status column."""
+        with self.store.lock:
+            owned = self._owned(task_ids)
+            moving = [owned[task_id] for task_id in sorted(owned) if owned[task_id]['status'] != new_status]
+            if not moving:
+                return 0
+            shared = any(row['username'] is None for row in moving)
+
+            position = self._next_position(new_status)
+            now = _now()
+            for row in moving:
+                self.store.update(row['id'], status=new_status, position=position, last_updated=now,
+                                  username=self._owner(row))
+                position += POSITION_GAP
+        task_cache.bump_version(self.username, shared)
+        return len(moving)
+
+    def bulk_update_fields(self, task_ids, **fields):
+        """Set the same field values on many tasks."""
+        unknown = set(fields) - set(BULK_UPDATABLE_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot bulk update: {', '.join(sorted(unknown))}")
+        if not fields:
+            return 0
+
+        if 'due_date' in fields or 'due_time' in fields:
+            due_date_str, due_time_str = _format_due(fields.get('due_date'), fields.get('due_time'))
+            if 'due_date' in fields:
+                fields['due_date'] = due_date_str
+            if 'due_time' in fields:
+                fields['due_time'] = due_time_str
+
+        with self.store.lock:
+            owned = list(self._owned(task_ids).values())
+            if not owned:
+                return 0
+            shared = any(row['username'] is None for row in owned)
+
+            now = _now()
+            for row in owned:
+                values = dict(fields, last_updated=now, username=self._owner(row))
+                # Only one of due_date/due_time may have changed, so recompute due_at from the resulting pair
+                if 'due_date' in fields or 'due_time' in fields:
+                    values['due_at'] = due_epoch(values.get('due_date', row['due_date']),
+                                                 values.get('due_time', row['due_time']))
+                self.store.update(row['id'], **values)
+        task_cache.bump_version(self.username, shared)
+        return len(owned)
+
+    def bulk_delete(self, task_ids):
+        """Delete many tasks and their subtasks."""
+        with self.store.lock:
+            owned = list(self._owned(task_ids))
+            subtree = self.store.with_subtasks(owned)
+            shared = any(self.store.rows[task_id]['username'] is None for task_id in subtree)
+            for task_id in subtree:
+                self.store.delete(task_id)
+        task_cache.bump_version(self.username, shared)
+        return len(owned)
+
+    def get_cached_tasks(self, filters=None):
+        """Return this user's tasks from the process-wide cache."""
+        return task_cache.get_or_load(self.username, ('tasks', filters, date.today()), lambda: self._query_tasks(filters))
+
+
+# Apply the backend chosen through the environment
+configure_storage(STORAGE_BACKEND)
@@ -0,0 +1,152 @@
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import connection
+from connection import get_connection, TASKS_DB, USERS_DB
+
+# Commits and point reads timed by the latency probe
+PROBE_SAMPLES = 20
+
+# Values SQLite reports for named pragma settings
+_SYNCHRONOUS = {'OFF': 0, 'NORMAL': 1, 'FULL': 2, 'EXTRA': 3}
+_TEMP_STORE = {'DEFAULT': 0, 'FILE': 1, 'MEMORY': 2}
+_SWITCHES = {'OFF': 0, 'ON': 1}
+
+# Settings an in-memory database cannot take, so they are not reported as mismatches there
+_MEMORY_IGNORED = ('journal_mode', 'mmap_size')
+
+_last_report = None
+_report_lock = threading.Lock()
+
+
+def _normalize(pragma, value):
+    """Return a configured pragma value in the form SQLite reports it."""
+    if isinstance(value, str):
+        name = value.upper()
+        if pragma == 'synchronous':
+            return _SYNCHRONOUS.get(name, value)
+        if pragma == 'temp_store':
+            return _TEMP_STORE.get(name, value)
+        if pragma == 'foreign_keys':
+            return _SWITCHES.get(name, value)
+        return value.lower()
+    return value
+
+
+def get_effective_settings(db_path=TASKS_DB):
+    """Return one row per profile pragma with the value asked for and the value SQLite reports."""
+    conn = get_connection(db_path)
+    in_memory = connection.is_memory_database(db_path)
+    rows = []
+    for pragma, value in connection.CONNECTION_PRAGMAS.items():
+        effective = conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+        expected = _normalize(pragma, value)
+        rows.append({'database': db_path, 'pragma': pragma, 'expected': expected, 'effective': effective,
+                     'ok': effective == expected or (in_memory and pragma in _MEMORY_IGNORED)})
+    return rows
+
+
+def get_parent_delete_action(db_path=TASKS_DB):
+    """Return the ON DELETE action of tasks.parent_id ('CASCADE', 'NO ACTION', ...), or None without a foreign key."""
+    for row in get_connection(db_path).execute("PRAGMA foreign_key_list(tasks)").fetchall():
+        if row[3] == 'parent_id':
+            return row[6]
+    return None
+
+
+def probe_latency(db_path=TASKS_DB, samples=PROBE_SAMPLES):
+    """Time single-row commits and point reads in a scratch file next to db_path.
+
+    The scratch database gets the active profile's pragmas, so the numbers
+    show what the disk and profile cost a small write, without touching
+    the real data. Returns median and max times in ms.
+    """
+    directory = os.path.dirname(os.path.abspath(db_path))
+    fd, probe_path = tempfile.mkstemp(prefix='.storage_probe_', suffix='.db', dir=directory)
+    os.close(fd)
+    conn = sqlite3.connect(probe_path)
+    try:
+        connection.apply_pragmas(conn)
+        conn.execute('CREATE TABLE probe (id INTEGER PRIMARY KEY, payload TEXT)')
+        conn.commit()
+
+        writes = []
+        for i in range(samples):
+            start = time.perf_counter()
+            conn.execute('INSERT INTO probe (id, payload) VALUES (?, ?)', (i, 'x' * 200))
+            conn.commit()
+            writes.append(1000 * (time.perf_counter() - start))
+
+        reads = []
+        for i in range(samples):
+            start = time.perf_counter()
+            conn.execute('SELECT payload FROM probe WHERE id = ?', (i,)).fetchone()
+            reads.append(1000 * (time.perf_counter() - start))
+    finally:
+        conn.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(probe_path + suffix):
+                os.remove(probe_path + suffix)
+
+    return {'database': db_path, 'write_p50_ms': statistics.median(writes), 'write_max_ms': max(writes),
+            'read_p50_ms': statistics.median(reads), 'read_max_ms': max(reads)}
+
+
+def get_storage_health(db_paths=(TASKS_DB, USERS_DB)):
+    """Return the active profile, the effective settings and a latency probe of each database."""
+    report = {'profile': connection.STORAGE_PROFILE, 'sqlite_version': sqlite3.sqlite_version,
+              'settings': [], 'probes': [], 'parent_on_delete': get_parent_delete_action(TASKS_DB)}
+    for db_path in db_paths:
+        report['settings'].extend(get_effective_settings(db_path))
+        try:
+            report['probes'].append(probe_latency(db_path))
+        except Exception as e:
+            print(f"Error probing storage latency: {str(e)}")
+    return report
+
+
+def format_storage_health(report):
+    """Return a storage health report as printable lines."""
+    lines = [f"Storage profile '{report['profile']}' on SQLite {report['sqlite_version']}"]
+    for row in report['settings']:
+        flag = '' if row['ok'] else f" (asked for {row['expected']})"
+        lines.append(f"  {row['database']}: {row['pragma']} = {row['effective']}{flag}")
+    for probe in report['probes']:
+        lines.append(f"  {probe['database']}: commit p50 {probe['write_p50_ms']:.2f} ms "
+                     f"(max {probe['write_max_ms']:.2f}), read p50 {probe['read_p50_ms']:.3f} ms")
+    if report['parent_on_delete'] != 'CASCADE':
+        lines.append(f"  tasks.parent_id ON DELETE: {report['parent_on_delete'] or 'no foreign key'}; "
+                     "subtasks are deleted explicitly")
+    return lines
+
+
+def report_storage_health():
+    """Print the storage health report once per process and return it."""
+    global _last_report
+    with _report_lock:
+        if _last_report is None:
+            try:
+                _last_report = get_storage_health()
+            except Exception as e:
+                print(f"Error checking storage health: {str(e)}")
+                return None
+            for line in format_storage_health(_last_report):
+                print(line)
+        return _last_report
+
+
+def get_last_health_report():
+    """Return the report printed at startup, or None before it ran."""
+    return _last_report
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        connection.configure_profile(sys.argv[1])
+    for line in format_storage_health(get_storage_health()):
+        print(line)
@@ -0,0 +1,134 @@
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Upper bounds for the process-wide cache; least recently used entries go first
+MAX_CACHE_ENTRIES = 512
+MAX_CACHE_BYTES = 128 * 1024 * 1024
+
+# Cached values: {(username, key): (version, value, size_bytes)}, oldest first
+_entries = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_bytes = 0
+
+# Data versions, bumped by every write that changes what a user can see.
+# Tasks without a username are visible to everyone, so they get their own
+# version, and readers without a username see every task.
+_user_versions = {}
+_shared_version = 0
+_global_version = 0
+
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def get_version(username):
+    """Return the current data version for a user's view of the tasks."""
+    with _cache_lock:
+        if username is None:
+            return _global_version
+        return (_shared_version, _user_versions.get(username, 0))
+
+
+def bump_version(username, shared=False):
+    """Invalidate a user's cached reads after a write.
+
+    Pass shared=True when the write touched tasks without a username, which
+    every user can see. Writes without a username invalidate everyone.
+    """
+    global _shared_version, _global_version
+    with _cache_lock:
+        _global_version += 1
+        if username is not None:
+            _user_versions[username] = _user_versions.get(username, 0) + 1
+        if shared or username is None:
+            _shared_version += 1
+
+
+def _estimate_size(value):
+    """Return an approximate in-memory size of a cached value in bytes."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def _copy_out(value):
+    """Copy DataFrames (also inside tuples) so callers cannot modify cached values."""
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(_copy_out(item) for item in value)
+    return value
+
+
+def _evict(max_entries, max_bytes):
+    """Drop least recently used entries until the cache fits its limits (lock held)."""
+    global _cache_bytes
+    while _entries and (len(_entries) > max_entries or _cache_bytes > max_bytes):
+        _, (_, _, size) = _entries.popitem(last=False)
+        _cache_bytes -= size
+        _stats['evictions'] += 1
+
+
+def get_or_load(username, key, loader):
+    """Return the cached value for (username, key), calling loader() on a miss.
+
+    Entries are tagged with the version that was current before loading, so
+    a write that lands while loader() runs makes the new entry stale at once.
+    DataFrames are copied on the way out so callers cannot modify the cache.
+    """
+    global _cache_bytes
+    version = get_version(username)
+    cache_key = (username, key)
+
+    with _cache_lock:
+        entry = _entries.get(cache_key)
+        hit = entry is not None and entry[0] == version
+        if hit:
+            _entries.move_to_end(cache_key)
+            _stats['hits'] += 1
+        else:
+            _stats['misses'] += 1
+
+    if hit:
+        return _copy_out(entry[1])
+
+    value = loader()
+    size = _estimate_size(value)
+
+    # A single value larger than the whole budget is returned but not kept
+    if size <= MAX_CACHE_BYTES:
+        with _cache_lock:
+            old = _entries.pop(cache_key, None)
+            if old is not None:
+                _cache_bytes -= old[2]
+            _entries[cache_key] = (version, value, size)
+            _cache_bytes += size
+            _evict(MAX_CACHE_ENTRIES, MAX_CACHE_BYTES)
+
+    return _copy_out(value)
+
+
+def clear_cache():
+    """Remove every cached entry (versions are kept)."""
+    global _cache_bytes
+    with _cache_lock:
+        _entries.clear()
+        _cache_bytes = 0
+
+
+def get_cache_stats():
+    """Return hit/miss counters and the current size of the cache."""
+    with _cache_lock:
+        return {
+            'hits': _stats['hits'],
+            'misses': _stats['misses'],
+            'evictions': _stats['evictions'],
+            'entries': len(_entries),
+            'bytes': _cache_bytes,
+        }
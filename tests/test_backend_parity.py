@@ -0,0 +1,136 @@
+"""Run the same reads and writes on every storage backend and compare the results.
+
+The sqlite backend is the reference; the in-memory SQLite and plain-python
+backends must return the same rows, counts and pages for one shared dataset.
+Run from the repository root:
+
+    python -m pytest tests
+"""
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+import connection
+import storage
+import task_cache
+from repository import TaskFilter, init_db, apply_task_delta
+from generate_dataset import generate_dataset
+
+# Small enough to run in a few seconds, large enough for several column pages
+DATASET_TASKS = 3000
+DATASET_USERS = 5
+
+# The user whose board is compared; other users' and shared tasks exercise the owner filter
+USERNAME = 'user1'
+
+FILTERS = [
+    None,
+    TaskFilter(search='rep'),
+    TaskFilter(statuses=('Done',), priorities=('High',)),
+    TaskFilter(labels=('bug', 'docs')),
+    TaskFilter(due='Overdue'),
+    TaskFilter(due='Due This Month'),
+    TaskFilter(no_due_date=True),
+    TaskFilter(start_date=date.today() - timedelta(days=30), end_date=date.today()),
+]
+
+# Timestamps set at write time differ between runs, so they are left out of the comparison
+VOLATILE_COLUMNS = ('created_date', 'last_updated', 'sort_datetime')
+
+
+def _rows(df):
+    """Return a DataFrame as comparable rows, without the write-time columns."""
+    df = df.drop(columns=[column for column in VOLATILE_COLUMNS if column in df]).reset_index(drop=True)
+    return list(df.columns), df.astype(str).values.tolist()
+
+
+def _run_operations(repo):
+    """Run the compared reads and writes on one repository and return their results by name."""
+    results = {}
+    for i, filters in enumerate(FILTERS):
+        results[f'tasks[{i}]'] = _rows(repo.get_tasks(filters))
+        results[f'task_counts[{i}]'] = repo.get_task_counts(filters)
+        page, next_key = repo.get_column_page('Done', None, 20, filters)
+        results[f'column_page[{i}]'] = _rows(page)
+        if next_key:
+            results[f'column_page_2[{i}]'] = _rows(repo.get_column_page('Done', next_key, 20, filters)[0])
+
+    results['counts'] = repo.get_counts()
+    results['search'] = sorted(repo.search_tasks('fix rep', 5000)['id'].tolist())
+    results['label_counts'] = _rows(repo.get_label_counts())
+    tree = repo.get_task_tree()
+    results['task_tree'] = _rows(tree)
+    results['child_index'] = repo.get_child_index()
+    results['subtasks'] = _rows(repo.get_subtasks(int(tree['parent_id'].dropna().iloc[0])))
+
+    # Writes, then the board and the change-log delta a client would apply
+    first = repo.get_tasks_since(0)
+    ids = repo.get_tasks()['id'].tolist()
+    repo.update_task_status(ids[0], 'Blocked')
+    repo.delete_task(ids[1])
+    repo.move_task_to_index(ids[2], 'Done', 3)
+    repo.bulk_add_tasks([{'title': 'bulk added', 'status': 'To Do', 'due_date': '2026-11-01',
+                          'due_time': '10:00', 'labels': 'x, y'}])
+    repo.bulk_update_fields(ids[3:6], priority='Low', due_date='2026-12-01')
+    repo.bulk_update_status(ids[6:9], 'In Progress')
+    repo.bulk_delete(ids[9:11])
+    repo.update_task(ids[12], 'Edited', 'Edited description', 'Done', 'High', '2026-10-30', '08:00', 'docs')
+
+    # Labels differing only by case are one label, spelled as first stored
+    repo.bulk_add_tasks([{'title': 'upper label', 'status': 'To Do', 'labels': 'API, Docs'},
+                         {'title': 'lower label', 'status': 'To Do', 'labels': 'api'}])
+    results['label_counts_mixed_case'] = _rows(repo.get_label_counts())
+    results['tasks_by_label'] = _rows(repo.get_tasks_by_label('Api'))
+
+    results['delta'] = _rows(apply_task_delta(first.upserts, repo.get_tasks_since(first.version)))
+    results['tasks_after_writes'] = _rows(repo.get_tasks())
+    results['counts_after_writes'] = repo.get_counts()
+    results['column_page_after_writes'] = _rows(repo.get_column_page('Done', None, 50)[0])
+    return results
+
+
+@pytest.fixture(scope='module')
+def results(tmp_path_factory):
+    """Load one generated dataset into every backend and collect the results of each."""
+    work_dir = tmp_path_factory.mktemp('parity')
+    dataset = str(work_dir / 'dataset.db')
+    generate_dataset(dataset, DATASET_TASKS, DATASET_USERS, seed=7)
+
+    cwd, backend = os.getcwd(), storage.STORAGE_BACKEND
+    os.chdir(work_dir)
+    try:
+        by_backend = {}
+        for name in storage.STORAGE_BACKENDS:
+            storage.configure_storage(name)
+            storage.load_tasks_database(dataset)
+            init_db()
+            by_backend[name] = _run_operations(storage.get_repository(USERNAME))
+            task_cache.clear_cache()
+            connection.close_all_connections()
+        yield by_backend
+    finally:
+        storage.configure_storage(backend)
+        os.chdir(cwd)
+
+
+@pytest.mark.parametrize('backend', ['sqlite-memory', 'python'])
+def test_backend_matches_sqlite(results, backend):
+    """Every operation returns on the backend what it returns on the sqlite backend."""
+    expected, actual = results['sqlite'], results[backend]
+    assert set(actual) == set(expected)
+    mismatches = [name for name in expected if actual[name] != expected[name]]
+    assert not mismatches, f"{backend} differs from sqlite in: {', '.join(mismatches)}"
+
+
+def test_operations_see_data(results):
+    """The dataset gives every compared read something to return."""
+    reference = results['sqlite']
+    assert reference['counts']['total'] > 0
+    assert reference['search']
+    assert all(rows for _, rows in (reference[f'tasks[{i}]'] for i in range(len(FILTERS))))
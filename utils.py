@@ -1,9 +1,25 @@
 import pandas as pd
 import calendar
+import time
 from datetime import datetime, date, timedelta
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+def day_start_epoch(day):
+    """Return the UTC epoch seconds of local midnight at the start of a date."""
+    return int(datetime.combine(day, datetime.min.time()).timestamp())
+
+def epochs_to_local(epochs):
+    """Convert a series of UTC epoch seconds (NaN for none) to naive local datetimes.
+    
+    The UTC offset is looked up once per distinct hour, since daylight saving
+    changes fall on the hour, instead of converting every value through tzlocal.
+    """
+    epochs = pd.to_numeric(epochs, errors='coerce')
+    hours = epochs // 3600
+    offsets = {hour: time.localtime(hour * 3600).tm_gmtoff for hour in hours.dropna().unique()}
+    return pd.to_datetime(epochs + hours.map(offsets), unit='s')
+
 def get_status_color(status):
     """Return color code for a given task status."""
     return {
@@ -22,13 +38,18 @@ def get_priority_color(priority):
         "Low": "#6b7280"  # Gray
     }.get(priority, "#6b7280")
 
-def calculate_due_status(due_date_str, due_time_str=None):
-    """Calculate and format the due status of a task."""
-    if pd.isna(due_date_str):
+def calculate_due_status(due_at, due_time_str=None):
+    """Calculate and format the due status of a task from its due_at epoch.
+    
+    due_time_str only decides whether a time of day is shown; all date
+    arithmetic uses due_at.
+    """
+    if due_at is None or pd.isna(due_at):
         return {"color": "#6b7280", "text": "", "days": None}
         
     try:
-        due_date = datetime.strptime(due_date_str, '%Y-%m-%d').date() if isinstance(due_date_str, str) else due_date_str
+        due_datetime = datetime.fromtimestamp(int(due_at))
+        due_date = due_datetime.date()
         today = date.today()
         now = datetime.now()
         
@@ -36,8 +57,7 @@ def calculate_due_status(due_date_str, due_time_str=None):
         formatted_date = due_date.strftime('%d %b %Y')  # Format as "19 Apr 2025"
         
         if due_time_str and pd.notna(due_time_str):
-            formatted_time = due_time_str
-            due_datetime = datetime.combine(due_date, datetime.strptime(due_time_str, '%H:%M').time())
+            formatted_time = due_datetime.strftime('%H:%M')
             time_diff = due_datetime - now
             
             if time_diff.total_seconds() < 0:
@@ -66,14 +86,14 @@ def calculate_due_status(due_date_str, due_time_str=None):
             else:
                 return {"color": "#10b981", "text": f"Due in {days_until_due} days", "days": days_until_due, "display": formatted_date}
     except:
-        return {"color": "#6b7280", "text": "", "days": None, "display": due_date_str}
+        return {"color": "#6b7280", "text": "", "days": None, "display": ""}
 
-def get_urgency_class(due_date_str, due_time_str=None):
-    """Return CSS class based on task urgency."""
-    if not due_date_str:
+def get_urgency_class(due_at):
+    """Return CSS class based on the urgency of a due_at epoch."""
+    if due_at is None or pd.isna(due_at):
         return ""
     try:
-        due_date = datetime.strptime(due_date_str, '%Y-%m-%d').date()
+        due_date = date.fromtimestamp(int(due_at))
         today = date.today()
         days_until = (due_date - today).days
         
@@ -101,18 +121,16 @@ def create_calendar_view(tasks_df, year, month):
         specs=[[{"type": "table"}] * 7] + [[{"type": "scatter"}] * 7] * len(cal)
     )
     
-    # Convert all due dates to datetime if not already
-    if not pd.api.types.is_datetime64_dtype(tasks_df['due_date']):
-        tasks_df['due_date'] = pd.to_datetime(tasks_df['due_date'], errors='coerce')
-    
-    # Filter for the specific month and year
+    # Select the month by its due_at epoch range instead of parsing due_date strings
+    month_start = date(year, month, 1)
+    next_month = (month_start + timedelta(days=32)).replace(day=1)
     month_tasks = tasks_df[
-        (tasks_df['due_date'].dt.month == month) &
-        (tasks_df['due_date'].dt.year == year)
+        (tasks_df['due_at'] >= day_start_epoch(month_start)) &
+        (tasks_df['due_at'] < day_start_epoch(next_month))
     ].copy()
     
-    # Ensure we're working with task dates correctly
-    month_tasks['day'] = month_tasks['due_date'].dt.day
+    # Local day of the month of each task
+    month_tasks['day'] = [date.fromtimestamp(int(due_at)).day for due_at in month_tasks['due_at']]
     
     # For each day in the calendar
     for week_idx, week in enumerate(cal):
@@ -81,4 +81,20 @@ def validate_labels(labels):
         if len(label) <= 20 and re.match(r'^[a-zA-Z0-9\-_]+$', label):
             valid_labels.append(label)
     
-    return ','.join(valid_labels) 
\ No newline at end of file
+    return ','.join(valid_labels)
+
+def split_labels(labels):
+    """Split a comma-joined label string into unique, trimmed label names."""
+    if not labels:
+        return []
+    
+    # Keep the first spelling of labels that differ only by case
+    seen = set()
+    label_list = []
+    for label in labels.split(','):
+        label = label.strip()
+        if label and label.lower() not in seen:
+            seen.add(label.lower())
+            label_list.append(label)
+    
+    return label_list
\ No newline at end of file
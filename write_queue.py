@@ -0,0 +1,220 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from connection import get_connection, TASKS_DB
+
+# Extra time, in seconds, the writer waits for more requests when others were
+# already queued, so concurrent writers share one commit. Only applies under
+# contention: a lone request is committed at once. 0 turns the window off.
+WRITE_BATCH_WINDOW = float(os.environ.get('WRITE_BATCH_WINDOW_MS', 2)) / 1000
+
+# Most write requests committed in one transaction
+MAX_WRITE_BATCH = 200
+
+# Commit latencies kept for the percentile in get_write_stats()
+LATENCY_SAMPLES = 1000
+
+# One queue and writer thread per database file: {db_path: queue} and {db_path: thread}
+_queues = {}
+_writers = {}
+_writer_lock = threading.Lock()
+
+# Callbacks registered by the op that is currently running on the writer
+_op_state = threading.local()
+
+_stats_lock = threading.Lock()
+_stats = {'batches': 0, 'writes': 0, 'failed': 0, 'max_batch': 0}
+_commit_latencies = deque(maxlen=LATENCY_SAMPLES)
+
+
+class _WriteRequest:
+    """A queued write: op(cursor, *args, **kwargs) and the future for its result."""
+
+    __slots__ = ('op', 'args', 'kwargs', 'future', 'callbacks', 'result')
+
+    def __init__(self, op, args, kwargs):
+        self.op = op
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.callbacks = []
+        self.result = None
+
+
+def after_commit(callback):
+    """Run callback once the transaction of the current write op has committed.
+
+    Ops use this for side effects such as cache invalidation, which must not
+    happen if the op is rolled back.
+    """
+    callbacks = getattr(_op_state, 'callbacks', None)
+    if callbacks is None:
+        raise RuntimeError("after_commit() called outside a write op")
+    callbacks.append(callback)
+
+
+def _run_op(c, request, savepoint='write_op'):
+    """Run one op inside its own savepoint so a failure only undoes that op."""
+    c.execute(f'SAVEPOINT {savepoint}')
+    outer_callbacks = getattr(_op_state, 'callbacks', None)
+    _op_state.callbacks = request.callbacks
+    try:
+        request.result = request.op(c, *request.args, **request.kwargs)
+        c.execute(f'RELEASE {savepoint}')
+        return True
+    except Exception as e:
+        c.execute(f'ROLLBACK TO {savepoint}')
+        c.execute(f'RELEASE {savepoint}')
+        request.callbacks.clear()
+        request.future.set_exception(e)
+        return False
+    finally:
+        _op_state.callbacks = outer_callbacks
+
+
+def _commit_batch(db_path, batch):
+    """Apply a batch of write requests in one transaction and resolve their futures."""
+    conn = None
+    start = time.perf_counter()
+
+    # Opening the connection is inside the try, so a database that cannot be opened fails the batch, not the thread
+    try:
+        conn = get_connection(db_path)
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        applied = [request for request in batch if _run_op(c, request)]
+        conn.commit()
+    except Exception as e:
+        if conn is not None:
+            conn.rollback()
+        print(f"Error committing write batch: {str(e)}")
+        applied = []
+        for request in batch:
+            if not request.future.done():
+                request.future.set_exception(e)
+
+    latency = time.perf_counter() - start
+    with _stats_lock:
+        _stats['batches'] += 1
+        _stats['writes'] += len(applied)
+        _stats['failed'] += len(batch) - len(applied)
+        _stats['max_batch'] = max(_stats['max_batch'], len(batch))
+        _commit_latencies.append(latency)
+
+    for request in applied:
+        for callback in request.callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in after-commit callback: {str(e)}")
+        request.future.set_result(request.result)
+
+
+def _writer_loop(db_path, requests):
+    """Take requests off a database's queue and commit them in batches, forever."""
+    # Lets submit_write_to() recognise ops that write to this thread's own database
+    _op_state.db_path = db_path
+    while True:
+        batch = [requests.get()]
+
+        # Group commit: take everything queued while the last batch was committing
+        while len(batch) < MAX_WRITE_BATCH:
+            try:
+                batch.append(requests.get_nowait())
+            except queue.Empty:
+                break
+
+        # Under contention, also gather what arrives during the batch window
+        if len(batch) > 1:
+            deadline = time.perf_counter() + WRITE_BATCH_WINDOW
+            while len(batch) < MAX_WRITE_BATCH:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+        _commit_batch(db_path, batch)
+
+
+def _ensure_writer(db_path):
+    """Start the writer thread of a database on first use and return its queue."""
+    with _writer_lock:
+        requests = _queues.setdefault(db_path, queue.Queue())
+        writer = _writers.get(db_path)
+        if writer is None or not writer.is_alive():
+            name = "task-writer" if db_path == TASKS_DB else f"task-writer:{db_path}"
+            writer = _writers[db_path] = threading.Thread(target=_writer_loop, args=(db_path, requests),
+                                                          name=name, daemon=True)
+            writer.start()
+        return requests
+
+
+def submit_write_to(db_path, op, *args, **kwargs):
+    """Queue op(cursor, *args, **kwargs) for the writer thread of db_path and return a Future.
+
+    The op runs inside the writer's transaction and must not commit or roll
+    back itself. The future resolves once the batch containing it commits.
+    Each database file has its own writer, so writes to one never wait for
+    another.
+    """
+    request = _WriteRequest(op, args, kwargs)
+
+    # An op that submits another write to the same database would wait on
+    # itself; run it inline inside the current transaction instead
+    outer_callbacks = getattr(_op_state, 'callbacks', None)
+    if outer_callbacks is not None and getattr(_op_state, 'db_path', None) == db_path:
+        c = get_connection(db_path).cursor()
+        if _run_op(c, request, savepoint='nested_write_op'):
+            outer_callbacks.extend(request.callbacks)
+            request.future.set_result(request.result)
+        return request.future
+
+    _ensure_writer(db_path).put(request)
+    return request.future
+
+
+def run_write_to(db_path, op, *args, **kwargs):
+    """Queue a write op for db_path and wait for its result (re-raising its exception)."""
+    return submit_write_to(db_path, op, *args, **kwargs).result()
+
+
+def submit_write(op, *args, **kwargs):
+    """Queue a write op for the tasks database; see submit_write_to()."""
+    return submit_write_to(TASKS_DB, op, *args, **kwargs)
+
+
+def run_write(op, *args, **kwargs):
+    """Queue a write op for the tasks database and wait for its result (re-raising its exception)."""
+    return run_write_to(TASKS_DB, op, *args, **kwargs)
+
+
+def get_write_stats():
+    """Return queue depth, batch sizes and commit latency over all writers."""
+    with _stats_lock:
+        latencies = sorted(_commit_latencies)
+        batches = _stats['batches']
+        return {
+            'queue_depth': sum(requests.qsize() for requests in list(_queues.values())),
+            'batches': batches,
+            'writes': _stats['writes'],
+            'failed': _stats['failed'],
+            'avg_batch': (_stats['writes'] + _stats['failed']) / batches if batches else 0,
+            'max_batch': _stats['max_batch'],
+            'avg_commit_ms': 1000 * sum(latencies) / len(latencies) if latencies else 0,
+            'p95_commit_ms': 1000 * latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0,
+        }
+
+
+def reset_write_stats():
+    """Reset the writer counters."""
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
+        _commit_latencies.clear()